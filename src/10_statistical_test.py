@@ -7,6 +7,7 @@ import xml.etree.ElementTree as ET
 import pandas as pd
 from scipy.stats import chi2_contingency
 from utils.folders_paths import genealogy_results_path, metrics_path
+from utils.genealogy_xml import parse_genealogy
 
 # Configuration
 INPUT_FOLDER = genealogy_results_path
@@ -63,7 +64,7 @@ def load_data(folder_path):
         project_counts[language].add(project_name)
 
         try:
-            tree = ET.parse(file_path)
+            tree = parse_genealogy(file_path)
             root = tree.getroot()
             
             for lineage in root.findall('lineage'):
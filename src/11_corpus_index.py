@@ -0,0 +1,77 @@
+import os
+import argparse
+import pandas as pd
+from utils.folders_paths import genealogy_results_path, metrics_path
+from omniccg.corpus_index import CorpusIndex
+
+# --- Directory Configuration ---
+INPUT_FOLDER = genealogy_results_path
+INDEX_PATH = os.path.join(genealogy_results_path, "corpus_index.sqlite")
+
+def build_index(index):
+    added = index.add_directory(INPUT_FOLDER)
+    print(f"Indexed {len(added)} new or changed genealogies ({len(index.projects())} projects in the index)")
+    for project in added:
+        print(f"  + {project}")
+
+def query_hash(index, h, threshold):
+    matches = index.query(h, threshold)
+    if not matches:
+        print("No near-duplicate fragments found.")
+    for m in matches:
+        print(f"{m.project} | lineage {m.lineage} | versions {m.first_version}-{m.last_version} | {m.author} | "
+              f"{m.file}:{m.startline}-{m.endline} | distance {m.distance}")
+
+def query_project(index, project, lineage, author):
+    rows = []
+    for fragment, matches in index.cross_project_matches(project, lineage, author):
+        for m in matches:
+            rows.append({
+                "project": fragment.project,
+                "lineage": fragment.lineage,
+                "author": fragment.author,
+                "file": fragment.file,
+                "startline": fragment.startline,
+                "endline": fragment.endline,
+                "other_project": m.project,
+                "other_lineage": m.lineage,
+                "other_versions": f"{m.first_version}-{m.last_version}",
+                "other_author": m.author,
+                "other_file": m.file,
+                "other_startline": m.startline,
+                "other_endline": m.endline,
+                "distance": m.distance,
+            })
+    if not rows:
+        print(f"No fragment of {project} appears in another project.")
+        return
+    os.makedirs(metrics_path, exist_ok=True)
+    output_path = os.path.join(metrics_path, f"{project}_cross_project_clones.csv")
+    pd.DataFrame(rows).to_csv(output_path, index=False)
+    print(f"{len(rows)} cross-project matches saved to: {output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corpus-wide index of clone fragment SimHashes")
+    parser.add_argument("--index", default=INDEX_PATH, help="path of the SQLite index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="add new or changed genealogy XMLs to the index")
+    query = subparsers.add_parser("query", help="find near-duplicates of a hash or of a project's fragments")
+    query.add_argument("--hash", type=int, help="SimHash of a fragment")
+    query.add_argument("--project", help="genealogy name, e.g. py_marimo-team_marimo")
+    query.add_argument("--lineage", type=int, help="lineage position within the project")
+    query.add_argument("--author", help="only fragments first seen in versions by this author (e.g. agent)")
+    query.add_argument("--threshold", type=float, default=None, help="SimHash similarity threshold")
+    args = parser.parse_args()
+
+    index = CorpusIndex(args.index)
+    try:
+        if args.command == "build":
+            build_index(index)
+        elif args.hash is not None:
+            query_hash(index, args.hash, args.threshold)
+        elif args.project:
+            query_project(index, args.project, args.lineage, args.author)
+        else:
+            parser.error("query needs --hash or --project")
+    finally:
+        index.close()
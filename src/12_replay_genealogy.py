@@ -0,0 +1,32 @@
+import os
+import glob
+import argparse
+import itertools
+import pandas as pd
+from utils.folders_paths import genealogy_results_path
+from omniccg.replay import replay_sweep
+
+# --- Directory Configuration ---
+ARCHIVE_FOLDER = os.path.join(genealogy_results_path, "detection_archives")
+OUTPUT_FOLDER = os.path.join(genealogy_results_path, "replay")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild genealogies from archived detection results under other matching parameters")
+    parser.add_argument("archives", nargs="*", help="detection archives (default: every archive in genealogy_results)")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.90], help="SimHash similarity thresholds")
+    parser.add_argument("--rule", nargs="+", choices=["fragment", "class"], default=["fragment"],
+                        help="lineage matching rules (Lineage.matches)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel replay processes")
+    args = parser.parse_args()
+
+    archive_files = args.archives or sorted(glob.glob(os.path.join(ARCHIVE_FOLDER, "*.sqlite")))
+    if not archive_files:
+        print(f"No detection archives found in '{ARCHIVE_FOLDER}'.")
+    else:
+        grid = [{"match_threshold": threshold, "lineage_match_rule": rule}
+                for threshold, rule in itertools.product(args.threshold, args.rule)]
+        print(f"Replaying {len(archive_files)} archives x {len(grid)} parameter sets on {args.workers} workers...")
+        rows = replay_sweep(archive_files, grid, OUTPUT_FOLDER, args.workers)
+        output_path = os.path.join(OUTPUT_FOLDER, "replay_sweep.csv")
+        pd.DataFrame(rows).to_csv(output_path, index=False)
+        print(f"\n✓ Results saved to: {output_path}")
@@ -0,0 +1,18 @@
+import argparse
+from omniccg.workspaces import WorkspaceManager, WriteWorkspaceReport, workspace_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Disk footprint and eviction of cloned repository workspaces")
+    parser.add_argument("--budget-gb", type=float, default=None,
+                        help="evict least recently used, unpinned workspaces until they fit in this budget")
+    args = parser.parse_args()
+
+    manager = WorkspaceManager(budget_bytes=None if args.budget_gb is None else int(args.budget_gb * 1024 ** 3))
+    evicted = manager.enforce_budget()
+    usage = manager.usage()
+    for row in sorted(usage, key=lambda r: r.total_bytes, reverse=True):
+        print(f"{row.name:<40} {row.total_bytes / 1024 ** 2:>10.1f} MiB "
+              f"({row.evictable_bytes / 1024 ** 2:.1f} MiB evictable){' [pinned]' if row.pinned else ''}")
+    print(f"Total: {sum(row.total_bytes for row in usage) / 1024 ** 3:.2f} GiB in {len(usage)} workspaces, "
+          f"{len(evicted)} evicted")
+    WriteWorkspaceReport(workspace_rows(usage, evicted))
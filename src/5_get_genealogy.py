@@ -1,9 +1,13 @@
 import os
+import argparse
 import pandas as pd
 from dotenv import load_dotenv
 from utils.compute_time import timed
-from omniccg.core import get_clone_genealogy
-from utils.folders_paths import main_results
+from omniccg.core import follow_clone_genealogy, Settings, ResetErrorLog
+from omniccg.scheduler import ProjectJob, run_schedule
+from omniccg.job_queue import SQLiteJobQueue
+from omniccg.queue_worker import enqueue_projects, run_worker
+from utils.folders_paths import main_results, genealogy_results_path
 from utils.languages import LANGUAGES
 
 load_dotenv()
@@ -13,7 +17,8 @@ os.makedirs(main_results, exist_ok=True)
 
 # Main function to process the data
 @timed(main_results)
-def main():
+def main(commit_order="pr_number", sample_every=None, languages=None, scratch_root=None, workspace_budget_gb=None,
+         jobs=1, ram_per_job_gb=2.0, queue_path=None, commit_batch=None):
     # === Load projects_with_pr_sha.csv ===
     csv_path = os.path.join(main_results, "human_agent_prs_with_commits.csv")
     df_prs = pd.read_csv(csv_path)
@@ -21,6 +26,7 @@ def main():
 
     # === Group by full_name to process each project ===
     projects_grouped = df_prs.groupby("full_name")
+    project_jobs = []
     for full_name, project_prs in projects_grouped:
         total_prs = len(project_prs)
         
@@ -50,12 +56,74 @@ def main():
                 }
             )
 
-        # Process clone genealogy if we have commits
-        print(f"\n  Processing clone genealogy for {full_name} ({len(context_commits_by_project)} commits)...")
-        get_clone_genealogy(f"https://github.com/{full_name}", context_commits_by_project)
+        project_jobs.append(ProjectJob(full_name, context_commits_by_project[-1]["language"], context_commits_by_project))
 
-        print("\n=== All PRs processed ===")
+    # Process the clone genealogies, longest predicted first
+    settings = Settings(commit_order=commit_order, sample_every=sample_every, languages=languages,
+                        scratch_root=scratch_root, workspace_budget_gb=workspace_budget_gb)
+    if queue_path:
+        # Workers on this or other boxes pick the jobs up (--worker)
+        queue = SQLiteJobQueue(queue_path)
+        submitted = enqueue_projects(queue, project_jobs, settings, commit_batch)
+        print(f"Submitted {len(submitted)} jobs to {queue_path}: {queue.counts()}")
+        queue.close()
+    else:
+        # a fresh error log per batch run; queue workers and follow mode append to it
+        ResetErrorLog()
+        run_schedule(project_jobs, settings, workers=jobs, ram_per_job_gb=ram_per_job_gb, github_token=token)
+
+    print("\n=== All PRs processed ===")
+
+def load_pr_types(repo_url):
+    """PR number -> type (human / agent) of the project's PRs in the dataset, for --follow."""
+    full_name = "/".join(repo_url.rstrip("/").removesuffix(".git").split("/")[-2:])
+    df_prs = pd.read_csv(os.path.join(main_results, "human_agent_prs_with_commits.csv"))
+    project_prs = df_prs[df_prs["full_name"] == full_name]
+    return dict(zip(project_prs["number"].astype(int), project_prs["pr_type"]))
 
 # Execute main function
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build the clone genealogy of each project")
+    parser.add_argument("--order", choices=["pr_number", "topology", "date"], default="pr_number",
+                        help="order in which the merged PR commits are analyzed")
+    parser.add_argument("--sample-every", type=int, default=None, metavar="K",
+                        help="detect clones on every K-th commit and refine only where clone classes changed")
+    parser.add_argument("--languages", nargs="+", choices=sorted(set(LANGUAGES.values())), metavar="LANG",
+                        help="analyze every commit for these languages (e.g. py cs rb) instead of the project's language")
+    parser.add_argument("--follow", metavar="REPO_URL",
+                        help="keep extending the saved genealogy of REPO_URL with newly merged commits")
+    parser.add_argument("--poll-interval", type=int, default=300, metavar="SECONDS",
+                        help="seconds between polls in --follow mode")
+    parser.add_argument("--scratch-root", default=None, metavar="DIR",
+                        help="stage sources and NiCad intermediates on a RAM-backed filesystem (e.g. /dev/shm)")
+    parser.add_argument("--workspace-budget-gb", type=float, default=None, metavar="GB",
+                        help="evict least recently used cloned repository workspaces above this disk budget")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="projects analyzed in parallel (capped by cores, free RAM and disk)")
+    parser.add_argument("--ram-per-job-gb", type=float, default=2.0,
+                        help="memory reserved for each running project")
+    parser.add_argument("--queue", metavar="DB",
+                        help="submit the projects to this SQLite job queue instead of running them")
+    parser.add_argument("--commit-batch", type=int, default=None, metavar="N",
+                        help="with --queue, split projects into detection jobs of N commits plus a fold job")
+    parser.add_argument("--worker", metavar="DB",
+                        help="run queued jobs from this SQLite job queue until it is drained")
+    parser.add_argument("--worker-id", default=None, help="worker name in leases (default host:pid)")
+    parser.add_argument("--results-dir", default=genealogy_results_path,
+                        help="shared directory that workers upload their results to")
+    parser.add_argument("--lease-seconds", type=float, default=600,
+                        help="job lease, renewed by heartbeats every third of it")
+    parser.add_argument("--wait", action="store_true", help="keep polling the queue once it is drained")
+    args = parser.parse_args()
+    if args.worker:
+        queue = SQLiteJobQueue(args.worker)
+        completed = run_worker(queue, args.worker_id, args.results_dir, args.lease_seconds, wait=args.wait)
+        print(f"Worker completed {completed} jobs: {queue.counts()}")
+        queue.close()
+    elif args.follow:
+        follow_clone_genealogy(args.follow, load_pr_types(args.follow), poll_interval=args.poll_interval)
+    else:
+        main(commit_order=args.order, sample_every=args.sample_every, languages=args.languages,
+             scratch_root=args.scratch_root, workspace_budget_gb=args.workspace_budget_gb,
+             jobs=args.jobs, ram_per_job_gb=args.ram_per_job_gb, queue_path=args.queue,
+             commit_batch=args.commit_batch)
@@ -2,6 +2,7 @@ import xml.etree.ElementTree as ET
 from pathlib import Path
 import pandas as pd
 from utils.folders_paths import genealogy_results_path, main_results, metrics_path
+from utils.genealogy_xml import parse_genealogy
 
 def analyze_xml_file(xml_path):
     """
@@ -11,7 +12,7 @@ def analyze_xml_file(xml_path):
     Returns:
         dict: Dictionary with lineage count, human clones, agent clones, and alive/dead lineages by author
     """
-    tree = ET.parse(xml_path)
+    tree = parse_genealogy(xml_path)
     root = tree.getroot()
     
     total_lineages = 0
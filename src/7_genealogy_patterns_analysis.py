@@ -2,6 +2,7 @@ import os
 import pandas as pd
 import xml.etree.ElementTree as ET
 from utils.folders_paths import genealogy_results_path, metrics_path
+from utils.genealogy_xml import parse_genealogy
 
 os.makedirs(metrics_path, exist_ok=True)
 
@@ -45,7 +46,7 @@ def analyze_clones_modifications(results_folder, clone_creator_type):
         has_target_clones = False  # Track if project has clones of target type
         
         try:
-            tree = ET.parse(file_path)
+            tree = parse_genealogy(file_path)
             root = tree.getroot()
             
             # Process each lineage (clone genealogy) separately
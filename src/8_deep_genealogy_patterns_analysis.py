@@ -3,13 +3,14 @@ import xml.etree.ElementTree as ET
 import pandas as pd
 from pathlib import Path
 from utils.folders_paths import genealogy_results_path, metrics_path
+from utils.genealogy_xml import parse_genealogy
 
 def extract_patterns_from_xml(xml_file):
     """
     Extract evolution and change patterns from an XML file
     Separates by lineage creator type (human or agent)
     """
-    tree = ET.parse(xml_file)
+    tree = parse_genealogy(xml_file)
     root = tree.getroot()
     
     results = {
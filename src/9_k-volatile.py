@@ -3,6 +3,7 @@ import glob
 import xml.etree.ElementTree as ET
 import matplotlib.pyplot as plt
 from utils.folders_paths import genealogy_results_path, metrics_path
+from utils.genealogy_xml import parse_genealogy
 
 # --- Directory Configuration ---
 INPUT_FOLDER = genealogy_results_path
@@ -19,7 +20,7 @@ def parse_and_plot(file_path):
     project_name = os.path.splitext(filename)[0]  # Removes the .xml extension
     
     try:
-        tree = ET.parse(file_path)
+        tree = parse_genealogy(file_path)
         root = tree.getroot()
     except ET.ParseError:
         print(f"[ERROR] Failed to parse XML: {filename}")
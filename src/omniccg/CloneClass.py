@@ -1,24 +1,69 @@
+import hashlib
 from typing import List
 from omniccg.CloneFragment import CloneFragment
 
+def fingerprint_rows(rows) -> str:
+    return hashlib.sha1(repr(list(rows)).encode("utf-8")).hexdigest()
+
 class CloneClass:
+    __slots__ = ("fragments", "_fingerprint")
+
     def __init__(self):
         self.fragments: List[CloneFragment] = []
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """
+        Canonical, order-independent identity of the class: a digest of its
+        sorted (file, startline, endline, hash) rows. Cached after first use.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint_rows(self.rows())
+        return self._fingerprint
+
+    def rows(self):
+        """Sorted (file, startline, endline, hash) rows the fingerprint is computed from."""
+        return tuple(sorted((f.file, f.ls, f.le, f.hash) for f in self.fragments))
 
-    def contains(self, fragment):
+    def contains(self, fragment, threshold=0.90):
         for f in self.fragments:
-            if f.matches(fragment):
+            if f.matches(fragment, threshold):
                 return True
         return False
 
-    def matches(self, cc: "CloneClass"):
+    def matches(self, cc: "CloneClass", threshold=0.90):
         n = 0
         for fragment in cc.fragments:
-            if self.contains(fragment):
+            if self.contains(fragment, threshold):
                 n += 1
         return (n == len(cc.fragments)) or (n == len(self.fragments))
 
-    def toXML(self):
+    def share_unchanged(self, previous: "CloneClass") -> "CloneClass":
+        """
+        Reuse the fragment objects of `previous` for fragments whose file, lines and
+        hash did not change, and `previous` itself when nothing changed at all.
+        """
+        if previous is self:
+            return self
+        kept = {}
+        for f in previous.fragments:
+            kept.setdefault((f.path, f.ls, f.le, f.hash, f.root, f.function), f)
+        fragments = [kept.get((f.path, f.ls, f.le, f.hash, f.root, f.function), f) for f in self.fragments]
+        if len(fragments) == len(previous.fragments) and all(a is b for a, b in zip(fragments, previous.fragments)):
+            return previous
+        self.fragments = fragments
+        return self
+
+    def toXML(self, previous: "CloneClass" = None, ref=None):
+        """
+        Full <class> element, or with `previous` the compact form: <class ref="nr"/> when
+        identical to the class of version `ref`, else <same index="k"/> for each fragment
+        kept from it and full <source> rows for the others.
+        """
+        if previous is not None:
+            compact = self._toCompactXML(previous, ref)
+            if compact is not None:
+                return compact
         s = '\t\t<class nclones="%d">\n' % (len(self.fragments))
         for fragment in self.fragments:
             try:
@@ -28,5 +73,30 @@ class CloneClass:
         s += "\t\t</class>\n"
         return s
 
+    def _toCompactXML(self, previous: "CloneClass", ref):
+        if previous is self or self.rows_in_order() == previous.rows_in_order():
+            return '\t\t<class nclones="%d" ref="%s" />\n' % (len(self.fragments), ref)
+        index = {}
+        for k, f in enumerate(previous.fragments):
+            index.setdefault((f.path, f.ls, f.le, f.hash, f.root), k)
+        rows = []
+        shared = 0
+        for fragment in self.fragments:
+            k = index.get((fragment.path, fragment.ls, fragment.le, fragment.hash, fragment.root))
+            if k is not None:
+                rows.append('\t\t\t<same index="%d" />\n' % k)
+                shared += 1
+            else:
+                try:
+                    rows.append(fragment.toXML())
+                except Exception:
+                    pass
+        if not shared:
+            return None  # nothing kept from the previous class: the full form is just as small
+        return '\t\t<class nclones="%d" ref="%s">\n%s\t\t</class>\n' % (len(self.fragments), ref, "".join(rows))
+
+    def rows_in_order(self):
+        return [(f.path, f.ls, f.le, f.hash, f.root) for f in self.fragments]
+
     def countLOC(self):
         return sum(f.countLOC() for f in self.fragments)
@@ -1,31 +1,81 @@
-from omniccg.code_operations import get_code_without_comments_and_blank_lines
+import sys
+from pathlib import Path
+from omniccg.code_operations import get_code_without_comments_and_blank_lines, normalize_code_segment
 from omniccg.hash_operations import generate_simhash, match_hashes
 
+def repo_path(file):
+    # replace /dataset/production with /repo to keep compatibility with the original pipeline
+    return file.replace("/dataset/production", "/repo")
+
+def split_repo_path(file):
+    """
+    (root, path) of a NiCad fragment file: the repository root ("…/repo") and the
+    path relative to it, both interned so every fragment of a file shares them.
+    root + "/" + path == repo_path(file); files outside a staged tree keep root "".
+    """
+    full = repo_path(file)
+    idx = file.find("/dataset/production/")
+    if idx >= 0:
+        root = full[:idx] + "/repo"
+        if full.startswith(root + "/"):
+            return sys.intern(root), sys.intern(full[len(root) + 1:])
+    return "", sys.intern(full)
+
 class CloneFragment:
-    def __init__(self, file, ls, le):
-        # replace /dataset/production with /repo to keep compatibility with the original pipeline
-        self.file = file.replace("/dataset/production", "/repo")
+    __slots__ = ("root", "path", "ls", "le", "hash", "function")
+
+    def __init__(self, file, ls, le, code=None, hash=None, function=None):
+        self.root, self.path = split_repo_path(file)
         self.ls = ls
         self.le = le
-        self.code_content = get_code_without_comments_and_blank_lines(file, ls, le)
-        self.hash = generate_simhash(self.code_content)
+        # qualified name of the function ("Class.method"), when recovered at extraction
+        self.function = function
+        if hash is not None:
+            # hash carried over from the previous commit: the lines are unchanged
+            self.hash = hash
+            return
+        if code is None:
+            code_content = get_code_without_comments_and_blank_lines(file, ls, le)
+        else:
+            # source text embedded by NiCad: no need to reopen the file
+            code_content = normalize_code_segment(code, Path(file).suffix.lower())
+        # only the hash is kept, not the normalized text
+        self.hash = generate_simhash(code_content)
+
+    @classmethod
+    def in_repo(cls, root, path, ls, le, hash, function=None):
+        """Fragment at `path` under the repository root `root` ("" for an absolute path), with a known hash."""
+        fragment = cls.__new__(cls)
+        fragment.root, fragment.path = sys.intern(root), sys.intern(path)
+        fragment.ls = ls
+        fragment.le = le
+        fragment.hash = hash
+        fragment.function = function
+        return fragment
+
+    @property
+    def file(self):
+        return f"{self.root}/{self.path}" if self.root else self.path
+
+    def same_file(self, other):
+        return self.path == other.path and self.root == other.root
 
     def contains(self, other):
-        return self.file == other.file and self.ls <= other.ls and self.le >= other.le
+        return self.same_file(other) and self.ls <= other.ls and self.le >= other.le
 
     def __eq__(self, other):
-        return self.file == other.file and self.ls == other.ls and self.le == other.le
+        return self.same_file(other) and self.ls == other.ls and self.le == other.le
 
-    def matches(self, other):
-        if self.file == other.file and self.ls == other.ls and self.le == other.le:
+    def matches(self, other, threshold=0.90):
+        if self.ls == other.ls and self.le == other.le and self.same_file(other):
             return True
 
-        matches_result, _ = match_hashes(self.hash, other.hash, threshold=0.90)
+        matches_result, _ = match_hashes(self.hash, other.hash, threshold=threshold)
         return matches_result
 
     def matchesStrictly(self, other):
         matches_result, _ = match_hashes(self.hash, other.hash, threshold=1.0)
-        return self.file == other.file and matches_result
+        return self.same_file(other) and matches_result
 
     def __hash__(self):
         return hash(self.file + str(self.ls))
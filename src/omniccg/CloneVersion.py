@@ -2,6 +2,9 @@ from typing import List
 from omniccg.CloneFragment import CloneFragment
 
 class CloneVersion:
+    __slots__ = ("cloneclass", "hash", "nr", "evolution_pattern", "change_pattern", "removed_fragments",
+                 "number_pr", "author_pr", "n_evo", "n_change", "clones_loc", "sampling")
+
     def __init__(self, cc=None, h=None, n=None, number_pr=None, author_pr="None", evo="None", chan="None", n_evo=0, n_change=0, clones_loc=0):
         self.cloneclass = cc
         self.hash = h
@@ -14,6 +17,8 @@ class CloneVersion:
         self.n_evo = n_evo
         self.n_change = n_change
         self.clones_loc = clones_loc
+        # sampled / refined / interpolated, only in sampling mode (see omniccg.commit_sampling)
+        self.sampling = None
 
     def toXMLRemoved(self):
         s = ""
@@ -21,8 +26,9 @@ class CloneVersion:
             s += f.toXML()
         return s
 
-    def toXML(self):
-        s = '\t<version nr="%d" hash="%s" number_pr="%s" evolution="%s" change="%s" author="%s" n_evo="%d" n_cha="%d" clones_LOC="%d" >\n' % (
+    def toXML(self, previous: "CloneVersion" = None):
+        """With `previous` (the preceding version of the lineage) the class is delta-encoded."""
+        s = '\t<version nr="%d" hash="%s" number_pr="%s" evolution="%s" change="%s" author="%s" n_evo="%d" n_cha="%d" clones_LOC="%d"%s >\n' % (
             self.nr,
             self.hash,
             self.number_pr,
@@ -32,10 +38,14 @@ class CloneVersion:
             self.n_evo,
             self.n_change,
             self.clones_loc,
+            ' sampling="%s"' % self.sampling if self.sampling else "",
         )
 
         try:
-            s += self.cloneclass.toXML()
+            if previous is None:
+                s += self.cloneclass.toXML()
+            else:
+                s += self.cloneclass.toXML(previous.cloneclass, previous.nr)
         except Exception:
             pass
         s += "\t</version>\n"
@@ -1,16 +1,29 @@
 class Lineage:
-    def __init__(self):
+    __slots__ = ("id", "versions")
+
+    def __init__(self, id=None):
+        self.id = id
         self.versions = []
 
-    def matches(self, cc):
+    def matches(self, cc, threshold=0.90, rule="fragment"):
+        """
+        rule "fragment": some fragment of `cc` matches the tip class;
+        rule "class": every fragment of `cc` or of the tip has a match (CloneClass.matches).
+        """
+        tip = self.versions[-1].cloneclass
+        if rule == "class":
+            return tip.matches(cc, threshold)
         for fragment in cc.fragments:
-            if self.versions[-1].cloneclass.contains(fragment):
+            if tip.contains(fragment, threshold):
                 return True
         return False
 
-    def toXML(self):
+    def toXML(self, compact=False):
         s = "<lineage>\n"
+        previous = None
         for version in self.versions:
-            s += version.toXML()
+            s += version.toXML(previous)
+            if compact:
+                previous = version
         s += "</lineage>\n"
         return s
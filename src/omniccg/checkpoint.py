@@ -0,0 +1,23 @@
+import os
+import pickle
+from typing import Optional
+
+# Bumped whenever the pickled model classes change incompatibly
+CHECKPOINT_VERSION = 2
+
+def save_checkpoint(path: str, payload: dict):
+    """Pickle `payload` atomically (write to a temporary file, then rename over `path`)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": CHECKPOINT_VERSION, **payload}, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path: str) -> Optional[dict]:
+    """The saved payload, or None when there is no checkpoint or it was written by another version."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        payload = pickle.load(f)
+    if payload.pop("version", None) != CHECKPOINT_VERSION:
+        return None
+    return payload
@@ -101,16 +101,16 @@ def clean_file_cs(filepath):
         print(f"[ERROR] Failed {filepath}: {e}")
         return False
 
-def process_directory_cs(directory):
+def process_directory_cs(directory, files=None):
     count = 0
     errors = 0
     print(f"Starting NUCLEAR C# cleaning in: {directory}")
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".cs"):
-                path = os.path.join(root, file)
-                if clean_file_cs(path):
-                    count += 1
-                else:
-                    errors += 1
+    if files is None:
+        files = [os.path.join(root, file) for root, _, names in os.walk(directory) for file in names]
+    for path in files:
+        if path.endswith(".cs"):
+            if clean_file_cs(path):
+                count += 1
+            else:
+                errors += 1
     print(f"\nDone. Cleaned: {count}, Errors: {errors}")
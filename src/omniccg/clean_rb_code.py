@@ -111,16 +111,16 @@ def clean_file_rb(filepath):
         print(f"[ERROR] Failed {filepath}: {e}")
         return False
 
-def process_directory_rb(directory):
+def process_directory_rb(directory, files=None):
     count = 0
     errors = 0
     print(f"Starting BLACK HOLE RUBY cleaning in: {directory}")
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".rb"):
-                path = os.path.join(root, file)
-                if clean_file_rb(path):
-                    count += 1
-                else:
-                    errors += 1
+    if files is None:
+        files = [os.path.join(root, file) for root, _, names in os.walk(directory) for file in names]
+    for path in files:
+        if path.endswith(".rb"):
+            if clean_file_rb(path):
+                count += 1
+            else:
+                errors += 1
     print(f"\nDone. Cleaned: {count}, Errors: {errors}")
@@ -1,6 +1,7 @@
 import os
 import pandas as pd
 import xml.etree.ElementTree as ET
+from omniccg.line_remap import LINE_PRESERVING_LANGUAGES
 from utils.folders_paths import genealogy_results_path
 
 # Count lines of code
@@ -20,18 +21,27 @@ def count_system_lines_of_code(directory, extension):
 
 # Calculate cloned lines of code
 def count_cloned_lines_of_code(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+    context = ET.iterparse(xml_path, events=('start', 'end'))
+    _, root = next(context)
     total_lines = 0
-    for cls in root.findall('class'):
-        for source in cls.findall('source'):
+    for event, elem in context:
+        if event != 'end' or elem.tag != 'class':
+            continue
+        for source in elem.findall('source'):
             startline = int(source.get('startline'))
             endline = int(source.get('endline'))
             total_lines += (endline - startline)
+        elem.clear()
+        root.clear()
     return total_lines
 
 def compute_clone_density(ctx, language, repo_name, git_url, number_pr, commit_pr, author_pr):
-    system_lines = count_system_lines_of_code(os.path.abspath(ctx.paths.prod_data_dir), language)
+    if ctx.manifest is not None and ctx.staging.paths and language in LINE_PRESERVING_LANGUAGES:
+        # LOC of the staged files from the commit manifest: staging these languages keeps
+        # every line, so the committed blobs count the same lines NiCad saw
+        system_lines = ctx.manifest.loc(commit_pr, language, ctx.staging.paths)
+    else:
+        system_lines = count_system_lines_of_code(os.path.abspath(ctx.paths.prod_data_dir), language)
     clones_lines = count_cloned_lines_of_code(ctx.paths.clone_detector_xml)
     clone_density_by_repo = round((clones_lines * 100) / system_lines, 2)
     
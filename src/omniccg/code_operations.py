@@ -6,14 +6,21 @@ def get_code_without_comments_and_blank_lines(file: str, ls: int, le: int) -> st
     ignoring blank lines and comments.
     """
     path = Path(file)
-    ext = path.suffix.lower()
 
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
         lines = f.readlines()
 
     # slice only the requested segment
     segment = "".join(lines[ls - 1:le])
+    return normalize_code_segment(segment, path.suffix.lower())
 
+
+def normalize_code_segment(segment: str, ext: str) -> str:
+    """
+    Normalize an already extracted code segment (e.g. lines of a staged file
+    read once per classes report): drop comments for the given file extension,
+    blank lines and trailing spaces.
+    """
     # remove comments depending on file extension
     if ext in {".c", ".cs", ".java"}:
         cleaned = _strip_c_style_comments(segment)
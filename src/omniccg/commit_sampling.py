@@ -0,0 +1,73 @@
+import os
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional
+from omniccg.CloneClass import CloneClass
+from utils.folders_paths import genealogy_results_path
+
+# How a commit was covered in sampling mode (the `sampling` attribute of its versions)
+SAMPLED = "sampled"            # on the every-k-th grid
+REFINED = "refined"            # detected while bisecting an interval whose classes changed
+INTERPOLATED = "interpolated"  # skipped: both ends of its interval have the same classes
+FAILED = "failed"              # no usable detection (no sources, NiCad error or timeout)
+
+def sample_indices(n_commits: int, every: int) -> List[int]:
+    """Every `every`-th commit index, always including the first and the last one."""
+    if n_commits <= 0:
+        return []
+    indices = list(range(0, n_commits, max(every, 1)))
+    if indices[-1] != n_commits - 1:
+        indices.append(n_commits - 1)
+    return indices
+
+def class_signature(classes: Iterable[CloneClass]) -> tuple:
+    """
+    Clone classes of a commit as (file, fragment hash) sets. Two commits with the
+    same signature have no new, dead or modified class between them; plain line
+    shifts are ignored.
+    """
+    return tuple(sorted(tuple(sorted((f.path, f.hash) for f in cc.fragments)) for cc in classes))
+
+def plan_sampling(n_commits: int, every: int, detect: Callable[[int], Optional[tuple]]) -> Dict[int, str]:
+    """
+    Status of every commit index. `detect(index)` runs clone detection on one commit
+    and returns its class_signature (None on failure). The grid is detected first;
+    then every interval whose end signatures differ is bisected until its ends are
+    adjacent or equal, and the commits inside equal intervals are interpolated.
+    """
+    status: Dict[int, str] = {}
+    signatures: Dict[int, Optional[tuple]] = {}
+
+    def visit(index: int, label: str):
+        signatures[index] = detect(index)
+        status[index] = label if signatures[index] is not None else FAILED
+
+    grid = sample_indices(n_commits, every)
+    for index in grid:
+        visit(index, SAMPLED)
+    intervals = list(zip(grid, grid[1:]))
+    while intervals:
+        start, end = intervals.pop(0)
+        if end - start < 2:
+            continue
+        if signatures[start] is not None and signatures[start] == signatures[end]:
+            for index in range(start + 1, end):
+                status[index] = INTERPOLATED
+            continue
+        mid = (start + end) // 2
+        visit(mid, REFINED)
+        intervals += [(start, mid), (mid, end)]
+    return status
+
+def sampling_row(commit_nr: int, commit_context: dict, status: str) -> dict:
+    return {
+        "commit_nr": commit_nr,
+        "pr_number": commit_context["pr_number"],
+        "commit_sha": commit_context["sha"],
+        "status": status,
+    }
+
+def WriteSamplingReport(sampling_rows, language, repo_complete_name):
+    report_df = pd.DataFrame(sampling_rows)
+    report_path = os.path.join(genealogy_results_path, f"{language}_{repo_complete_name}_sampling.csv")
+    report_df.to_csv(report_path, index=False)
+    print(f"\nSaved sampling report to {report_path}")
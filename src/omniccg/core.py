@@ -1,27 +1,49 @@
 import os
+import re
 import time
+import copy
+import bisect
+import dataclasses
 import shutil
 import logging
 import subprocess
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 from xml.dom import minidom
 import xml.etree.ElementTree as ET
-from typing import List, Iterable, Optional
-from omniccg.CloneFragment import CloneFragment
-from omniccg.CloneClass import CloneClass
+from typing import Dict, List, Iterable, Iterator, Optional
+from omniccg.CloneFragment import CloneFragment, repo_path
+from omniccg.CloneClass import CloneClass, fingerprint_rows
 from omniccg.CloneVersion import CloneVersion
 from omniccg.Lineage import Lineage
 from dataclasses import dataclass, field
 from omniccg.utils import safe_rmtree
 from omniccg.clone_density import compute_clone_density, WriteCloneDensity
-from omniccg.git_operations import SetupRepo, GitCheckout, GitFecth
-from omniccg.prints_operations import printError, printInfo
+from omniccg.git_operations import SetupRepo, GitCheckout, GitFecth, GitDiffZeroContext, GitCommitOrder, TuneRepo, MaybeTuneRepo
+from omniccg.git_operations import GitFetchAll, GitNewCommits, GitResolveRef
+from omniccg.prints_operations import printError, printInfo, printWarning
 from omniccg.compute_time import timed, timeToString
 from omniccg.git_operations import get_last_merged_pr_commit
 from omniccg.clean_py_code import process_directory_py
 from omniccg.clean_cs_code import process_directory_cs
 from omniccg.clean_rb_code import process_directory_rb
+from omniccg.pattern_operations import GetPatterns
+from omniccg.lineage_store import RetiredLineageStore
+from omniccg.shard_matching import ShardedMatcher
+from omniccg.function_names import FunctionNamer
+from omniccg.manifest import ManifestStore
+from omniccg.checkpoint import save_checkpoint, load_checkpoint
+from omniccg.corpus_index import CorpusIndex
+from omniccg.detection_archive import DetectionArchive, archive_path
+from omniccg.scratch import scratch_dir_for, scratch_fits, remove_path, place_transient_dir
+from omniccg.workspaces import WorkspaceManager, repo_folder_name
+from omniccg.commit_sampling import (REFINED, INTERPOLATED, FAILED, class_signature, plan_sampling,
+                                     sampling_row, WriteSamplingReport)
+from omniccg.line_remap import LINE_PRESERVING_LANGUAGES, CommitRemap, remap_hash_cache
+from omniccg.file_filter import FilterRules, FilterStats, FileFilter, prefilter_row, WritePrefilterReport
 from utils.folders_paths import genealogy_results_path
+from utils.nicad_operations import NiCadTimeout, nicad_time_budget, run_nicad_supervised, record_nicad_timeout, write_nicad_config
 from dotenv import load_dotenv
 
 
@@ -30,12 +52,16 @@ token = os.getenv("GITHUB_TOKEN")
 
 os.makedirs(genealogy_results_path, exist_ok=True)
 
+# Appended to by every process that imports core (batch runs, queue workers, replays);
+# only the batch entry point starts it afresh, with ResetErrorLog
 log_file = f'{genealogy_results_path}/errors.log'
-if os.path.exists(log_file):
-    os.remove(log_file)  # D
 
 logging.basicConfig(filename=log_file, level=logging.INFO)
 
+def ResetErrorLog():
+    # truncated in place, so handlers already open on it keep writing to the same file
+    open(log_file, "w").close()
+
 # =========================
 # Configuration models
 # =========================
@@ -48,15 +74,101 @@ class Paths:
     prod_data_dir: str = field(default_factory=lambda: os.path.join("workspace", "dataset", "production"))  # overwritten in get_clone_genealogyain()
     hist_file: str = field(default_factory=lambda: os.path.join("workspace", "githistory.txt"))  # overwritten in get_clone_genealogyain()
 
+@dataclass
+class Settings:
+    # NiCad watchdog: wall-clock budget = base + per_file * files + per_kloc * KLOC (capped)
+    nicad_timeout_base: int = 300
+    nicad_timeout_per_file: float = 0.5
+    nicad_timeout_per_kloc: float = 6.0
+    nicad_timeout_max: int = 4 * 3600
+    # Pre-flight filter for generated, vendored and oversized sources
+    file_filter: FilterRules = field(default_factory=FilterRules)
+    # Append byte-identical classes to their lineage as Same/Same without the full matching scan
+    fingerprint_fast_path: bool = True
+    # Move lineages not extended for this many commits to an on-disk store (None = keep all in memory).
+    # A retired lineage only comes back on an exact fragment-hash hit with its tip.
+    retire_after_commits: Optional[int] = None
+    # Match clone classes against lineage shards in this many worker processes (1 = serial scan),
+    # once the active set holds at least `match_parallel_min_lineages` lineages
+    match_workers: int = 1
+    match_parallel_min_lineages: int = 5000
+    # Carry fragment hashes of unchanged code over from the previous analyzed commit (git diff -U0)
+    reuse_fragment_hashes: bool = True
+    # Follow renamed files (git diff -M) and shifted lines in the fingerprint index of lineage tips
+    remap_renamed_paths: bool = True
+    # Continue lineages by exact (file, qualified function name) lookup before the SimHash scan
+    function_key_index: bool = False
+    # Delta-encode unchanged fragments in the genealogy XML (<class ref>, <same index>); see utils.genealogy_xml
+    compact_lineage_xml: bool = False
+    # List staged files and system LOC from a per-SHA `git ls-tree` manifest instead of walking the checkout
+    use_commit_manifest: bool = True
+    # Analysis order of the commits: "pr_number", "topology" (parents first) or "date" (committer date);
+    # ancestry order keeps consecutive snapshots close, so diffs, remaps and NiCad runs stay small
+    commit_order: str = "pr_number"
+    # Run clone detection on every k-th commit only and bisect the intervals whose clone classes
+    # differ; commits inside unchanged intervals are interpolated (None = analyze every commit)
+    sample_every: Optional[int] = None
+    # Pickle the lineage state at the end of a run so follow_clone_genealogy can continue it
+    write_checkpoint: bool = True
+    # Analyze each commit for all of these languages with one fetch/checkout (None = the PRs' language);
+    # every language keeps its own lineage state and outputs
+    languages: Optional[List[str]] = None
+    # SQLite corpus index (omniccg.corpus_index) that finished project genealogies are added to
+    corpus_index_path: Optional[str] = None
+    # Archive the clone classes of every analyzed commit (genealogy_results/detection_archives) for omniccg.replay
+    archive_detection_results: bool = True
+    # SimHash similarity for CloneFragment.matches, and how a class continues a lineage (Lineage.matches)
+    match_threshold: float = 0.90
+    lineage_match_rule: str = "fragment"
+    # Stage each commit's filtered tree and NiCad intermediates under this RAM-backed root (e.g. /dev/shm)
+    # while staged size x scratch_headroom fits in its free space; durable outputs stay in the workspace
+    scratch_root: Optional[str] = None
+    scratch_headroom: float = 3.0
+    # Disk budget of cloned_repositories/; least recently used, unpinned workspaces are evicted at run start
+    workspace_budget_gb: Optional[float] = None
+    # Git maintenance (TuneRepo) after clone/update and again every repo_tune_every fetched commits
+    tune_repo: bool = True
+    repo_tune_every: Optional[int] = 100
+
 @dataclass
 class State:
     genealogy_data: List["Lineage"] = field(default_factory=list)
+    # canonical class fingerprint of each lineage tip → lineage
+    fingerprints: Dict[str, "Lineage"] = field(default_factory=dict)
+    # lineage id → (fingerprint, tip rows) with the rows moved to the coordinates of `analyzed_commit`
+    tip_index: Dict[int, tuple] = field(default_factory=dict)
+    # (file, qualified function name) → lineages whose tip holds that function
+    function_index: Dict[tuple, List["Lineage"]] = field(default_factory=dict)
+    tip_functions: Dict[int, tuple] = field(default_factory=dict)
+    analyzed_commit: Optional[str] = None
+    retired: Optional[RetiredLineageStore] = None
+    next_lineage_id: int = 0
+    # (file, startline, endline) → fragment hash, valid for commit `hash_cache_commit`
+    hash_cache: Dict[tuple, int] = field(default_factory=dict)
+    hash_cache_commit: Optional[str] = None
+
+    def lineage_count(self) -> int:
+        return len(self.genealogy_data) + (len(self.retired) if self.retired is not None else 0)
+
+@dataclass
+class StagingStats:
+    files: int = 0
+    loc: int = 0
+    prefilter: FilterStats = field(default_factory=FilterStats)
+    # repo-relative paths of the staged files
+    paths: List[str] = field(default_factory=list)
 
 @dataclass
 class Context:
     paths: Paths
     git_url: str
     state: State
+    settings: Settings = field(default_factory=Settings)
+    staging: StagingStats = field(default_factory=StagingStats)
+    matcher: Optional[ShardedMatcher] = None
+    manifest: Optional[ManifestStore] = None
+    archive: Optional[DetectionArchive] = None
+    fetches_since_tune: int = 0
 
 def GetPattern(v1: CloneVersion, v2: CloneVersion):
     n_evo = 0
@@ -108,28 +220,15 @@ def GetPattern(v1: CloneVersion, v2: CloneVersion):
 
     return (evolution, change, n_evo, n_change, clones_loc)
 
-def PrepareSourceCode(ctx: "Context", language: str, hash_index) -> bool:
-    paths = ctx.paths
-    print("Preparing source code")
-    found = False
-
-    repo_root = os.path.abspath(paths.repo_dir)
-    if not os.path.isdir(repo_root):
-        printError(f"Repository directory not found: {repo_root}")
-        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'PrepareSourceCode' | Error: {e}")
-        return False
-
-    # Reset output dirs
-    if os.path.exists(paths.data_dir):
-        safe_rmtree(paths.data_dir)
-    os.makedirs(paths.clone_detector_dir, exist_ok=True)
-    os.makedirs(paths.data_dir, exist_ok=True)
-    os.makedirs(paths.prod_data_dir, exist_ok=True)
-
-    repo_path = Path(repo_root)
+def _manifest_sources(ctx: "Context", repo_root: str, language: str, commit: str) -> Iterator[Path]:
+    for entry in ctx.manifest.build(commit, language):
+        src = Path(repo_root, entry.path)
+        if src.is_file():
+            yield src
 
+def _walk_sources(repo_root: str, language: str) -> Iterator[Path]:
     # Pick only files that end with .java; skip .git and *test* files
-    for src in repo_path.rglob("*"):
+    for src in Path(repo_root).rglob("*"):
         if not src.is_file():
             continue
 
@@ -146,17 +245,102 @@ def PrepareSourceCode(ctx: "Context", language: str, hash_index) -> bool:
         if "test" in name_lower:
             continue
 
+        yield src
+
+def ResetStagingDir(ctx: "Context", staged_bytes: int):
+    """
+    Empty dataset/ for the next commit. With a scratch root (e.g. /dev/shm) it becomes a
+    symlink into scratch whenever the staged tree and NiCad's intermediates (staged size
+    x scratch_headroom) fit in the free space there; otherwise it is a directory on disk.
+    """
+    paths, settings = ctx.paths, ctx.settings
+    scratch_dir = None
+    if settings.scratch_root:
+        scratch_dir = scratch_dir_for(settings.scratch_root, paths.ws_dir)
+        # free the previous commit's scratch data before measuring
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        if not scratch_fits(settings.scratch_root, staged_bytes, settings.scratch_headroom):
+            printWarning(f"Staged tree ({staged_bytes // 1024} KiB) does not fit in {settings.scratch_root}; staging on disk")
+            scratch_dir = None
+    place_transient_dir(paths.data_dir, scratch_dir)
+
+def AcquireWorkspace(ctx: "Context", workspace_name: str) -> WorkspaceManager:
+    """Pin the project workspace for this run and evict other workspaces over the disk budget."""
+    budget = ctx.settings.workspace_budget_gb
+    manager = WorkspaceManager(budget_bytes=None if budget is None else int(budget * 1024 ** 3))
+    manager.pin(workspace_name)
+    try:
+        manager.enforce_budget()
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Function: 'AcquireWorkspace' | Error: {e}")
+        printWarning(f"Workspace eviction failed: {e}")
+    return manager
+
+@contextmanager
+def HeldWorkspace(ctx: "Context", workspace_name: str):
+    workspaces = AcquireWorkspace(ctx, workspace_name)
+    try:
+        yield workspaces
+    finally:
+        workspaces.unpin(workspace_name)
+
+def ReleaseScratch(ctx: "Context"):
+    if ctx.settings.scratch_root:
+        remove_path(ctx.paths.data_dir)
+        shutil.rmtree(scratch_dir_for(ctx.settings.scratch_root, ctx.paths.ws_dir), ignore_errors=True)
+
+def PrepareSourceCode(ctx: "Context", language: str, hash_index, commit: str = "") -> bool:
+    paths = ctx.paths
+    print("Preparing source code")
+    found = False
+    ctx.staging = StagingStats()
+    file_filter = FileFilter(ctx.settings.file_filter)
+
+    repo_root = os.path.abspath(paths.repo_dir)
+    if not os.path.isdir(repo_root):
+        printError(f"Repository directory not found: {repo_root}")
+        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'PrepareSourceCode' | Error: {e}")
+        return False
+
+    # The commit manifest (git ls-tree) lists the candidate files without walking the checkout
+    if ctx.manifest is not None and commit:
+        sources = _manifest_sources(ctx, repo_root, language, commit)
+    else:
+        sources = _walk_sources(repo_root, language)
+    if ctx.settings.scratch_root:
+        # the staging dir is sized before anything is copied
+        sources = list(sources)
+
+    # Reset output dirs
+    ResetStagingDir(ctx, sum(src.stat().st_size for src in sources) if ctx.settings.scratch_root else 0)
+    os.makedirs(paths.clone_detector_dir, exist_ok=True)
+    os.makedirs(paths.prod_data_dir, exist_ok=True)
+
+    for src in sources:
         rel_dir = os.path.relpath(str(src.parent), repo_root)
         dst_dir = paths.prod_data_dir if rel_dir == "." else os.path.join(paths.prod_data_dir, rel_dir)
 
-        os.makedirs(dst_dir, exist_ok=True)
         try:
-            shutil.copy2(str(src), os.path.join(dst_dir, src.name))
-        except:
+            # Drop generated, vendored and oversized sources before they reach NiCad
+            reason, content = file_filter.check(src, os.path.relpath(str(src), repo_root))
+            if reason is not None:
+                continue
+
+            os.makedirs(dst_dir, exist_ok=True)
+            dst = os.path.join(dst_dir, src.name)
+            with open(dst, "wb") as f:
+                f.write(content)
+            shutil.copystat(str(src), dst)
+        except Exception as e:
             logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'PrepareSourceCode' | Copy file: {str(src)} | Error: {e}")
         else:
             found = True
+            ctx.staging.files += 1
+            ctx.staging.loc += content.count(b"\n")
+            ctx.staging.paths.append(os.path.relpath(str(src), repo_root).replace(os.sep, "/"))
 
+    ctx.staging.prefilter = file_filter.stats
+    printInfo(file_filter.stats.summary())
     print("Source code ready for clone analysis.\n")
     return found
 
@@ -164,9 +348,27 @@ def PrepareSourceCode(ctx: "Context", language: str, hash_index) -> bool:
 # Clone detection (cross‑platform)
 # =========================
 
-def RunCloneDetection(ctx: "Context", hash_index: str, language: str):
+def SanitizeStagedSources(ctx: "Context", language: str):
+    # Sanitize exactly the files PrepareSourceCode staged
+    prod_data_dir = ctx.paths.prod_data_dir
+    staged = [os.path.join(prod_data_dir, p) for p in ctx.staging.paths] or None
+    if language == "py":
+        process_directory_py(prod_data_dir, staged)
+    elif language == "cs":
+        process_directory_cs(prod_data_dir, staged)
+    elif language == "rb":
+        process_directory_rb(prod_data_dir, staged)
+
+def RunCloneDetection(ctx: "Context", hash_index: str, language: str, commit: str = "") -> bool:
+    paths, settings = ctx.paths, ctx.settings
+    budget = nicad_time_budget(ctx.staging.files,
+                               ctx.staging.loc,
+                               base=settings.nicad_timeout_base,
+                               per_file=settings.nicad_timeout_per_file,
+                               per_kloc=settings.nicad_timeout_per_kloc,
+                               max_budget=settings.nicad_timeout_max)
+    clones_dir = Path(f"{paths.prod_data_dir}_functions-clones")
     try:
-        paths = ctx.paths
         print("Starting clone detection:")
 
         # Normalize paths
@@ -181,30 +383,20 @@ def RunCloneDetection(ctx: "Context", hash_index: str, language: str):
                 item.unlink()
         out_xml.parent.mkdir(parents=True, exist_ok=True)
 
-        out_dir = Path(paths.clone_detector_dir)
-        out_dir.mkdir(parents=True, exist_ok=True)
-        for item in out_dir.iterdir():
-            if item.is_file():
-                item.unlink()
-
-        if language == "py":
-            process_directory_py(paths.prod_data_dir)
-        elif language == "cs":
-            process_directory_cs(paths.prod_data_dir)
-        elif language == "rb":
-            process_directory_rb(paths.prod_data_dir)
+        SanitizeStagedSources(ctx, language)
 
-        print(" >>> Running nicad6...")
-        subprocess.run(["./nicad6", "functions", language, paths.prod_data_dir],
-                    cwd="NiCad",
-                    check=True)
+        print(f" >>> Running nicad6 (budget: {timeToString(budget)}, files: {ctx.staging.files}, LOC: {ctx.staging.loc})...")
+        nicad_config = write_nicad_config(paths.nicad_config,
+                                          {"include": settings.file_filter.nicad_include,
+                                           "exclude": settings.file_filter.nicad_exclude})
+        run_nicad_supervised(["./nicad6", "functions", language, paths.prod_data_dir, nicad_config],
+                             cwd="NiCad",
+                             timeout=budget)
 
         nicad_xml = f"{paths.prod_data_dir}_functions-clones/production_functions-clones-0.30-classes.xml"
         shutil.move(nicad_xml, paths.clone_detector_xml)
-        clones_dir = Path(f"{paths.prod_data_dir}_functions-clones")
         shutil.rmtree(clones_dir, ignore_errors=True)
 
-        data_dir = Path(ctx.paths.data_dir)
         for log_file in data_dir.glob("*.log"):
             try:
                 log_file.unlink()
@@ -214,66 +406,443 @@ def RunCloneDetection(ctx: "Context", hash_index: str, language: str):
                 pass
 
         print("Finished clone detection.\n")
+        return True
+    except NiCadTimeout as e:
+        printWarning(f"{e} | commit {commit} skipped")
+        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'RunCloneDetection' | Error: {e}")
+        record_nicad_timeout(paths.timeout_ledger, ctx.git_url, hash_index, commit, language,
+                             ctx.staging.files, ctx.staging.loc, budget)
+        shutil.rmtree(clones_dir, ignore_errors=True)
+        return False
     except Exception as e:
         logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'RunCloneDetection' | Error: {e}")
+        return False
 
 
-def parseCloneClassFile(cloneclass_filename: str) -> List[CloneClass]:
-    cloneclasses: List[CloneClass] = []
+# Staged files kept open (as lines) while one classes report is read
+STAGED_LINES_CACHE = 256
+
+def iterCloneClassFile(cloneclass_filename: str, hash_cache: Optional[Dict[tuple, int]] = None,
+                       namer: Optional[FunctionNamer] = None) -> Iterator[CloneClass]:
+    """
+    Stream clone classes out of a NiCad classes XML one at a time.
+    Each <class> element is cleared (and detached from the root) once it has
+    been turned into a CloneClass, so peak memory does not grow with the file.
+    Fragments found in `hash_cache` reuse the cached hash instead of being re-hashed;
+    the others are hashed from the staged file's lines, each file read once per report.
+    With a `namer`, each fragment carries its qualified function name.
+    """
+    hash_cache = hash_cache or {}
+    staged: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    def staged_segment(file_path: str, startline: int, endline: int) -> str:
+        lines = staged.get(file_path)
+        if lines is None:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as source_file:
+                lines = source_file.readlines()
+            staged[file_path] = lines
+            if len(staged) > STAGED_LINES_CACHE:
+                staged.popitem(last=False)
+        else:
+            staged.move_to_end(file_path)
+        return "".join(lines[startline - 1:endline])
+
     try:
-        file_xml = ET.parse(cloneclass_filename)
-        root = file_xml.getroot()
-        for child in root:
-            cc = CloneClass()
-            fragments = list(child)
-            if not fragments:
+        context = ET.iterparse(cloneclass_filename, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag != "class":
                 continue
-            for fragment in fragments:
+            cc = CloneClass()
+            for fragment in elem:
                 file_path = fragment.get("file")
                 startline = int(fragment.get("startline"))
                 endline = int(fragment.get("endline"))
-                cf = CloneFragment(file_path, startline, endline)
+                cached = hash_cache.get((repo_path(file_path), startline, endline))
+                code = None if cached is not None else staged_segment(file_path, startline, endline)
+                cf = CloneFragment(file_path, startline, endline,
+                                   code=code,
+                                   hash=cached,
+                                   function=namer.qualified_name(file_path, startline, endline) if namer else None)
                 cc.fragments.append(cf)
-            cloneclasses.append(cc)
+            elem.clear()
+            root.clear()
+            if not cc.fragments:
+                continue
+            yield cc
     except Exception as e:
         printError("Something went wrong while parsing the clonepair dataset:")
         raise e
-    return cloneclasses
 
-def RunGenealogyAnalysis(ctx: "Context", commitNr: int, hash_: str, number_pr: int, author_pr: str, hash_index: str):
+def parseCloneClassFile(cloneclass_filename: str) -> List[CloneClass]:
+    return list(iterCloneClassFile(cloneclass_filename))
+
+def _index_tip(st: "State", lineage: Lineage, key: str, rows: tuple, replace: bool = True):
+    if not replace and key in st.fingerprints:
+        return
+    st.fingerprints[key] = lineage
+    st.tip_index[lineage.id] = (key, rows)
+
+def _unindex_tip(st: "State", lineage: Lineage):
+    entry = st.tip_index.pop(lineage.id, None)
+    if entry is not None and st.fingerprints.get(entry[0]) is lineage:
+        del st.fingerprints[entry[0]]
+
+def _index_functions(st: "State", lineage: Lineage, keys: Optional[tuple] = None):
+    if keys is None:
+        keys = tuple({(f.file, f.function) for f in lineage.versions[-1].cloneclass.fragments if f.function})
+    if keys:
+        st.tip_functions[lineage.id] = keys
+        for key in keys:
+            st.function_index.setdefault(key, []).append(lineage)
+
+def _unindex_functions(st: "State", lineage: Lineage):
+    for key in st.tip_functions.pop(lineage.id, ()):
+        owners = st.function_index.get(key, [])
+        if lineage in owners:
+            owners.remove(lineage)
+        if not owners:
+            st.function_index.pop(key, None)
+
+def _lineage_by_function(st: "State", pcc: CloneClass, commitNr: int) -> Optional[Lineage]:
+    # Only keys owned by a single lineage are trusted; the earliest such lineage wins
+    found = None
+    for f in pcc.fragments:
+        owners = st.function_index.get((f.file, f.function)) if f.function else None
+        if owners and len(owners) == 1:
+            lineage = owners[0]
+            if lineage.versions[-1].nr != commitNr and (found is None or lineage.id < found.id):
+                found = lineage
+    return found
+
+def _start_lineage(st: "State", pcc: CloneClass, hash_: str, commitNr: int, number_pr: int, author_pr: str):
+    l = Lineage(st.next_lineage_id)
+    st.next_lineage_id += 1
+    l.versions.append(CloneVersion(pcc, hash_, commitNr, number_pr, author_pr))
+    st.genealogy_data.append(l)
+    _index_tip(st, l, pcc.fingerprint(), pcc.rows())
+    _index_functions(st, l)
+
+def _extend_lineage(st: "State", lineage: Lineage, version: CloneVersion):
+    # Keep the fingerprint index pointing at lineage tips only
+    _unindex_tip(st, lineage)
+    _unindex_functions(st, lineage)
+    # Unchanged fragments (or the whole class) are shared with the previous version
+    version.cloneclass = version.cloneclass.share_unchanged(lineage.versions[-1].cloneclass)
+    lineage.versions.append(version)
+    _index_tip(st, lineage, version.cloneclass.fingerprint(), version.cloneclass.rows())
+    _index_functions(st, lineage)
+
+def _revive_lineages(st: "State", pcc: CloneClass) -> List[Lineage]:
+    # Retired lineages return (in creation order) only when a fragment hash equals one of their tip hashes
+    revived = st.retired.revive(f.hash for f in pcc.fragments)
+    for lineage in revived:
+        bisect.insort(st.genealogy_data, lineage, key=lambda l: l.id)
+        tip = lineage.versions[-1].cloneclass
+        _index_tip(st, lineage, tip.fingerprint(), tip.rows(), replace=False)
+        _index_functions(st, lineage)
+    return revived
+
+def _retire_lineages(st: "State", commitNr: int, retire_after: int):
+    active = []
+    for lineage in st.genealogy_data:
+        if commitNr - lineage.versions[-1].nr >= retire_after:
+            _unindex_tip(st, lineage)
+            _unindex_functions(st, lineage)
+            st.retired.retire(lineage)
+        else:
+            active.append(lineage)
+    st.genealogy_data = active
+
+def _remap_tip_index(st: "State", remap: CommitRemap):
+    # Tips whose fragments cannot all be mapped leave the index: their old coordinates would
+    # be remapped again by the next diff, so they match through the full scan until extended
+    for lineage in st.genealogy_data:
+        entry = st.tip_index.get(lineage.id)
+        if entry is None:
+            continue
+        mapped_rows = []
+        for file, ls, le, fragment_hash in entry[1]:
+            mapped = remap.map_fragment(file, ls, le)
+            if mapped is None:
+                _unindex_tip(st, lineage)
+                break
+            mapped_rows.append((*mapped, fragment_hash))
+        else:
+            mapped_rows = tuple(sorted(mapped_rows))
+            if mapped_rows != entry[1]:
+                _unindex_tip(st, lineage)
+                _index_tip(st, lineage, fingerprint_rows(mapped_rows), mapped_rows)
+
+def _remap_function_index(st: "State", remap: CommitRemap):
+    # Function names survive edits, so only renamed and deleted files move keys
+    for lineage in st.genealogy_data:
+        keys = st.tip_functions.get(lineage.id)
+        if not keys:
+            continue
+        mapped = tuple((new_file, function) for new_file, function in
+                       ((remap.map_path(file), function) for file, function in keys) if new_file is not None)
+        if mapped != keys:
+            _unindex_functions(st, lineage)
+            _index_functions(st, lineage, mapped)
+
+def _reset_tip_index(st: "State"):
+    for lineage in st.genealogy_data:
+        _unindex_tip(st, lineage)
+        tip = lineage.versions[-1].cloneclass
+        _index_tip(st, lineage, tip.fingerprint(), tip.rows())
+
+def RemapToCommit(ctx: "Context", language: str, commit: str, hash_index: str):
+    """
+    Move commit-specific coordinates from the previously analyzed commit to `commit`
+    using `git diff -U0 -M`: the fragment hash cache, and the tip rows behind the
+    fingerprint index so that renamed files and shifted functions keep hitting the
+    fast path. Without a usable diff the cache is dropped and tips are re-indexed
+    at their own coordinates.
+    """
+    st, settings = ctx.state, ctx.settings
+    if st.analyzed_commit is None or st.analyzed_commit == commit:
+        return
+    try:
+        remap = CommitRemap(GitDiffZeroContext(st.analyzed_commit, commit, ctx),
+                            ctx.paths.repo_dir,
+                            follow_lines=language in LINE_PRESERVING_LANGUAGES)
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'RemapToCommit' | Error: {e}")
+        st.hash_cache = {}
+        st.hash_cache_commit = None
+        remap = None
+    if ctx.archive is not None:
+        # replay applies the same remap before folding the commit
+        ctx.archive.record_remap(hash_index, remap)
+    if remap is None:
+        RemapLineageTips(ctx, None)
+        return
+
+    renames = remap.renames()
+    if renames:
+        printInfo(f"{len(renames)} renamed files since {st.analyzed_commit}")
+    if settings.reuse_fragment_hashes and st.hash_cache_commit == st.analyzed_commit:
+        st.hash_cache = remap_hash_cache(st.hash_cache, remap)
+        st.hash_cache_commit = commit
+    RemapLineageTips(ctx, remap)
+
+def RemapLineageTips(ctx: "Context", remap: Optional[CommitRemap]):
+    """Move the tip coordinates behind the fingerprint and function indexes; None re-indexes them in place."""
+    st, settings = ctx.state, ctx.settings
+    if remap is None:
+        _reset_tip_index(st)
+        return
+    if settings.remap_renamed_paths and settings.fingerprint_fast_path:
+        _remap_tip_index(st, remap)
+    if settings.remap_renamed_paths and settings.function_key_index:
+        _remap_function_index(st, remap)
+
+def RunGenealogyAnalysis(ctx: "Context", commitNr: int, hash_: str, number_pr: int, author_pr: str, hash_index: str,
+                         pcloneclasses: Optional[Iterable[CloneClass]] = None):
+    """Fold the clone classes of a commit into the lineages; by default they are read from the NiCad results."""
     try:
-        paths, st = ctx.paths, ctx.state
+        paths, st, settings = ctx.paths, ctx.state, ctx.settings
         print(f"Extract Code Code Genealogy (CCG) - Hash Commit {hash_}")
-        pcloneclasses = parseCloneClassFile(paths.clone_detector_xml)
-
-        if not st.genealogy_data:
-            for pcc in pcloneclasses:
-                v = CloneVersion(pcc, hash_, commitNr, number_pr, author_pr)
-                l = Lineage()
-                l.versions.append(v)
-                st.genealogy_data.append(l)
-        else:
-            for pcc in pcloneclasses:
-                found = False
-                for lineage in st.genealogy_data:
-                    if lineage.matches(pcc):
-
-                        if lineage.versions[-1].nr == commitNr:
-                            continue
+        hash_cache = st.hash_cache if st.hash_cache_commit == hash_ else None
+        namer = FunctionNamer() if settings.function_key_index else None
+        if pcloneclasses is None:
+            pcloneclasses = iterCloneClassFile(paths.clone_detector_xml, hash_cache, namer)
+        # Classes of this commit as folded, for the detection archive
+        archived: Optional[List[CloneClass]] = [] if ctx.archive is not None else None
+        threshold, rule = settings.match_threshold, settings.lineage_match_rule
+        # Fragment hashes of this commit, moved to the next one by RemapToCommit (remap_hash_cache)
+        next_cache: Dict[tuple, int] = {}
+
+        first_commit = st.lineage_count() == 0
+        # (previous class, new version) pairs whose patterns are classified in one batch below
+        pending: List[tuple] = []
+
+        # Sharded matching: candidate lineages of every class are computed up front against the
+        # pre-commit tips; lineages revived during the fold are matched here in the main process
+        sharded = (ctx.matcher is not None and not first_commit
+                   and len(st.genealogy_data) >= ctx.settings.match_parallel_min_lineages)
+        if sharded:
+            pcloneclasses = list(pcloneclasses)
+            by_id = {lineage.id: lineage for lineage in st.genealogy_data}
+            candidates = ctx.matcher.candidates(st.genealogy_data, pcloneclasses)
+            revived: List[Lineage] = []
+        try:
+            for index, pcc in enumerate(pcloneclasses):
+                for f in pcc.fragments:
+                    next_cache[(f.file, f.ls, f.le)] = f.hash
+                if archived is not None:
+                    archived.append(pcc)
+
+                if first_commit:
+                    _start_lineage(st, pcc, hash_, commitNr, number_pr, author_pr)
+                    continue
+
+                if st.retired is not None and len(st.retired):
+                    revived_now = _revive_lineages(st, pcc)
+                    if sharded:
+                        revived.extend(revived_now)
+
+                if ctx.settings.fingerprint_fast_path:
+                    lineage = st.fingerprints.get(pcc.fingerprint())
+                    if lineage is not None and lineage.versions[-1].nr != commitNr:
+                        # Identical files, line ranges and hashes as the lineage tip: Same/Same without the full scan
+                        _extend_lineage(st, lineage, CloneVersion(pcc, hash_, commitNr, number_pr, author_pr, "Same", "Same", 0, 0, 0))
+                        continue
+
+                if namer is not None:
+                    lineage = _lineage_by_function(st, pcc, commitNr)
+                    if lineage is not None:
+                        # Same function as a lineage tip: continue it without the SimHash scan
+                        version = CloneVersion(pcc, hash_, commitNr, number_pr, author_pr)
+                        pending.append((lineage.versions[-1].cloneclass, version))
+                        _extend_lineage(st, lineage, version)
+                        continue
+
+                if sharded:
+                    matching = [by_id[i] for i in candidates[index]] + [l for l in revived if l.matches(pcc, threshold)]
+                    if rule != "fragment":
+                        # shard candidates follow the fragment rule, a superset of the stricter rules
+                        matching = [l for l in matching if l.matches(pcc, threshold, rule)]
+                    matching.sort(key=lambda l: l.id)
+                else:
+                    matching = (lineage for lineage in st.genealogy_data if lineage.matches(pcc, threshold, rule))
 
-                        evolution, change, n_evo, n_change, clones_loc = GetPattern(lineage.versions[-1], CloneVersion(pcc, hash_, commitNr, number_pr, author_pr))
-                        lineage.versions.append(CloneVersion(pcc, hash_, commitNr, number_pr, author_pr, evolution, change, n_evo, n_change, clones_loc))
-                        found = True
-                        break
+                found = False
+                for lineage in matching:
+                    if lineage.versions[-1].nr == commitNr:
+                        continue
+
+                    version = CloneVersion(pcc, hash_, commitNr, number_pr, author_pr)
+                    pending.append((lineage.versions[-1].cloneclass, version))
+                    _extend_lineage(st, lineage, version)
+                    found = True
+                    break
                 if not found:
-                    v = CloneVersion(pcc, hash_, commitNr, number_pr, author_pr)
-                    l = Lineage()
-                    l.versions.append(v)
-                    st.genealogy_data.append(l)
+                    _start_lineage(st, pcc, hash_, commitNr, number_pr, author_pr)
+        finally:
+            # Matching only looks at fragments, so patterns can be filled in after the fold
+            patterns = GetPatterns([(previous, version.cloneclass) for previous, version in pending])
+            for (_, version), (evolution, change, n_evo, n_change, clones_loc) in zip(pending, patterns):
+                version.evolution_pattern = evolution
+                version.change_pattern = change
+                version.n_evo = n_evo
+                version.n_change = n_change
+                version.clones_loc = clones_loc
+
+        if archived is not None:
+            ctx.archive.record(commitNr, hash_, number_pr, author_pr, archived)
+
+        if st.retired is not None:
+            _retire_lineages(st, commitNr, ctx.settings.retire_after_commits)
+
+        if ctx.settings.reuse_fragment_hashes:
+            st.hash_cache = next_cache
+            st.hash_cache_commit = hash_
+        st.analyzed_commit = hash_
     except Exception as e:
         logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'RunGenealogyAnalysis' | Error: {e}")
 
 
+def _sampled_results_dir(ctx: "Context", hash_index: Optional[int] = None) -> str:
+    root = os.path.join(ctx.paths.ws_dir, "sampled_results")
+    return root if hash_index is None else os.path.join(root, str(hash_index))
+
+def DetectSampledCommit(ctx: "Context", commit_context: dict, hash_index: int, prefilter_rows: List[dict]) -> Optional[tuple]:
+    """
+    Detection pass of sampling mode: run NiCad on one commit and keep its result files
+    for the genealogy pass. Returns the class_signature of the commit, None on failure.
+    """
+    paths = ctx.paths
+    language, commit_pr, number_pr = commit_context["language"], commit_context["sha"], commit_context["pr_number"]
+    printInfo(f"Detecting clones in commit nr.{hash_index} (PR #{number_pr}) with hash {commit_pr}")
+    GitFecth(commit_pr, ctx, hash_index, logging)
+    MaybeTuneRepo(ctx, hash_index, logging)
+    GitCheckout(commit_pr, ctx, hash_index, logging)
+    if not PrepareSourceCode(ctx, language, hash_index, commit_pr):
+        logging.error(f"Don't have files '{language}' type in {ctx.git_url} (PR #{number_pr})")
+        return None
+    prefilter_rows.append(prefilter_row(ctx.staging.prefilter, number_pr, commit_pr, language))
+    if not RunCloneDetection(ctx, hash_index, language, commit_pr):
+        return None
+    try:
+        results_dir = _sampled_results_dir(ctx, hash_index)
+        os.makedirs(results_dir, exist_ok=True)
+        shutil.copy(paths.clone_detector_xml, results_dir)
+        return class_signature(iterCloneClassFile(paths.clone_detector_xml))
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'DetectSampledCommit' | Error: {e}")
+        return None
+
+def InterpolateCommit(ctx: "Context", commit_context: dict, commitNr: int, previous_nr: int):
+    """Same/Same versions at a skipped commit for every lineage whose tip is at `previous_nr`."""
+    st = ctx.state
+    for lineage in st.genealogy_data:
+        tip = lineage.versions[-1]
+        if tip.nr != previous_nr:
+            continue
+        version = CloneVersion(tip.cloneclass, commit_context["sha"], commitNr, commit_context["pr_number"],
+                               commit_context["pr_type"], "Same", "Same", 0, 0, 0)
+        version.sampling = INTERPOLATED
+        _extend_lineage(st, lineage, version)
+
+def FoldSampledCommit(ctx: "Context", commit_context: dict, hash_index: int, status: str) -> bool:
+    """
+    Genealogy pass of sampling mode: restage the commit (the fold and the density report
+    read the staged files) and run the genealogy analysis on its stored NiCad results.
+    """
+    paths, st = ctx.paths, ctx.state
+    language, commit_pr = commit_context["language"], commit_context["sha"]
+    GitCheckout(commit_pr, ctx, hash_index, logging)
+    if not PrepareSourceCode(ctx, language, hash_index, commit_pr):
+        return False
+    SanitizeStagedSources(ctx, language)
+
+    results_dir = _sampled_results_dir(ctx, hash_index)
+    shutil.copy(os.path.join(results_dir, os.path.basename(paths.clone_detector_xml)), paths.clone_detector_xml)
+
+    RemapToCommit(ctx, language, commit_pr, hash_index)
+    RunGenealogyAnalysis(ctx, hash_index, commit_pr, commit_context["pr_number"], commit_context["pr_type"], hash_index)
+    for lineage in st.genealogy_data:
+        if lineage.versions[-1].nr == hash_index:
+            lineage.versions[-1].sampling = status
+    return True
+
+def RunSampledGenealogy(ctx: "Context", merged_commits: List[dict], repo_name: str,
+                        prefilter_rows: List[dict], clone_density_rows: List[dict], sampling_rows: List[dict]):
+    status = plan_sampling(len(merged_commits), ctx.settings.sample_every,
+                           lambda index: DetectSampledCommit(ctx, merged_commits[index], index + 1, prefilter_rows))
+    detected = sum(1 for label in status.values() if label != INTERPOLATED)
+    refined = sum(1 for label in status.values() if label == REFINED)
+    printInfo(f"Sampling: clone detection ran on {detected} of {len(merged_commits)} commits ({refined} refined)")
+
+    previous_nr = None
+    for index, commit_context in enumerate(merged_commits):
+        hash_index = index + 1
+        label = status[index]
+        sampling_rows.append(sampling_row(hash_index, commit_context, label))
+        if label == FAILED:
+            continue
+        if label == INTERPOLATED:
+            if previous_nr is not None:
+                InterpolateCommit(ctx, commit_context, hash_index, previous_nr)
+                previous_nr = hash_index
+            continue
+
+        printInfo(f"Analyzing commit nr.{hash_index} (PR #{commit_context['pr_number']}) with hash "
+                  f"{commit_context['sha']} | {label}")
+        if not FoldSampledCommit(ctx, commit_context, hash_index, label):
+            continue
+        previous_nr = hash_index
+        WriteLineageFile(ctx, ctx.state.genealogy_data, ctx.paths.genealogy_xml)
+        clone_density_rows.append(compute_clone_density(ctx, commit_context["language"], repo_name, ctx.git_url,
+                                                        commit_context["pr_number"], commit_context["sha"],
+                                                        commit_context["pr_type"]))
+    safe_rmtree(_sampled_results_dir(ctx))
+
+# "Merge pull request #123 from …" (merge commits) or "Title (#123)" (squash merges)
+PR_NUMBER_RE = re.compile(r"(?:pull request #|\(#)(\d+)")
+
 def build_no_clones_message(detector: Optional[str]) -> str:
     detector_name = (detector or "unspecified").strip() or "unspecified"
 
@@ -291,14 +860,37 @@ def build_no_clones_message(detector: Optional[str]) -> str:
         reparsed = minidom.parseString(rough)
         return reparsed.toprettyxml(indent="  ", encoding="utf-8").decode("utf-8")
 
+def _iter_lineage_xml(lineages: List[Lineage], retired: Optional[RetiredLineageStore], compact: bool = False) -> Iterator[str]:
+    # Active and retired lineages merged back into creation order
+    if retired is None or not len(retired):
+        for lineage in lineages:
+            yield lineage.toXML(compact)
+        return
+    active = iter(lineages)
+    current = next(active, None)
+    for lineage_id, retired_xml in retired.iter_xml():
+        while current is not None and current.id < lineage_id:
+            yield current.toXML(compact)
+            current = next(active, None)
+        yield retired_xml
+    while current is not None:
+        yield current.toXML(compact)
+        current = next(active, None)
+
 def WriteLineageFile(ctx: "Context", lineages: List[Lineage], filename: str):
-    xml_txt = "<lineages>\n"
+    compact = ctx.settings.compact_lineage_xml
+    attributes = ' format="delta"' if compact else ""
+    if ctx.settings.commit_order != "pr_number":
+        attributes += f' order="{ctx.settings.commit_order}"'
+    root_tag = f"<lineages{attributes}>\n"
+    xml_txt = root_tag
     path_intro = ctx.paths.ws_dir.split("cloned_repositories/")[0]
+    retired = ctx.state.retired if lineages is ctx.state.genealogy_data else None
 
     with open(filename, "w+", encoding="utf-8") as output_file:
-        output_file.write("<lineages>\n")
-        for lineage in lineages:
-            lineage_xml = lineage.toXML().replace(path_intro, "")
+        output_file.write(root_tag)
+        for lineage_xml in _iter_lineage_xml(lineages, retired, compact):
+            lineage_xml = lineage_xml.replace(path_intro, "")
             output_file.write(lineage_xml)
             xml_txt += lineage_xml
         output_file.write("</lineages>\n")
@@ -306,6 +898,20 @@ def WriteLineageFile(ctx: "Context", lineages: List[Lineage], filename: str):
 
     return xml_txt
 
+def OrderCommits(ctx: "Context", merged_commits: List[dict], order: str) -> List[dict]:
+    """Reorder the commit contexts by git ancestry or committer date; falls back to the given order."""
+    try:
+        ordered = GitCommitOrder([c["sha"] for c in merged_commits], ctx, order)
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Function: 'OrderCommits' | Error: {e}")
+        printWarning(f"Could not compute {order} order, keeping PR number order")
+        return merged_commits
+    by_sha: Dict[str, List[dict]] = {}
+    for commit_context in merged_commits:
+        by_sha.setdefault(commit_context["sha"], []).append(commit_context)
+    printInfo(f"Commits analyzed in {order} order")
+    return [commit_context for sha in ordered for commit_context in by_sha[sha]]
+
 # =========================
 # Settings initialization from user dictionary
 # =========================
@@ -315,22 +921,12 @@ def _derive_repo_name(ctx: Context) -> str:
     Determine a stable repository folder name from git_url or local_path.
     Falls back to 'repo' if nothing can be inferred.
     """
-    url = (ctx.git_url or "").rstrip("/")
-    base = os.path.basename(url) or "repo"
-    if base.endswith(".git"):
-        base = base[:-4]
-    base = os.path.splitext(base)[0] or base
-    return base or "repo"
+    return repo_folder_name(ctx.git_url)
 
-@timed()
-def get_clone_genealogy(full_name, merged_commits) -> str:
-    # Sort merged_commits by pr_number
-    merged_commits = sorted(merged_commits, key=lambda x: x.get("pr_number", 0))
-    
-    git_url = full_name
-    paths = Paths()
-    state = State()
-    ctx = Context(git_url=git_url, paths=paths, state=state)
+def _setup_paths(ctx: Context, full_name: str) -> tuple:
+    """Fill ctx.paths for the project; returns (repo_name, repo_complete_name, base_dir)."""
+    paths = ctx.paths
+    repo_complete_name = full_name.split(".com/")[-1].replace("/","_")
 
     # --- NEW: make all folders live inside the installed package directory ---
     pkg_root = Path(__file__).resolve().parent
@@ -348,71 +944,436 @@ def get_clone_genealogy(full_name, merged_commits) -> str:
     # Results & detector output
     paths.clone_detector_dir = os.path.join(base_dir, "aggregated_results")
     paths.clone_detector_xml = os.path.join(paths.clone_detector_dir, "result.xml")
+    paths.timeout_ledger = os.path.join(genealogy_results_path, f"{repo_complete_name}_nicad_timeouts.csv")
+    paths.nicad_config = f"omniccg_{repo_name}"
 
     # Ensure folders exist
     os.makedirs(paths.clone_detector_dir, exist_ok=True)
     os.makedirs(base_dir, exist_ok=True)
+    return repo_name, repo_complete_name, base_dir
+
+def _open_stores(ctx: Context, base_dir: str):
+    """Stores shared by every language of a project run."""
+    if ctx.settings.match_workers > 1:
+        ctx.matcher = ShardedMatcher(ctx.settings.match_workers, ctx.settings.match_threshold)
+    if ctx.settings.use_commit_manifest:
+        ctx.manifest = ManifestStore(os.path.join(base_dir, "manifest.sqlite"), ctx.paths.repo_dir)
+
+def _close_stores(ctx: Context, runs: Optional[List["LanguageRun"]] = None):
+    for run in runs or []:
+        if run.ctx.archive is not None:
+            run.ctx.archive.close()
+            run.ctx.archive = None
+    if ctx.matcher is not None:
+        ctx.matcher.close()
+        ctx.matcher = None
+    if ctx.manifest is not None:
+        ctx.manifest.close()
+        ctx.manifest = None
 
-    print("STARTING DATA COLLECTION SCRIPT\n")
-    SetupRepo(ctx)
-    total_time = 0
-    hash_index = 0
-    total_commits = len(merged_commits)
-    clone_density_rows: List[dict] = []
+@dataclass
+class LanguageRun:
+    """Lineage state and report rows of one language of a project."""
+    language: str
+    ctx: Context
+    clone_density_rows: List[dict] = field(default_factory=list)
+    prefilter_rows: List[dict] = field(default_factory=list)
+    sampling_rows: List[dict] = field(default_factory=list)
+
+def _language_runs(ctx: Context, base_dir: str, languages: List[str], repo_complete_name: str,
+                   states: Optional[Dict[str, State]] = None, resume: bool = False) -> List[LanguageRun]:
+    """
+    One LanguageRun per language. With a single language the project context is used
+    as is; with several, each language gets its own State, staging stats and working
+    genealogy file, while the checkout, settings, matcher and manifest are shared.
+    """
+    runs = []
+    for language in languages:
+        if len(languages) == 1:
+            lang_ctx, suffix = ctx, ""
+        else:
+            suffix = f"_{language}"
+            paths = copy.copy(ctx.paths)
+            paths.genealogy_xml = os.path.join(base_dir, f"genealogy{suffix}.xml")
+            lang_ctx = dataclasses.replace(ctx, paths=paths, state=State(), staging=StagingStats())
+        if states is not None:
+            lang_ctx.state = states[language]
+        if ctx.settings.retire_after_commits is not None:
+            lang_ctx.state.retired = RetiredLineageStore(os.path.join(base_dir, f"retired_lineages{suffix}.sqlite"),
+                                                         compact_xml=ctx.settings.compact_lineage_xml,
+                                                         resume=resume)
+        if ctx.settings.archive_detection_results:
+            lang_ctx.archive = DetectionArchive(archive_path(os.path.join(genealogy_results_path, "detection_archives"),
+                                                             language, repo_complete_name),
+                                                resume=resume)
+            lang_ctx.archive.describe(ctx.settings, ctx.paths.repo_dir)
+        runs.append(LanguageRun(language, lang_ctx))
+    return runs
+
+def AnalyzeCommit(ctx: Context, commit_context: dict, hash_index: int, repo_name: str,
+                  prefilter_rows: List[dict], clone_density_rows: List[dict]) -> bool:
+    """Stage, detect and fold one language of the commit that is currently checked out."""
+    language = commit_context["language"]
+    author_pr = commit_context["pr_type"]
+    commit_pr = commit_context["sha"]
+    number_pr = commit_context["pr_number"]
+
+    # Prepare source code
+    if not PrepareSourceCode(ctx, language, hash_index, commit_pr):
+        logging.error(f"Don't have files '{language}' type in {ctx.git_url} (PR #{number_pr})")
+        return False
+    prefilter_rows.append(prefilter_row(ctx.staging.prefilter, number_pr, commit_pr, language))
 
-    for commit_context in merged_commits:
-        language = commit_context["language"]
-        author_pr = commit_context["pr_type"]
-        commit_pr = commit_context["sha"]
-        number_pr = commit_context["pr_number"]
-
-        iteration_start_time = time.time()
-        hash_index += 1
-
-        printInfo(
-            f"Analyzing commit nr.{hash_index} (PR #{number_pr}) with hash {commit_pr} | "
-            f"total commits: {total_commits} | author: {author_pr}"
-        )
-
-        # Ensure we are at the correct commit
-        GitFecth(commit_pr, ctx, hash_index, logging)
-        GitCheckout(commit_pr, ctx, hash_index, logging)
-
-        # Prepare source code
-        if not PrepareSourceCode(ctx, language, hash_index):
-            logging.error(f"Don't have files '{language}' type in {full_name} (PR #{number_pr})")
-            continue
+    if not RunCloneDetection(ctx, hash_index, language, commit_pr):
+        return False
 
-        RunCloneDetection(ctx, hash_index, language)
-        RunGenealogyAnalysis(ctx, hash_index, commit_pr, number_pr, author_pr, hash_index)
-        WriteLineageFile(ctx, ctx.state.genealogy_data, paths.genealogy_xml)
+    RemapToCommit(ctx, language, commit_pr, hash_index)
+    RunGenealogyAnalysis(ctx, hash_index, commit_pr, number_pr, author_pr, hash_index)
+    WriteLineageFile(ctx, ctx.state.genealogy_data, ctx.paths.genealogy_xml)
+
+    clone_density_by_repo = compute_clone_density(ctx, language, repo_name, ctx.git_url, number_pr, commit_pr, author_pr)
+    clone_density_rows.append(clone_density_by_repo)
+    return True
+
+def AnalyzeCommitLanguages(ctx: Context, runs: List[LanguageRun], commit_context: dict, hash_index: int,
+                           repo_name: str) -> bool:
+    """Fetch and check out the commit once, then analyze it for every language run."""
+    commit_pr = commit_context["sha"]
+    # Ensure we are at the correct commit
+    GitFecth(commit_pr, ctx, hash_index, logging)
+    MaybeTuneRepo(ctx, hash_index, logging)
+    GitCheckout(commit_pr, ctx, hash_index, logging)
+
+    analyzed = False
+    for run in runs:
+        language_context = dict(commit_context, language=run.language)
+        analyzed |= AnalyzeCommit(run.ctx, language_context, hash_index, repo_name,
+                                  run.prefilter_rows, run.clone_density_rows)
+    return analyzed
+
+def WriteGenealogyOutputs(run: LanguageRun, repo_complete_name: str) -> str:
+    language = run.language
+    genealogy_path = f"{genealogy_results_path}/{language}_{repo_complete_name}.xml"
+    WriteCloneDensity(run.clone_density_rows,
+                      language,
+                      repo_complete_name)
 
-        clone_density_by_repo = compute_clone_density(ctx, language, repo_name, git_url, number_pr, commit_pr, author_pr)
-        clone_density_rows.append(clone_density_by_repo)
+    WritePrefilterReport(run.prefilter_rows,
+                         language,
+                         repo_complete_name)
 
-        # Timing
-        iteration_end_time = time.time()
-        iteration_time = iteration_end_time - iteration_start_time
-        total_time += iteration_time
+    if run.sampling_rows:
+        WriteSamplingReport(run.sampling_rows,
+                            language,
+                            repo_complete_name)
 
-        print("Iteration finished in " + timeToString(int(iteration_time)))
-        avg = int(total_time / hash_index) if hash_index else 0
-        remaining = int((total_time / hash_index) * (len(merged_commits) - hash_index)) if hash_index else 0
-        print(" >>> Average iteration time: " + timeToString(avg))
-        print(" >>> Estimated remaining time: " + timeToString(remaining))
+    WriteLineageFile(run.ctx,
+                    run.ctx.state.genealogy_data,
+                    genealogy_path)
+    return genealogy_path
 
-    repo_complete_name = full_name.split(".com/")[-1].replace("/","_")
+def AddToCorpusIndex(ctx: Context, genealogy_paths: List[str]):
+    try:
+        index = CorpusIndex(ctx.settings.corpus_index_path)
+        try:
+            for genealogy_path in genealogy_paths:
+                index.add_project(genealogy_path)
+        finally:
+            index.close()
+        printInfo(f"Corpus index updated: {ctx.settings.corpus_index_path}")
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Function: 'AddToCorpusIndex' | Error: {e}")
 
-    if len(ctx.state.genealogy_data) == 0:
-        logging.error(f"Don't have code clones {full_name}")
-        return build_no_clones_message("nicad"), None, None
+def _checkpoint_path(base_dir: str) -> str:
+    return os.path.join(base_dir, "genealogy_state.pickle")
 
-    WriteCloneDensity(clone_density_rows,
-                      language,
-                      repo_complete_name)
+def SaveGenealogyCheckpoint(ctx: Context, base_dir: str, runs: List[LanguageRun], progress: dict):
+    try:
+        languages = {}
+        for run in runs:
+            # The retired store is a live SQLite connection; it stays on disk next to the checkpoint
+            if run.ctx.state.retired is not None:
+                run.ctx.state.retired.flush()
+            languages[run.language] = {"state": dataclasses.replace(run.ctx.state, retired=None),
+                                       "clone_density_rows": run.clone_density_rows,
+                                       "prefilter_rows": run.prefilter_rows,
+                                       "sampling_rows": run.sampling_rows}
+        save_checkpoint(_checkpoint_path(base_dir), {"settings": ctx.settings, "languages": languages, **progress})
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Function: 'SaveGenealogyCheckpoint' | Error: {e}")
+        printWarning(f"Could not save the genealogy checkpoint: {e}")
+
+def DetectedCloneClasses(ctx: "Context") -> List[CloneClass]:
+    """Clone classes of the current NiCad results, hashed and named as RunGenealogyAnalysis reads them."""
+    paths = ctx.paths
+    namer = FunctionNamer() if ctx.settings.function_key_index else None
+    return list(iterCloneClassFile(paths.clone_detector_xml, None, namer))
+
+def ArchiveRemap(ctx: "Context", archive: DetectionArchive, language: str, base: Optional[tuple],
+                 commit: str, hash_index: int):
+    """
+    Record the remap RemapToCommit would apply when folding `commit` after `base`
+    (analysis number, sha), the last commit of the language detected before it.
+    """
+    if base is None or base[1] == commit:
+        return
+    try:
+        remap = CommitRemap(GitDiffZeroContext(base[1], commit, ctx),
+                            ctx.paths.repo_dir,
+                            follow_lines=language in LINE_PRESERVING_LANGUAGES)
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'ArchiveRemap' | Error: {e}")
+        remap = None
+    archive.record_remap(hash_index, remap, base[0])
+
+def detect_commit_range(full_name, commits: List[dict], start_nr: int, archive_files: Dict[str, str],
+                        settings: Optional[Settings] = None, previous_sha: Optional[str] = None) -> int:
+    """
+    Commit-range job of the work queue: detect the clones of `commits` (analysis numbers
+    start_nr, start_nr + 1, ...) in every language of `archive_files` and record their
+    classes in that language's detection archive shard, without folding lineages. The
+    shards of a project are folded later in commit order (omniccg.queue_worker).
+    Each result is archived with its line remap from the previous detected commit
+    (`previous_sha`, number start_nr - 1, for the first one) and its clone density and
+    pre-filter report rows, so the fold reproduces a project run.
+    Returns the number of (commit, language) results archived.
+    """
+    ctx = Context(git_url=full_name, paths=Paths(), state=State(), settings=settings or Settings())
+    repo_name, repo_complete_name, base_dir = _setup_paths(ctx, full_name)
+    archives = {}
+    archived = 0
+    with HeldWorkspace(ctx, os.path.basename(base_dir)):
+        try:
+            _open_stores(ctx, base_dir)
+            archives = {language: DetectionArchive(path) for language, path in archive_files.items()}
+            for archive in archives.values():
+                archive.describe(ctx.settings, ctx.paths.repo_dir)
+            SetupRepo(ctx)
+            if ctx.settings.tune_repo:
+                TuneRepo(ctx, start_nr, logging)
+            # the fold keeps this remap only if the previous range detected `previous_sha`
+            base = {language: None for language in archives}
+            if previous_sha:
+                GitFecth(previous_sha, ctx, start_nr - 1, logging)
+                base = {language: (start_nr - 1, previous_sha) for language in archives}
+            for hash_index, commit_context in enumerate(commits, start=start_nr):
+                commit_pr, number_pr = commit_context["sha"], commit_context["pr_number"]
+                author_pr = commit_context["pr_type"]
+                printInfo(f"Detecting clones in commit nr.{hash_index} (PR #{number_pr}) with hash {commit_pr}")
+                GitFecth(commit_pr, ctx, hash_index, logging)
+                MaybeTuneRepo(ctx, hash_index, logging)
+                GitCheckout(commit_pr, ctx, hash_index, logging)
+                for language, archive in archives.items():
+                    if not PrepareSourceCode(ctx, language, hash_index, commit_pr):
+                        logging.error(f"Don't have files '{language}' type in {ctx.git_url} (PR #{number_pr})")
+                        continue
+                    archive.record_report(hash_index, "prefilter",
+                                          prefilter_row(ctx.staging.prefilter, number_pr, commit_pr, language))
+                    if not RunCloneDetection(ctx, hash_index, language, commit_pr):
+                        continue
+                    try:
+                        ArchiveRemap(ctx, archive, language, base[language], commit_pr, hash_index)
+                        archive.record(hash_index, commit_pr, number_pr, author_pr, DetectedCloneClasses(ctx))
+                        archive.record_report(hash_index, "clone_density",
+                                              compute_clone_density(ctx, language, repo_name, ctx.git_url,
+                                                                    number_pr, commit_pr, author_pr))
+                        base[language] = (hash_index, commit_pr)
+                        archived += 1
+                    except Exception as e:
+                        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'detect_commit_range' | Error: {e}")
+        finally:
+            for archive in archives.values():
+                archive.close()
+            _close_stores(ctx)
+            ReleaseScratch(ctx)
+    return archived
+
+@timed()
+def get_clone_genealogy(full_name, merged_commits, settings: Optional[Settings] = None) -> str:
+    # Sort merged_commits by pr_number
+    merged_commits = sorted(merged_commits, key=lambda x: x.get("pr_number", 0))
+    
+    git_url = full_name
+    paths = Paths()
+    state = State()
+    ctx = Context(git_url=git_url, paths=paths, state=state, settings=settings or Settings())
+    repo_name, repo_complete_name, base_dir = _setup_paths(ctx, full_name)
+    # the whole run, outputs and checkpoint included, holds the project workspace
+    with HeldWorkspace(ctx, os.path.basename(base_dir)):
+        runs = []
+        try:
+            _open_stores(ctx, base_dir)
+
+            print("STARTING DATA COLLECTION SCRIPT\n")
+            SetupRepo(ctx)
+            if ctx.settings.tune_repo:
+                TuneRepo(ctx, 0, logging)
+            if ctx.settings.commit_order != "pr_number":
+                merged_commits = OrderCommits(ctx, merged_commits, ctx.settings.commit_order)
+            total_time = 0
+            hash_index = 0
+            total_commits = len(merged_commits)
+            # Without explicit languages, the project is analyzed in the language of its PRs
+            languages = ctx.settings.languages or [c["language"] for c in merged_commits[-1:]]
+            runs = _language_runs(ctx, base_dir, languages, repo_complete_name)
+
+            if ctx.settings.sample_every and len(runs) == 1:
+                run = runs[0]
+                RunSampledGenealogy(ctx, merged_commits, repo_name, run.prefilter_rows, run.clone_density_rows, run.sampling_rows)
+                hash_index = total_commits
+            else:
+                if ctx.settings.sample_every:
+                    printWarning("Commit sampling runs in single-language mode only; analyzing every commit")
+                for commit_context in merged_commits:
+                    iteration_start_time = time.time()
+                    hash_index += 1
+
+                    printInfo(
+                        f"Analyzing commit nr.{hash_index} (PR #{commit_context['pr_number']}) with hash {commit_context['sha']} | "
+                        f"total commits: {total_commits} | author: {commit_context['pr_type']}"
+                    )
+                    if not AnalyzeCommitLanguages(ctx, runs, commit_context, hash_index, repo_name):
+                        continue
+
+                    # Timing
+                    iteration_end_time = time.time()
+                    iteration_time = iteration_end_time - iteration_start_time
+                    total_time += iteration_time
+
+                    print("Iteration finished in " + timeToString(int(iteration_time)))
+                    avg = int(total_time / hash_index) if hash_index else 0
+                    remaining = int((total_time / hash_index) * (len(merged_commits) - hash_index)) if hash_index else 0
+                    print(" >>> Average iteration time: " + timeToString(avg))
+                    print(" >>> Estimated remaining time: " + timeToString(remaining))
+        finally:
+            _close_stores(ctx, runs)
+            ReleaseScratch(ctx)
+
+        if sum(run.ctx.state.lineage_count() for run in runs) == 0:
+            logging.error(f"Don't have code clones {full_name}")
+            return build_no_clones_message("nicad"), None, None
+
+        genealogy_paths = []
+        for run in runs:
+            if run.ctx.state.lineage_count() == 0:
+                logging.error(f"Don't have code clones {full_name} ({run.language})")
+                continue
+            genealogy_paths.append(WriteGenealogyOutputs(run, repo_complete_name))
+        if ctx.settings.corpus_index_path:
+            AddToCorpusIndex(ctx, genealogy_paths)
+        if ctx.settings.write_checkpoint:
+            progress = {"hash_index": hash_index, "analyzed_shas": [c["sha"] for c in merged_commits],
+                        "boundary": _follow_boundary(ctx)}
+            SaveGenealogyCheckpoint(ctx, base_dir, runs, progress)
 
-    WriteLineageFile(ctx,
-                    ctx.state.genealogy_data,
-                    f"{genealogy_results_path}/{language}_{repo_complete_name}.xml")
+        print("\nDONE")
 
-    print("\nDONE")
+def _follow_boundary(ctx: Context, ref: str = "origin/HEAD") -> Optional[str]:
+    """
+    The commit `ref` resolves to once a batch is analyzed. The batch analyzes PR head
+    commits, which are not on the first-parent chain of `ref`, so follow mode starts
+    from this commit instead of from the analyzed SHAs.
+    """
+    try:
+        return GitResolveRef(ctx, ref)
+    except Exception as e:
+        logging.error(f"Project: {ctx.git_url} | Function: '_follow_boundary' | Error: {e}")
+        return None
+
+def _commit_context(sha: str, author: str, subject: str, full_name: str,
+                    pr_types: Dict[int, str]) -> Optional[dict]:
+    """Context of a merged commit, or None when it maps to no PR of known type (human / agent)."""
+    match = PR_NUMBER_RE.search(subject)
+    if not match or int(match.group(1)) not in pr_types:
+        return None
+    pr_number = int(match.group(1))
+    return {
+        "sha": sha,
+        "author": author,
+        "pr_number": pr_number,
+        "project": full_name,
+        "pr_type": pr_types[pr_number],
+    }
+
+def follow_clone_genealogy(full_name, pr_types: Dict[int, str], poll_interval: int = 300,
+                           max_polls: Optional[int] = None, ref: str = "origin/HEAD"):
+    """
+    Long-running mode: load the checkpoint written by get_clone_genealogy, then poll the
+    project clone for first-parent commits of `ref` past the commit it resolved to at the
+    previous batch and fold each one into the genealogy. `pr_types` maps PR numbers to
+    their type (human / agent); merges of other PRs and direct pushes are passed over,
+    since their authorship is unknown. Work per poll is proportional to the new commits;
+    the outputs and the checkpoint are rewritten after every poll that found some.
+    """
+    ctx = Context(git_url=full_name, paths=Paths(), state=State())
+    repo_name, repo_complete_name, base_dir = _setup_paths(ctx, full_name)
+    # a follower holds the workspace (and its checkpoint) for as long as it runs
+    with HeldWorkspace(ctx, os.path.basename(base_dir)):
+        checkpoint = load_checkpoint(_checkpoint_path(base_dir))
+        if checkpoint is None:
+            printError(f"No genealogy checkpoint for {full_name}; run the batch analysis first")
+            return
+        # The lineage state only stays consistent under the settings it was built with
+        ctx.settings = checkpoint["settings"]
+        saved = checkpoint["languages"]
+        progress = {"hash_index": checkpoint["hash_index"], "analyzed_shas": checkpoint["analyzed_shas"],
+                    "boundary": checkpoint.get("boundary")}
+        runs = []
+        try:
+            _open_stores(ctx, base_dir)
+            runs = _language_runs(ctx, base_dir, list(saved), repo_complete_name,
+                                  {language: saved[language]["state"] for language in saved}, resume=True)
+            for run in runs:
+                run.clone_density_rows = saved[run.language]["clone_density_rows"]
+                run.prefilter_rows = saved[run.language]["prefilter_rows"]
+                run.sampling_rows = saved[run.language]["sampling_rows"]
+            SetupRepo(ctx)
+            if ctx.settings.tune_repo:
+                TuneRepo(ctx, 0, logging)
+            printInfo(f"Following {full_name} ({', '.join(saved)}) from commit nr.{progress['hash_index']}")
+
+            polls = 0
+            while max_polls is None or polls < max_polls:
+                if polls:
+                    time.sleep(poll_interval)
+                polls += 1
+                try:
+                    GitFetchAll(ctx)
+                    head = GitResolveRef(ctx, ref)
+                    # checkpoints written before the boundary was recorded fall back to the analyzed SHAs
+                    boundary = [progress["boundary"]] if progress["boundary"] else progress["analyzed_shas"]
+                    new_commits = GitNewCommits(ctx, boundary, head)
+                except Exception as e:
+                    logging.error(f"Project: {full_name} | Function: 'follow_clone_genealogy' | Error: {e}")
+                    printWarning(f"Polling {full_name} failed: {e}")
+                    continue
+                progress["boundary"] = head
+                commit_contexts = [c for c in (_commit_context(sha, author, subject, full_name, pr_types)
+                                               for sha, author, subject in new_commits) if c is not None]
+                if len(commit_contexts) < len(new_commits):
+                    printInfo(f"Skipping {len(new_commits) - len(commit_contexts)} commits on {ref} without a human or agent PR")
+                if not commit_contexts:
+                    if new_commits:
+                        SaveGenealogyCheckpoint(ctx, base_dir, runs, progress)
+                    continue
+
+                printInfo(f"{len(commit_contexts)} new commits on {ref}")
+                for commit_context in commit_contexts:
+                    sha = commit_context["sha"]
+                    progress["hash_index"] += 1
+                    progress["analyzed_shas"].append(sha)
+                    printInfo(f"Analyzing commit nr.{progress['hash_index']} (PR #{commit_context['pr_number']}) with hash {sha}")
+                    AnalyzeCommitLanguages(ctx, runs, commit_context, progress["hash_index"], repo_name)
+                genealogy_paths = [WriteGenealogyOutputs(run, repo_complete_name)
+                                   for run in runs if run.ctx.state.lineage_count()]
+                if ctx.settings.corpus_index_path:
+                    AddToCorpusIndex(ctx, genealogy_paths)
+                SaveGenealogyCheckpoint(ctx, base_dir, runs, progress)
+        finally:
+            _close_stores(ctx, runs)
+            for run in runs:
+                if run.ctx.state.retired is not None:
+                    # uncommitted retirements belong to a poll the checkpoint does not cover
+                    run.ctx.state.retired.close()
+                    run.ctx.state.retired = None
+            ReleaseScratch(ctx)
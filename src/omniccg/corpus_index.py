@@ -0,0 +1,167 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from omniccg.hash_operations import HASH_BITS
+from omniccg.lineage_store import _to_sqlite_int
+from omniccg.shard_matching import max_hamming_distance
+from utils.genealogy_xml import parse_genealogy
+
+class CorpusMatch(NamedTuple):
+    project: str
+    lineage: int          # position of the lineage in the project's genealogy XML
+    first_version: int    # version nr range in which the fragment appears unchanged
+    last_version: int
+    author: str
+    file: str
+    startline: int
+    endline: int
+    hash: int
+    distance: int         # Hamming distance to the queried hash
+
+def band_ranges(n_bands: int) -> List[Tuple[int, int]]:
+    """(shift, width) of `n_bands` contiguous bit ranges covering the hash."""
+    ranges, shift = [], 0
+    for band in range(n_bands):
+        width = HASH_BITS // n_bands + (1 if band < HASH_BITS % n_bands else 0)
+        ranges.append((shift, width))
+        shift += width
+    return ranges
+
+def band_keys(h: int, ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    return [(band, (h >> shift) & ((1 << width) - 1)) for band, (shift, width) in enumerate(ranges)]
+
+def project_of(xml_path: str) -> Tuple[str, str]:
+    """(project, language) of a genealogy output named "<language>_<owner>_<repo>.xml"."""
+    project = Path(xml_path).stem
+    return project, project.split("_", 1)[0]
+
+def _fragment_rows(xml_path: str) -> List[list]:
+    """[lineage, first_version, last_version, author, file, startline, endline, hash] per distinct fragment."""
+    rows: Dict[tuple, list] = {}
+    root = parse_genealogy(xml_path).getroot()
+    for lineage_pos, lineage in enumerate(root.iter("lineage")):
+        for version in lineage.findall("version"):
+            nr = int(version.get("nr", 0))
+            for source in version.iter("source"):
+                key = (lineage_pos, source.get("file"), int(source.get("startline")), int(source.get("endline")),
+                       int(source.get("hash")))
+                if key in rows:
+                    rows[key][2] = nr
+                else:
+                    rows[key] = [lineage_pos, nr, nr, version.get("author", ""), *key[1:]]
+    return list(rows.values())
+
+class CorpusIndex:
+    """
+    Corpus-wide SQLite index of the fragment SimHashes of every project genealogy.
+    Hashes are split into max_hamming_distance(threshold) + 1 bands: by pigeonhole,
+    two hashes within the threshold agree exactly on at least one band, so a band
+    lookup followed by an exact Hamming check finds every near-duplicate. Projects
+    are (re)indexed one at a time, only when their XML changed.
+    """
+    def __init__(self, db_path: str, threshold: float = 0.90):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS projects "
+                          "(project TEXT PRIMARY KEY, language TEXT, xml_path TEXT, mtime REAL, size INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS fragments "
+                          "(id INTEGER PRIMARY KEY, project TEXT, lineage INTEGER, first_version INTEGER, "
+                          "last_version INTEGER, author TEXT, file TEXT, startline INTEGER, endline INTEGER, hash INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fragments_project ON fragments (project, lineage)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER, key INTEGER, fragment_id INTEGER, "
+                          "PRIMARY KEY (band, key, fragment_id)) WITHOUT ROWID")
+        stored = self.conn.execute("SELECT value FROM meta WHERE key = 'threshold'").fetchone()
+        if stored is None:
+            with self.conn:
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('threshold', ?)", (str(threshold),))
+        # The band layout is fixed when the index is created; queries stay exact down to this threshold
+        self.threshold = float(stored[0]) if stored else threshold
+        self.ranges = band_ranges(max_hamming_distance(self.threshold) + 1)
+
+    def add_project(self, xml_path: str, force: bool = False) -> bool:
+        """Index (or reindex) one genealogy XML; False when it is unchanged since the last insertion."""
+        project, language = project_of(xml_path)
+        stat = os.stat(xml_path)
+        known = self.conn.execute("SELECT mtime, size FROM projects WHERE project = ?", (project,)).fetchone()
+        if not force and known == (stat.st_mtime, stat.st_size):
+            return False
+        rows = _fragment_rows(xml_path)
+        with self.conn:
+            self._delete(project)
+            (last_id,) = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM fragments").fetchone()
+            ids = range(last_id + 1, last_id + 1 + len(rows))
+            self.conn.executemany(
+                "INSERT INTO fragments (id, project, lineage, first_version, last_version, author, file, startline, "
+                "endline, hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(i, project, *row[:-1], _to_sqlite_int(row[-1])) for i, row in zip(ids, rows)])
+            # sorted inserts keep the (band, key) B-tree appends local
+            self.conn.executemany("INSERT INTO bands (band, key, fragment_id) VALUES (?, ?, ?)",
+                                  sorted((band, key, i) for i, row in zip(ids, rows)
+                                         for band, key in band_keys(row[-1], self.ranges)))
+            self.conn.execute("INSERT OR REPLACE INTO projects (project, language, xml_path, mtime, size) "
+                              "VALUES (?, ?, ?, ?, ?)", (project, language, xml_path, stat.st_mtime, stat.st_size))
+        return True
+
+    def add_directory(self, directory: str) -> List[str]:
+        """Index every genealogy XML of `directory` that is new or changed; returns their projects."""
+        added = []
+        for xml_path in sorted(Path(directory).glob("*.xml")):
+            if self.add_project(str(xml_path)):
+                added.append(xml_path.stem)
+        return added
+
+    def _delete(self, project: str):
+        # band rows are keyed by (band, key, fragment id): recompute the keys from the stored hashes
+        self.conn.executemany("DELETE FROM bands WHERE band = ? AND key = ? AND fragment_id = ?",
+                              [(band, key, i) for i, h in self.conn.execute(
+                                  "SELECT id, hash FROM fragments WHERE project = ?", (project,)).fetchall()
+                               for band, key in band_keys(h & ((1 << HASH_BITS) - 1), self.ranges)])
+        self.conn.execute("DELETE FROM fragments WHERE project = ?", (project,))
+        self.conn.execute("DELETE FROM projects WHERE project = ?", (project,))
+
+    def query(self, h: int, threshold: Optional[float] = None, exclude_project: Optional[str] = None) -> List[CorpusMatch]:
+        """Indexed fragments whose SimHash matches `h` (match_hashes semantics), nearest first."""
+        max_dist = max_hamming_distance(self.threshold if threshold is None else max(threshold, self.threshold))
+        keys = band_keys(h, self.ranges)
+        where = " OR ".join("(b.band = ? AND b.key = ?)" for _ in keys)
+        params = [value for key in keys for value in key]
+        matches = []
+        for row in self.conn.execute(
+                "SELECT f.project, f.lineage, f.first_version, f.last_version, f.author, f.file, f.startline, "
+                f"f.endline, f.hash FROM fragments f WHERE f.id IN (SELECT b.fragment_id FROM bands b WHERE {where})",
+                params):
+            if row[0] == exclude_project:
+                continue
+            other = row[8] & ((1 << HASH_BITS) - 1)
+            distance = bin(h ^ other).count("1")
+            if distance <= max_dist:
+                matches.append(CorpusMatch(*row[:8], other, distance))
+        matches.sort(key=lambda m: (m.distance, m.project, m.lineage, m.first_version))
+        return matches
+
+    def project_fragments(self, project: str, lineage: Optional[int] = None) -> List[CorpusMatch]:
+        sql = ("SELECT project, lineage, first_version, last_version, author, file, startline, endline, hash "
+               "FROM fragments WHERE project = ?")
+        params: list = [project]
+        if lineage is not None:
+            sql += " AND lineage = ?"
+            params.append(lineage)
+        return [CorpusMatch(*row[:8], row[8] & ((1 << HASH_BITS) - 1), 0) for row in self.conn.execute(sql, params)]
+
+    def cross_project_matches(self, project: str, lineage: Optional[int] = None,
+                              author: Optional[str] = None) -> Iterable[Tuple[CorpusMatch, List[CorpusMatch]]]:
+        """(fragment, near-duplicates in other projects) for the fragments of a project (or one lineage)."""
+        for fragment in self.project_fragments(project, lineage):
+            if author is not None and fragment.author != author:
+                continue
+            matches = self.query(fragment.hash, exclude_project=project)
+            if matches:
+                yield fragment, matches
+
+    def projects(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT project FROM projects ORDER BY project")]
+
+    def close(self):
+        self.conn.close()
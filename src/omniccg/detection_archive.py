@@ -0,0 +1,150 @@
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from omniccg.CloneClass import CloneClass
+from omniccg.CloneFragment import CloneFragment
+from omniccg.line_remap import CommitRemap
+
+# Settings that decide how classes fold into lineages; recorded with the archive so a
+# replay folds the same way unless it overrides them
+FOLD_SETTINGS = ("match_threshold", "lineage_match_rule", "fingerprint_fast_path", "function_key_index",
+                 "remap_renamed_paths", "retire_after_commits", "sample_every")
+
+class ArchivedCommit(NamedTuple):
+    nr: int
+    sha: str
+    number_pr: object
+    author_pr: str
+    classes: List[CloneClass]
+    # RemapToCommit ran before the fold; `remap` is None when it had no usable diff
+    remapped: bool = False
+    remap: Optional[CommitRemap] = None
+    # analysis number of the commit the remap starts from, when it was recorded apart from the fold
+    remap_base: Optional[int] = None
+
+def _encode_classes(classes: List[CloneClass]) -> bytes:
+    # paths relative to the repository root, so archives do not depend on where the clone was
+    return json.dumps([[[f.path, f.ls, f.le, f.hash, f.function] for f in cc.fragments] for cc in classes],
+                      separators=(",", ":")).encode("utf-8")
+
+def _decode_classes(data: bytes, repo_dir: str) -> List[CloneClass]:
+    classes = []
+    for rows in json.loads(data):
+        cc = CloneClass()
+        # hashes are archived, so no source file is opened; absolute paths are files outside a
+        # staged tree (and every path of archives written before paths were made relative)
+        cc.fragments = [CloneFragment.in_repo("" if os.path.isabs(path) else repo_dir, path, ls, le, h, function)
+                        for path, ls, le, h, function in rows]
+        classes.append(cc)
+    return classes
+
+class DetectionArchive:
+    """
+    Per-project SQLite archive of the clone classes each analyzed commit folded into
+    the genealogy (files, line ranges, SimHashes and function names), the coordinate
+    remaps applied to lineage tips before each fold, and the fold settings, so lineages
+    can be rebuilt later without git or NiCad (omniccg.replay). Results are stored once
+    per distinct content, zlib-compressed; commits with an identical result, e.g.
+    consecutive PRs that did not touch any clone, point at the same row.
+    """
+    def __init__(self, db_path: str, resume: bool = False):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        if os.path.exists(db_path) and not resume:
+            os.remove(db_path)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY, digest TEXT UNIQUE, data BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS commits "
+                          "(nr INTEGER PRIMARY KEY, sha TEXT, number_pr TEXT, author_pr TEXT, result_id INTEGER)")
+        # data NULL: the remap failed and the tips were re-indexed at their own coordinates
+        self.conn.execute("CREATE TABLE IF NOT EXISTS remaps (nr INTEGER PRIMARY KEY, data BLOB, base_nr INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        # per-commit report rows (clone density, pre-filter) of commit-range shards
+        self.conn.execute("CREATE TABLE IF NOT EXISTS reports (nr INTEGER, kind TEXT, row TEXT, PRIMARY KEY (nr, kind))")
+
+    def describe(self, settings, repo_dir: str):
+        """Record the fold settings of the run and the repository root its fragment paths are under."""
+        meta = {"settings": {name: getattr(settings, name) for name in FOLD_SETTINGS}, "repo_dir": repo_dir}
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                  [(key, json.dumps(value)) for key, value in meta.items()])
+
+    def _meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def fold_settings(self) -> Optional[Dict[str, object]]:
+        """The FOLD_SETTINGS of the run, or None for an archive recorded before they were kept."""
+        return self._meta("settings")
+
+    def record_remap(self, nr: int, remap: Optional[CommitRemap], base_nr: Optional[int] = None):
+        data = None if remap is None else zlib.compress(json.dumps(
+            {"follow_lines": remap.follow_lines, "files": remap.rows()}, separators=(",", ":")).encode("utf-8"), 9)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO remaps (nr, data, base_nr) VALUES (?, ?, ?)", (nr, data, base_nr))
+
+    def record_report(self, nr: int, kind: str, row: dict):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO reports (nr, kind, row) VALUES (?, ?, ?)",
+                              (nr, kind, json.dumps(row, default=int)))
+
+    def reports(self, kind: str) -> List[dict]:
+        return [json.loads(row) for (row,) in
+                self.conn.execute("SELECT row FROM reports WHERE kind = ? ORDER BY nr", (kind,)).fetchall()]
+
+    def repo_dir(self) -> str:
+        """Repository root of the recorded run; archived fragment paths are relative to it."""
+        return self._meta("repo_dir") or ""
+
+    def _remaps(self, repo_dir: str) -> Dict[int, tuple]:
+        remaps = {}
+        for nr, data, base_nr in self.conn.execute("SELECT nr, data, base_nr FROM remaps").fetchall():
+            if data is None:
+                remaps[nr] = (None, base_nr)
+                continue
+            remap = json.loads(zlib.decompress(data))
+            remaps[nr] = (CommitRemap.from_rows(remap["files"], repo_dir, remap["follow_lines"]), base_nr)
+        return remaps
+
+    def record(self, nr: int, sha: str, number_pr, author_pr: str, classes: List[CloneClass]):
+        data = _encode_classes(classes)
+        digest = hashlib.sha1(data).hexdigest()
+        with self.conn:
+            row = self.conn.execute("SELECT id FROM results WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                result_id = self.conn.execute("INSERT INTO results (digest, data) VALUES (?, ?)",
+                                              (digest, zlib.compress(data, 9))).lastrowid
+            else:
+                result_id = row[0]
+            self.conn.execute("INSERT OR REPLACE INTO commits (nr, sha, number_pr, author_pr, result_id) "
+                              "VALUES (?, ?, ?, ?, ?)", (nr, sha, json.dumps(number_pr, default=int), author_pr, result_id))
+
+    def commits(self, repo_dir: Optional[str] = None) -> Iterator[ArchivedCommit]:
+        """
+        Archived commits in analysis order, with fragment paths (and remaps) under `repo_dir`,
+        by default the recorded root. Each distinct result is decompressed once in a row.
+        """
+        repo_dir = (repo_dir if repo_dir is not None else self.repo_dir()).rstrip("/")
+        remaps = self._remaps(repo_dir)
+        cached_id, cached_data = None, None
+        for nr, sha, number_pr, author_pr, result_id in self.conn.execute(
+                "SELECT nr, sha, number_pr, author_pr, result_id FROM commits ORDER BY nr").fetchall():
+            if result_id != cached_id:
+                (blob,) = self.conn.execute("SELECT data FROM results WHERE id = ?", (result_id,)).fetchone()
+                cached_id, cached_data = result_id, zlib.decompress(blob)
+            yield ArchivedCommit(nr, sha, json.loads(number_pr), author_pr, _decode_classes(cached_data, repo_dir),
+                                 nr in remaps, *remaps.get(nr, (None, None)))
+
+    def stats(self) -> dict:
+        (n_commits,) = self.conn.execute("SELECT COUNT(*) FROM commits").fetchone()
+        n_results, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM results").fetchone()
+        return {"commits": n_commits, "distinct_results": n_results, "compressed_bytes": size}
+
+    def close(self):
+        self.conn.close()
+
+def archive_path(archive_dir: str, language: str, repo_complete_name: str) -> str:
+    return os.path.join(archive_dir, f"{language}_{repo_complete_name}.sqlite")
@@ -0,0 +1,148 @@
+import os
+import re
+import pandas as pd
+from fnmatch import fnmatch
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from utils.folders_paths import genealogy_results_path
+
+# Repo-relative glob patterns ("/" separated); "*" also matches "/".
+DEFAULT_EXCLUDES = [
+    # migrations
+    "*/migrations/*", "*/db/migrate/*", "*/Migrations/*",
+    # generated protobuf / gRPC stubs and designer files
+    "*_pb2.py", "*_pb2_grpc.py", "*.pb.cs", "*Grpc.cs", "*.g.cs", "*.Designer.cs", "*_pb.rb", "*_services_pb.rb",
+    # vendored code
+    "*/vendor/*", "*/third_party/*", "*/third-party/*", "*/node_modules/*", "*/site-packages/*", "*/.venv/*",
+    # minified sources
+    "*.min.*",
+]
+
+# Banners that generators put in the first lines of the files they write; loose phrases
+# such as a bare "do not edit" also occur in hand-written license and header comments
+GENERATED_MARKERS = [
+    b"@generated",
+    b"auto-generated",
+    b"<auto-generated",
+    b"generated by the protocol buffer compiler",
+    b"this file was automatically generated",
+]
+# Go's convention: "// Code generated <tool>; DO NOT EDIT." on a single line
+GENERATED_BANNER_RE = re.compile(rb"code generated .* do not edit\.")
+
+GENERATED_HEADER_BYTES = 2048
+
+@dataclass
+class FilterRules:
+    include: List[str] = field(default_factory=list)  # empty → everything is included
+    exclude: List[str] = field(default_factory=lambda: list(DEFAULT_EXCLUDES))
+    max_file_bytes: Optional[int] = 1_000_000
+    max_line_length: Optional[int] = 1_000
+    detect_generated: bool = True
+    # grep patterns handed to NiCad's own include/exclude config fields
+    nicad_include: str = ""
+    nicad_exclude: str = ""
+
+@dataclass
+class FilterStats:
+    kept_files: int = 0
+    kept_bytes: int = 0
+    removed_files: int = 0
+    removed_bytes: int = 0
+    removed_by_reason: Dict[str, int] = field(default_factory=dict)
+
+    def remove(self, reason: str, size: int):
+        self.removed_files += 1
+        self.removed_bytes += size
+        self.removed_by_reason[reason] = self.removed_by_reason.get(reason, 0) + 1
+
+    def summary(self) -> str:
+        reasons = ", ".join(f"{k}: {v}" for k, v in sorted(self.removed_by_reason.items())) or "none"
+        return (f"Pre-filter kept {self.kept_files} files ({self.kept_bytes} bytes), "
+                f"removed {self.removed_files} files ({self.removed_bytes} bytes) | {reasons}")
+
+def _matches_any(rel_path: str, patterns: List[str]) -> bool:
+    # Prefixing "/" lets "*/vendor/*" also match a top-level "vendor/..." directory
+    anchored = "/" + rel_path
+    return any(fnmatch(rel_path, p) or fnmatch(anchored, p) for p in patterns)
+
+def is_generated(content: bytes) -> bool:
+    header = content[:GENERATED_HEADER_BYTES].lower()
+    return any(marker in header for marker in GENERATED_MARKERS) or GENERATED_BANNER_RE.search(header) is not None
+
+def has_long_lines(content: bytes, max_line_length: int) -> bool:
+    if len(content) <= max_line_length:
+        return False
+    return any(len(line) > max_line_length for line in content.split(b"\n"))
+
+class FileFilter:
+    """
+    Pre-flight filter applied while staging sources for NiCad.
+    Path rules are checked first, then size, then content (generated header, line length).
+    """
+    def __init__(self, rules: FilterRules):
+        self.rules = rules
+        self.stats = FilterStats()
+
+    def check_path(self, rel_path: str) -> Optional[str]:
+        rel_path = rel_path.replace(os.sep, "/")
+        if self.rules.include and not _matches_any(rel_path, self.rules.include):
+            return "not_included"
+        if _matches_any(rel_path, self.rules.exclude):
+            return "excluded"
+        return None
+
+    def check_content(self, content: bytes) -> Optional[str]:
+        if self.rules.max_file_bytes is not None and len(content) > self.rules.max_file_bytes:
+            return "too_large"
+        if self.rules.detect_generated and is_generated(content):
+            return "generated"
+        if self.rules.max_line_length is not None and has_long_lines(content, self.rules.max_line_length):
+            return "long_lines"
+        return None
+
+    def check(self, src: Path, rel_path: str) -> Tuple[Optional[str], Optional[bytes]]:
+        """
+        Returns (reason, content): `reason` is None when the file is kept,
+        in which case `content` holds its bytes so the caller does not re-read it.
+        """
+        reason = self.check_path(rel_path)
+        if reason is None and self.rules.max_file_bytes is not None:
+            size = src.stat().st_size
+            if size > self.rules.max_file_bytes:
+                self.stats.remove("too_large", size)
+                return "too_large", None
+        if reason is not None:
+            self.stats.remove(reason, src.stat().st_size)
+            return reason, None
+
+        content = src.read_bytes()
+        reason = self.check_content(content)
+        if reason is not None:
+            self.stats.remove(reason, len(content))
+            return reason, None
+
+        self.stats.kept_files += 1
+        self.stats.kept_bytes += len(content)
+        return None, content
+
+def prefilter_row(stats: FilterStats, number_pr, commit_pr, language) -> dict:
+    row = {
+        "pr_number": number_pr,
+        "commit_sha": commit_pr,
+        "language": language,
+        "kept_files": stats.kept_files,
+        "kept_bytes": stats.kept_bytes,
+        "removed_files": stats.removed_files,
+        "removed_bytes": stats.removed_bytes,
+    }
+    for reason, count in stats.removed_by_reason.items():
+        row[f"removed_{reason}"] = count
+    return row
+
+def WritePrefilterReport(prefilter_rows, language, repo_complete_name):
+    report_df = pd.DataFrame(prefilter_rows).fillna(0)
+    report_path = os.path.join(genealogy_results_path, f"{language}_{repo_complete_name}_prefilter.csv")
+    report_df.to_csv(report_path, index=False)
+    print(f"\nSaved pre-filter report to {report_path}")
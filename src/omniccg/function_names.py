@@ -0,0 +1,130 @@
+import ast
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Declarations that scope methods in the brace languages NiCad supports
+_BRACE_SCOPE_RE = re.compile(r"\b(?:class|interface|struct|record|enum|trait)\s+([A-Za-z_]\w*)")
+_CALL_NAME_RE = re.compile(r"([A-Za-z_]\w*)\s*\(")
+_NOT_FUNCTION_NAMES = {"if", "for", "foreach", "while", "switch", "catch", "return", "new", "sizeof", "using", "lock", "fixed"}
+_RB_SCOPE_RE = re.compile(r"^(\s*)(?:class|module)\s+([A-Z][\w:]*)")
+_RB_DEF_RE = re.compile(r"^\s*def\s+(?:self\.)?([^\s(;]+)")
+_RB_END_RE = re.compile(r"^(\s*)end\b")
+
+def _python_names(source: str) -> Dict[int, str]:
+    """def line → qualified name ("Class.method", "outer.inner")."""
+    names: Dict[int, str] = {}
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = prefix + child.name
+                names[child.lineno] = qualname
+                for decorator in child.decorator_list:
+                    names.setdefault(decorator.lineno, qualname)
+                visit(child, qualname + ".")
+            elif isinstance(child, ast.ClassDef):
+                visit(child, prefix + child.name + ".")
+            else:
+                visit(child, prefix)
+
+    visit(ast.parse(source), "")
+    return names
+
+def _brace_scope_table(lines: List[str]) -> List[Tuple[str, ...]]:
+    """For every line, the class-like declarations still open before it (brace counting)."""
+    table: List[Tuple[str, ...]] = []
+    stack: List[Tuple[int, str]] = []  # (depth inside the declaration, name)
+    names: Tuple[str, ...] = ()
+    pending: Optional[str] = None
+    depth = 0
+    for line in lines:
+        table.append(names)
+        match = _BRACE_SCOPE_RE.search(line)
+        if match:
+            pending = match.group(1)
+        if "{" not in line and "}" not in line:
+            continue
+        for ch in line:
+            if ch == "{":
+                depth += 1
+                if pending is not None:
+                    stack.append((depth, pending))
+                    pending = None
+            elif ch == "}":
+                while stack and stack[-1][0] >= depth:
+                    stack.pop()
+                depth = max(depth - 1, 0)
+        names = tuple(name for _, name in stack)
+    return table
+
+def _brace_function_name(lines: List[str], ls: int, le: int) -> Optional[str]:
+    header = " ".join(lines[ls - 1:min(le, ls + 4)]).split("{", 1)[0]
+    for match in _CALL_NAME_RE.finditer(header):
+        if match.group(1) not in _NOT_FUNCTION_NAMES:
+            return match.group(1)
+    return None
+
+def _ruby_scope_table(lines: List[str]) -> List[Tuple[Tuple[int, str], ...]]:
+    """For every line, the (indent, name) of the class/module blocks open before it."""
+    table: List[Tuple[Tuple[int, str], ...]] = []
+    stack: List[Tuple[int, str]] = []
+    for line in lines:
+        table.append(tuple(stack))
+        scope = _RB_SCOPE_RE.match(line)
+        end = _RB_END_RE.match(line)
+        if scope:
+            stack.append((len(scope.group(1)), scope.group(2)))
+        elif end and stack and stack[-1][0] == len(end.group(1)):
+            stack.pop()
+    return table
+
+class FunctionNamer:
+    """
+    Recovers the qualified name (enclosing classes + function name) of a NiCad
+    function fragment from the staged source file. Each file is read once.
+    Python uses the AST; brace languages and Ruby use lightweight scans, so
+    names are best-effort and None when nothing sensible is found.
+    """
+    def __init__(self):
+        self._lines: Dict[str, List[str]] = {}
+        self._python: Dict[str, Dict[int, str]] = {}
+        self._scopes: Dict[str, list] = {}
+
+    def _file_lines(self, file: str) -> List[str]:
+        if file not in self._lines:
+            try:
+                with open(file, "r", encoding="utf-8", errors="ignore") as f:
+                    self._lines[file] = f.read().splitlines()
+            except OSError:
+                self._lines[file] = []
+        return self._lines[file]
+
+    def qualified_name(self, file: str, ls: int, le: int) -> Optional[str]:
+        ext = Path(file).suffix.lower()
+        if ext == ".py":
+            if file not in self._python:
+                try:
+                    self._python[file] = _python_names("\n".join(self._file_lines(file)))
+                except (SyntaxError, ValueError):
+                    self._python[file] = {}
+            return self._python[file].get(ls)
+
+        lines = self._file_lines(file)
+        if not lines or ls > len(lines):
+            return None
+        if file not in self._scopes:
+            self._scopes[file] = _ruby_scope_table(lines) if ext == ".rb" else _brace_scope_table(lines)
+        scopes = self._scopes[file][ls - 1]
+
+        if ext == ".rb":
+            match = _RB_DEF_RE.match(lines[ls - 1])
+            if not match:
+                return None
+            indent = len(lines[ls - 1]) - len(lines[ls - 1].lstrip())
+            return ".".join([name for scope_indent, name in scopes if scope_indent < indent] + [match.group(1)])
+
+        name = _brace_function_name(lines, ls, le)
+        if name is None:
+            return None
+        return ".".join(scopes + (name,))
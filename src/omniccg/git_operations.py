@@ -108,6 +108,59 @@ def SetupRepo(ctx: "Context"):
     Repo.clone_from(git_url, paths.repo_dir)
     print(" Repository setup complete.\n")
 
+# Applied to every analyzed clone. The commit-graph (also rewritten by each fetch) speeds
+# up rev-list/log/merge-base, bitmaps speed up reachability walks and the untracked cache
+# speeds up checkout's worktree scan. Automatic gc is off: TuneRepo repacks between commits
+TUNING_CONFIG = [
+    ("core.commitGraph", "true"),
+    ("fetch.writeCommitGraph", "true"),
+    ("core.multiPackIndex", "true"),
+    ("pack.useBitmaps", "true"),
+    ("repack.writeBitmaps", "true"),
+    ("core.untrackedCache", "true"),
+    ("core.fsmonitor", "false"),
+    ("gc.auto", "0"),
+]
+
+def TuneRepo(ctx, hash_index, logging) -> bool:
+    """
+    Repository maintenance for a clone that is fetched into commit by commit: roll the
+    small packs and loose objects left by per-commit fetches into a geometric progression
+    of packs under one multi-pack-index with a bitmap, then refresh the commit-graph
+    (with changed-path filters) and the untracked cache.
+    """
+    repo_path = ctx.paths.repo_dir
+    ctx.fetches_since_tune = 0
+    print("  Tuning git repository (commit-graph, multi-pack-index, bitmaps) ...")
+    try:
+        for key, value in TUNING_CONFIG:
+            subprocess.run(["git", "config", key, value], cwd=repo_path, check=True, capture_output=True)
+        try:
+            subprocess.run(["git", "repack", "-d", "-q", "--geometric=2", "--write-midx", "--write-bitmap-index"],
+                           cwd=repo_path, check=True, capture_output=True)
+        except subprocess.CalledProcessError:
+            # git < 2.34 has no geometric repacking with a multi-pack bitmap
+            subprocess.run(["git", "repack", "-a", "-d", "-q", "--write-bitmap-index"],
+                           cwd=repo_path, check=True, capture_output=True)
+            subprocess.run(["git", "multi-pack-index", "write"], cwd=repo_path, check=True, capture_output=True)
+        subprocess.run(["git", "commit-graph", "write", "--reachable", "--split", "--changed-paths"],
+                       cwd=repo_path, check=True, capture_output=True)
+        subprocess.run(["git", "update-index", "--untracked-cache"], cwd=repo_path, check=True, capture_output=True)
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'TuneRepo' | Error: {e}")
+        printWarning(f"Git repository tuning encountered an issue: {e}")
+        return False
+
+def MaybeTuneRepo(ctx, hash_index, logging):
+    """Count one fetch; tune the repository every `repo_tune_every` fetches so git overhead stays flat."""
+    every = ctx.settings.repo_tune_every
+    if not ctx.settings.tune_repo or not every:
+        return
+    ctx.fetches_since_tune += 1
+    if ctx.fetches_since_tune >= every:
+        TuneRepo(ctx, hash_index, logging)
+
 def GitFecth(commit, ctx, hash_index, logging):
     repo_path = ctx.paths.repo_dir
     # Fetch the base commit
@@ -130,4 +183,85 @@ def GitCheckout(commit, ctx, hash_index, logging):
         print(f"  ✔ Checked out to commit {commit}")
     except subprocess.CalledProcessError as e:
         logging.error(f"Project: {ctx.git_url} | Index: {hash_index} | Function: 'GitCheckout' | Error: {e}")
-        printWarning(f"Git checkout encountered an issue: {e} | commit {commit}")
\ No newline at end of file
+        printWarning(f"Git checkout encountered an issue: {e} | commit {commit}")
+
+def GitDiffZeroContext(old_commit, new_commit, ctx) -> str:
+    """Unified diff with no context lines (`git diff -U0 -M`) between two commits, with rename detection."""
+    result = subprocess.run(
+        ["git", "diff", "-U0", "--no-color", "--no-ext-diff", "-M", old_commit, new_commit],
+        cwd=ctx.paths.repo_dir,
+        check=True,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    return result.stdout
+
+
+def GitFetchAll(ctx):
+    subprocess.run(["git", "fetch", "origin", "--prune"], cwd=ctx.paths.repo_dir, check=True, capture_output=True)
+
+def GitResolveRef(ctx, ref="origin/HEAD"):
+    """Full SHA of the commit `ref` currently points to."""
+    result = subprocess.run(["git", "rev-parse", "--verify", f"{ref}^{{commit}}"], cwd=ctx.paths.repo_dir,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+def GitNewCommits(ctx, seen_shas, ref="origin/HEAD"):
+    """
+    (sha, author, subject) of the first-parent commits of `ref` not reachable from
+    any of `seen_shas`, oldest first: with the `ref` commit recorded at the end of the
+    previous batch, the PRs merged since then.
+    """
+    repo_path = ctx.paths.repo_dir
+    resolved = _resolve_commits(list(dict.fromkeys(seen_shas)), repo_path) if seen_shas else {}
+    exclude = "".join(f"^{sha}\n" for sha in resolved.values() if sha is not None)
+    result = subprocess.run(["git", "log", "--first-parent", "--reverse", "--format=%H%x00%an%x00%s", ref, "--stdin"],
+                            cwd=repo_path, input=exclude, capture_output=True, text=True, check=True)
+    return [tuple(line.split("\0", 2)) for line in result.stdout.splitlines() if line]
+
+def _resolve_commits(shas, repo_path):
+    """Given SHA → full commit SHA, or None when the commit is not in the local repository."""
+    batch = "".join(f"{sha}^{{commit}}\n" for sha in shas)
+    result = subprocess.run(["git", "cat-file", "--batch-check"], cwd=repo_path,
+                            input=batch, capture_output=True, text=True, check=True)
+    return {sha: (None if line.endswith(" missing") else line.split()[0])
+            for sha, line in zip(shas, result.stdout.splitlines())}
+
+def GitCommitOrder(shas, ctx, order):
+    """
+    Order commit SHAs locally with git: "topology" (parents before children, as
+    `git rev-list --topo-order --reverse`) or "date" (committer date, oldest first).
+    Commits that cannot be found even after a fetch keep their given order at the end.
+    """
+    repo_path = ctx.paths.repo_dir
+    shas = list(dict.fromkeys(shas))
+    resolved = _resolve_commits(shas, repo_path)
+    missing = [sha for sha in shas if resolved[sha] is None]
+    if missing:
+        subprocess.run(["git", "fetch", "origin", *missing], cwd=repo_path, capture_output=True)
+        resolved.update(_resolve_commits(missing, repo_path))
+        missing = [sha for sha in shas if resolved[sha] is None]
+        if missing:
+            printWarning(f"{len(missing)} commits not found locally; they are analyzed last")
+    given = {}
+    for sha in shas:
+        if resolved[sha] is not None:
+            given.setdefault(resolved[sha], sha)
+    present = list(given)
+
+    if order == "topology":
+        result = subprocess.run(["git", "rev-list", "--topo-order", "--reverse", "--stdin"], cwd=repo_path,
+                                input="".join(f"{sha}\n" for sha in present),
+                                capture_output=True, text=True, check=True)
+        ordered = [sha for sha in result.stdout.split() if sha in given]
+    elif order == "date":
+        result = subprocess.run(["git", "log", "--no-walk=unsorted", "--format=%H %ct", "--stdin"], cwd=repo_path,
+                                input="".join(f"{sha}\n" for sha in present),
+                                capture_output=True, text=True, check=True)
+        dates = dict(line.split() for line in result.stdout.splitlines() if line.strip())
+        ordered = sorted(present, key=lambda sha: int(dates.get(sha, 0)))
+    else:
+        raise ValueError(f"Unknown commit order: {order}")
+    return [given[sha] for sha in ordered] + missing
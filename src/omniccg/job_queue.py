@@ -0,0 +1,168 @@
+import os
+import time
+import pickle
+import socket
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+class Job(NamedTuple):
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+    lease_owner: str
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class JobQueue(ABC):
+    """
+    Broker interface of the genealogy work queue. A worker leases a job, keeps the lease
+    alive with heartbeats while it runs, then completes or fails it; a job whose lease
+    expires (the worker died) is handed out again until it runs out of attempts. Jobs
+    only become leasable once every job they depend on is done.
+    """
+    @abstractmethod
+    def submit(self, kind: str, payload: dict, priority: float = 0.0, depends_on: Iterable[int] = (),
+               max_attempts: int = 3) -> int:
+        ...
+
+    @abstractmethod
+    def lease(self, worker: str, lease_seconds: float) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float) -> bool:
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: int, worker: str, result=None) -> bool:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        ...
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        ...
+
+    def close(self):
+        pass
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Reference broker: one SQLite file, for a single machine, for tests, or for several
+    boxes sharing a filesystem whose locking SQLite supports. Every state change is one
+    IMMEDIATE transaction, so two workers never lease the same job. Payloads and
+    results are pickled (they carry Settings and commit lists).
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # one connection shared with the worker's heartbeat thread, serialized by a lock
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, kind TEXT, payload BLOB, "
+                          "priority REAL, status TEXT, attempts INTEGER, max_attempts INTEGER, lease_owner TEXT, "
+                          "lease_expires REAL, result BLOB, error TEXT, updated REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS job_deps (job_id INTEGER, dep_id INTEGER, "
+                          "PRIMARY KEY (job_id, dep_id)) WITHOUT ROWID")
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def submit(self, kind: str, payload: dict, priority: float = 0.0, depends_on: Iterable[int] = (),
+               max_attempts: int = 3) -> int:
+        with self._transaction() as conn:
+            job_id = conn.execute(
+                "INSERT INTO jobs (kind, payload, priority, status, attempts, max_attempts, updated) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (kind, pickle.dumps(payload, pickle.HIGHEST_PROTOCOL), priority, PENDING, max_attempts,
+                 time.time())).lastrowid
+            conn.executemany("INSERT INTO job_deps (job_id, dep_id) VALUES (?, ?)",
+                             [(job_id, dep_id) for dep_id in depends_on])
+        return job_id
+
+    def lease(self, worker: str, lease_seconds: float) -> Optional[Job]:
+        """The highest-priority ready job, leased to `worker`; None when nothing is ready."""
+        now = time.time()
+        with self._transaction() as conn:
+            # jobs waiting on a failed job can never run, nor can the jobs waiting on them
+            while conn.execute("UPDATE jobs SET status = ?, error = 'dependency failed', updated = ? "
+                               "WHERE status = ? AND EXISTS (SELECT 1 FROM job_deps d JOIN jobs p ON p.id = d.dep_id "
+                               "WHERE d.job_id = jobs.id AND p.status = ?)", (FAILED, now, PENDING, FAILED)).rowcount:
+                pass
+            # expired leases of jobs without attempts left are failed rather than retried
+            conn.execute("UPDATE jobs SET status = ?, error = 'lease expired', updated = ? "
+                         "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                         (FAILED, now, LEASED, now))
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs j "
+                "WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND NOT EXISTS ("
+                "SELECT 1 FROM job_deps d JOIN jobs p ON p.id = d.dep_id WHERE d.job_id = j.id AND p.status != ?) "
+                "ORDER BY priority DESC, id LIMIT 1", (PENDING, LEASED, now, DONE)).fetchone()
+            if row is None:
+                return None
+            job_id, kind, payload, attempts = row
+            conn.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, "
+                         "lease_expires = ?, updated = ? WHERE id = ?",
+                         (LEASED, worker, now + lease_seconds, now, job_id))
+        return Job(job_id, kind, pickle.loads(payload), attempts + 1, worker)
+
+    def _update_leased(self, job_id: int, worker: str, assignments: str, params: tuple) -> bool:
+        """Apply an update only while `worker` still holds the lease of the job."""
+        with self._transaction() as conn:
+            cursor = conn.execute(f"UPDATE jobs SET {assignments}, updated = ? "
+                                  "WHERE id = ? AND status = ? AND lease_owner = ?",
+                                  (*params, time.time(), job_id, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float) -> bool:
+        return self._update_leased(job_id, worker, "lease_expires = ?", (time.time() + lease_seconds,))
+
+    def complete(self, job_id: int, worker: str, result=None) -> bool:
+        return self._update_leased(job_id, worker, "status = ?, result = ?",
+                                   (DONE, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)))
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        """Record a failed attempt: back to pending while attempts remain, else failed for good."""
+        return self._update_leased(job_id, worker,
+                                   "status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                                   "lease_owner = NULL, lease_expires = NULL, error = ?",
+                                   (PENDING, FAILED, error))
+
+    def result(self, job_id: int):
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return pickle.loads(row[0]) if row and row[0] is not None else None
+
+    def jobs(self) -> List[dict]:
+        with self.lock:
+            rows = self.conn.execute("SELECT id, kind, priority, status, attempts, lease_owner, error "
+                                     "FROM jobs ORDER BY id").fetchall()
+        return [dict(zip(("id", "kind", "priority", "status", "attempts", "lease_owner", "error"), row)) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        with self.lock:
+            counts.update(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return counts
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,151 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Languages staged verbatim for NiCad (no sanitizer in RunCloneDetection), so git line
+# numbers are NiCad line numbers. Sanitized languages only reuse hashes of untouched files.
+LINE_PRESERVING_LANGUAGES = {"c", "java", "php"}
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+Hunk = Tuple[int, int, int, int]  # old_start, old_count, new_start, new_count
+
+def _header_path(line: str) -> Optional[str]:
+    # Unless the file was renamed the header is "diff --git a/<path> b/<path>" with the same path twice
+    rest = line[len("diff --git a/"):]
+    half = (len(rest) - len(" b/")) // 2
+    path = rest[:half]
+    if line.startswith("diff --git a/") and rest == f"{path} b/{path}":
+        return path
+    return None
+
+def _rename_path(line: str, marker: str) -> str:
+    path = line[len(marker):]
+    if path.startswith('"'):
+        raise ValueError(f"Unsupported quoted path in diff: {line}")
+    return path
+
+class FileDiff:
+    def __init__(self, old_path: Optional[str]):
+        self.old_path = old_path
+        self.new_path: Optional[str] = old_path
+        self.hunks: List[Hunk] = []
+
+    def map_range(self, ls: int, le: int) -> Optional[Tuple[int, int]]:
+        """
+        New coordinates of old lines ls..le, or None when a hunk touches them
+        (or the file was deleted). Hunks before the range shift it by their size delta.
+        """
+        if self.new_path is None:
+            return None
+        shift = 0
+        for old_start, old_count, new_start, new_count in self.hunks:
+            if old_count == 0:
+                # pure insertion after old line `old_start`
+                if old_start >= le:
+                    break
+                if old_start >= ls:
+                    return None
+            else:
+                old_end = old_start + old_count - 1
+                if old_start > le:
+                    break
+                if old_end >= ls:
+                    return None
+            shift += new_count - old_count
+        return ls + shift, le + shift
+
+def parse_zero_context_diff(diff_text: str) -> Dict[str, FileDiff]:
+    """
+    Per old path, the rename target and hunks of a `git diff -U0 -M` output.
+    Raises ValueError on entries it cannot attribute to a path (e.g. quoted paths).
+    """
+    files: Dict[str, FileDiff] = {}
+    current: Optional[FileDiff] = None
+
+    def close(diff: Optional[FileDiff]):
+        if diff is None:
+            return
+        if diff.old_path is None:
+            raise ValueError("Diff entry without a parsable path")
+        files[diff.old_path] = diff
+
+    for line in diff_text.splitlines():
+        if line.startswith("diff --git "):
+            close(current)
+            current = FileDiff(_header_path(line))
+        elif current is None:
+            continue
+        elif line.startswith("rename from "):
+            current.old_path = _rename_path(line, "rename from ")
+        elif line.startswith("rename to "):
+            current.new_path = _rename_path(line, "rename to ")
+        elif line.startswith("deleted file mode"):
+            current.new_path = None
+        elif line.startswith("@@"):
+            match = _HUNK_RE.match(line)
+            if match:
+                old_start, old_count, new_start, new_count = match.groups()
+                current.hunks.append((int(old_start), 1 if old_count is None else int(old_count),
+                                      int(new_start), 1 if new_count is None else int(new_count)))
+    close(current)
+    return files
+
+class CommitRemap:
+    """
+    Maps fragment coordinates (file, startline, endline) of one commit to the next.
+    Files outside the diff keep their coordinates and renamed files take their new
+    path. With `follow_lines`, ranges in modified files are shifted past the hunks
+    above them; otherwise only files without hunks (untouched or pure renames) map.
+    """
+    def __init__(self, diff_text: str, repo_dir: str, follow_lines: bool):
+        self.changed = parse_zero_context_diff(diff_text)
+        self.prefix = repo_dir.rstrip("/") + "/"
+        self.follow_lines = follow_lines
+
+    def rows(self) -> List[list]:
+        """[old path, new path, hunks] per changed file, relative to the repository (see from_rows)."""
+        return [[d.old_path, d.new_path, d.hunks] for d in self.changed.values()]
+
+    @classmethod
+    def from_rows(cls, rows: List[list], repo_dir: str, follow_lines: bool) -> "CommitRemap":
+        remap = cls("", repo_dir, follow_lines)
+        for old_path, new_path, hunks in rows:
+            diff = FileDiff(old_path)
+            diff.new_path = new_path
+            diff.hunks = [tuple(hunk) for hunk in hunks]
+            remap.changed[old_path] = diff
+        return remap
+
+    def renames(self) -> Dict[str, str]:
+        return {d.old_path: d.new_path for d in self.changed.values()
+                if d.new_path is not None and d.new_path != d.old_path}
+
+    def map_path(self, file: str) -> Optional[str]:
+        """Path of `file` in the new commit (renames followed), or None if it was deleted."""
+        diff = self.changed.get(file[len(self.prefix):]) if file.startswith(self.prefix) else None
+        if diff is None:
+            return file
+        return None if diff.new_path is None else self.prefix + diff.new_path
+
+    def map_fragment(self, file: str, ls: int, le: int) -> Optional[Tuple[str, int, int]]:
+        diff = self.changed.get(file[len(self.prefix):]) if file.startswith(self.prefix) else None
+        if diff is None:
+            return file, ls, le
+        if diff.hunks and not self.follow_lines:
+            return None
+        new_range = diff.map_range(ls, le)
+        if new_range is None:
+            return None
+        return self.prefix + diff.new_path, new_range[0], new_range[1]
+
+def remap_hash_cache(cache: Dict[tuple, int], remap: CommitRemap) -> Dict[tuple, int]:
+    """
+    Carry a (file, startline, endline) → fragment hash cache from one commit to the next.
+    Fragments that cannot be mapped are dropped so that they are hashed again.
+    """
+    carried: Dict[tuple, int] = {}
+    for (file, ls, le), fragment_hash in cache.items():
+        mapped = remap.map_fragment(file, ls, le)
+        if mapped is not None:
+            carried[mapped] = fragment_hash
+    return carried
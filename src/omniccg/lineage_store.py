@@ -0,0 +1,72 @@
+import os
+import pickle
+import sqlite3
+from typing import Iterable, Iterator, List, Tuple
+from omniccg.Lineage import Lineage
+
+def _to_sqlite_int(h: int) -> int:
+    # SimHashes are unsigned 64-bit; SQLite integers are signed
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+class RetiredLineageStore:
+    """
+    On-disk (SQLite) store for lineages that left the active matching set.
+    Each retired lineage keeps its pickled state, its serialized XML (so output
+    files can be written without unpickling) and the hashes of its tip fragments,
+    which are the only way back into the active set. With `resume` an existing
+    store is reopened (continuing a checkpointed run) instead of recreated.
+    """
+    def __init__(self, db_path: str, compact_xml: bool = False, resume: bool = False):
+        self.db_path = db_path
+        self.compact_xml = compact_xml
+        if os.path.exists(db_path) and not resume:
+            os.remove(db_path)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS lineages (id INTEGER PRIMARY KEY, data BLOB, xml TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tip_hashes (hash INTEGER, lineage_id INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tip_hashes_hash ON tip_hashes (hash)")
+        (self.size,) = self.conn.execute("SELECT COUNT(*) FROM lineages").fetchone()
+
+    def __len__(self):
+        return self.size
+
+    def retire(self, lineage: Lineage):
+        self.conn.execute("INSERT INTO lineages (id, data, xml) VALUES (?, ?, ?)",
+                          (lineage.id, pickle.dumps(lineage, pickle.HIGHEST_PROTOCOL), lineage.toXML(self.compact_xml)))
+        self.conn.executemany("INSERT INTO tip_hashes (hash, lineage_id) VALUES (?, ?)",
+                              [(_to_sqlite_int(f.hash), lineage.id) for f in lineage.versions[-1].cloneclass.fragments])
+        self.size += 1
+
+    def revive(self, hashes: Iterable[int]) -> List[Lineage]:
+        """Remove and return every retired lineage whose tip has a fragment with one of `hashes`."""
+        if not self.size:
+            return []
+        keys = list({_to_sqlite_int(h) for h in hashes})
+        if not keys:
+            return []
+        placeholders = ",".join("?" * len(keys))
+        ids = [row[0] for row in self.conn.execute(
+            f"SELECT DISTINCT lineage_id FROM tip_hashes WHERE hash IN ({placeholders})", keys)]
+        revived = []
+        for lineage_id in ids:
+            (data,) = self.conn.execute("SELECT data FROM lineages WHERE id = ?", (lineage_id,)).fetchone()
+            revived.append(pickle.loads(data))
+            self.conn.execute("DELETE FROM lineages WHERE id = ?", (lineage_id,))
+            self.conn.execute("DELETE FROM tip_hashes WHERE lineage_id = ?", (lineage_id,))
+        self.size -= len(revived)
+        return revived
+
+    def iter_xml(self) -> Iterator[Tuple[int, str]]:
+        """(lineage id, lineage XML) of every retired lineage, in id (creation) order."""
+        yield from self.conn.execute("SELECT id, xml FROM lineages ORDER BY id")
+
+    def iter_lineages(self) -> Iterator[Lineage]:
+        for (data,) in self.conn.execute("SELECT data FROM lineages ORDER BY id"):
+            yield pickle.loads(data)
+
+    def flush(self):
+        """Commit pending changes, e.g. before a checkpoint refers to the current contents."""
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import subprocess
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+class ManifestEntry(NamedTuple):
+    path: str  # repo-relative, "/" separated
+    blob: str
+    size: int
+    loc: int
+
+def is_source_candidate(rel_path: str, language: str) -> bool:
+    """Same selection PrepareSourceCode applies: language suffix, no "test" in the name, nothing under .git."""
+    parts = rel_path.split("/")
+    name_lower = parts[-1].lower()
+    return name_lower.endswith(language) and "test" not in name_lower and ".git" not in parts
+
+def count_lines(content: bytes) -> int:
+    # Same count as len(file.readlines())
+    if not content:
+        return 0
+    return content.count(b"\n") + (0 if content.endswith(b"\n") else 1)
+
+def _ls_tree(repo_dir: str, commit: str) -> List[tuple]:
+    """(path, blob sha, size) of every regular or symlinked blob at `commit`."""
+    output = subprocess.run(["git", "ls-tree", "-r", "-l", "-z", commit],
+                            cwd=repo_dir, check=True, capture_output=True).stdout
+    entries = []
+    for record in output.split(b"\0"):
+        if not record:
+            continue
+        meta, path = record.split(b"\t", 1)
+        mode, kind, blob, size = meta.split()
+        if kind != b"blob":
+            continue  # submodules
+        entries.append((path.decode("utf-8", "surrogateescape"), blob.decode(), int(size)))
+    return entries
+
+def _blob_line_counts(repo_dir: str, blobs: List[str]) -> Dict[str, int]:
+    """LOC of each blob, read in one `git cat-file --batch` stream."""
+    counts: Dict[str, int] = {}
+    if not blobs:
+        return counts
+    process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=repo_dir,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        for blob in blobs:
+            process.stdin.write(f"{blob}\n".encode())
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+            if len(header) < 3 or header[1] == b"missing":
+                continue
+            content = process.stdout.read(int(header[2]))
+            process.stdout.read(1)  # trailing newline
+            counts[blob] = count_lines(content)
+    finally:
+        process.stdin.close()
+        process.wait()
+    return counts
+
+class ManifestStore:
+    """
+    Per-project SQLite index of the source files of each analyzed commit, built once
+    per (SHA, language) from `git ls-tree -r -l`. LOC is stored per blob SHA, so a
+    file is only counted the first time its content appears in the history.
+    The tree of the last commit is kept, so several languages share one ls-tree.
+    """
+    def __init__(self, db_path: str, repo_dir: str):
+        self.repo_dir = repo_dir
+        self._tree: Optional[tuple] = None  # (commit, _ls_tree entries)
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS blobs (blob TEXT PRIMARY KEY, loc INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS manifests "
+                          "(commit_sha TEXT, language TEXT, path TEXT, blob TEXT, size INTEGER, "
+                          "PRIMARY KEY (commit_sha, language, path))")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS built (commit_sha TEXT, language TEXT, "
+                          "PRIMARY KEY (commit_sha, language))")
+
+    def build(self, commit: str, language: str) -> List[ManifestEntry]:
+        built = self.conn.execute("SELECT 1 FROM built WHERE commit_sha = ? AND language = ?",
+                                  (commit, language)).fetchone()
+        if not built:
+            if self._tree is None or self._tree[0] != commit:
+                self._tree = (commit, _ls_tree(self.repo_dir, commit))
+            rows = [(path, blob, size) for path, blob, size in self._tree[1]
+                    if is_source_candidate(path, language)]
+            known = set()
+            blobs = list({blob for _, blob, _ in rows})
+            for i in range(0, len(blobs), 500):
+                chunk = blobs[i:i + 500]
+                known.update(b for (b,) in self.conn.execute(
+                    f"SELECT blob FROM blobs WHERE blob IN ({','.join('?' * len(chunk))})", chunk))
+            counts = _blob_line_counts(self.repo_dir, [b for b in blobs if b not in known])
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO blobs (blob, loc) VALUES (?, ?)", counts.items())
+                self.conn.executemany("INSERT OR REPLACE INTO manifests (commit_sha, language, path, blob, size) "
+                                      "VALUES (?, ?, ?, ?, ?)",
+                                      [(commit, language, path, blob, size) for path, blob, size in rows])
+                self.conn.execute("INSERT OR REPLACE INTO built (commit_sha, language) VALUES (?, ?)", (commit, language))
+        return self.entries(commit, language)
+
+    def entries(self, commit: str, language: str) -> List[ManifestEntry]:
+        return [ManifestEntry(*row) for row in self.conn.execute(
+            "SELECT m.path, m.blob, m.size, COALESCE(b.loc, 0) FROM manifests m LEFT JOIN blobs b ON b.blob = m.blob "
+            "WHERE m.commit_sha = ? AND m.language = ? ORDER BY m.path", (commit, language))]
+
+    def loc(self, commit: str, language: str, paths: Optional[Iterable[str]] = None) -> int:
+        """Total LOC of the manifest, or of `paths` only (e.g. the files that were staged)."""
+        entries = self.entries(commit, language)
+        if paths is not None:
+            wanted = set(paths)
+            entries = [e for e in entries if e.path in wanted]
+        return sum(e.loc for e in entries)
+
+    def close(self):
+        self.conn.close()
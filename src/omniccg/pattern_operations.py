@@ -0,0 +1,53 @@
+import numpy as np
+from typing import List, Tuple
+from omniccg.CloneClass import CloneClass
+
+def GetPatterns(pairs: List[Tuple[CloneClass, CloneClass]]) -> List[Tuple[str, str, int, int, int]]:
+    """
+    Batch version of core.GetPattern for every (previous class, new class) pair
+    matched in one commit. Fragment hashes and LOC of all pairs are flattened
+    into arrays and classified in a single vectorized pass.
+    Returns one (evolution, change, n_evo, n_change, clones_loc) tuple per pair,
+    identical to what GetPattern returns for the same pair.
+    """
+    n = len(pairs)
+    if n == 0:
+        return []
+
+    v1_sizes = np.fromiter((len(v1.fragments) for v1, _ in pairs), dtype=np.int64, count=n)
+    v2_sizes = np.fromiter((len(v2.fragments) for _, v2 in pairs), dtype=np.int64, count=n)
+    n1, n2 = int(v1_sizes.sum()), int(v2_sizes.sum())
+
+    v1_hashes = np.fromiter((f.hash for v1, _ in pairs for f in v1.fragments), dtype=np.uint64, count=n1)
+    v2_hashes = np.fromiter((f.hash for _, v2 in pairs for f in v2.fragments), dtype=np.uint64, count=n2)
+    v1_loc = np.fromiter((f.le - f.ls for v1, _ in pairs for f in v1.fragments), dtype=np.int64, count=n1)
+    v2_loc = np.fromiter((f.le - f.ls for _, v2 in pairs for f in v2.fragments), dtype=np.int64, count=n2)
+    v1_pair = np.repeat(np.arange(n, dtype=np.int64), v1_sizes)
+    v2_pair = np.repeat(np.arange(n, dtype=np.int64), v2_sizes)
+
+    # Number of new fragments whose hash appears among the previous fragments of the same pair.
+    # Hashes are mapped to dense ids so that (pair, hash) fits in a single int64 key.
+    _, hash_ids = np.unique(np.concatenate([v1_hashes, v2_hashes]), return_inverse=True)
+    hash_ids = hash_ids.reshape(-1).astype(np.int64)
+    n_ids = int(hash_ids.max()) + 1 if hash_ids.size else 1
+    v1_keys = v1_pair * n_ids + hash_ids[:n1]
+    v2_keys = v2_pair * n_ids + hash_ids[n1:]
+    hits = np.isin(v2_keys, v1_keys)
+    nr_of_matches = np.bincount(v2_pair[hits], minlength=n)
+
+    is_add = v2_sizes > v1_sizes
+    evolution = np.where(v1_sizes == v2_sizes, "Same", np.where(is_add, "Add", "Subtract"))
+    n_evo = np.abs(v2_sizes - v1_sizes)
+
+    reference = np.where(is_add, v1_sizes, v2_sizes)
+    unchanged = nr_of_matches == reference
+    change = np.where(unchanged, "Same", np.where(nr_of_matches == 0, "Consistent", "Inconsistent"))
+    n_change = np.where(unchanged, 0, v2_sizes - nr_of_matches)
+
+    clones_loc = (np.bincount(v2_pair, weights=v2_loc, minlength=n)
+                  - np.bincount(v1_pair, weights=v1_loc, minlength=n)).astype(np.int64)
+
+    return [
+        (str(evolution[i]), str(change[i]), int(n_evo[i]), int(n_change[i]), int(clones_loc[i]))
+        for i in range(n)
+    ]
@@ -0,0 +1,195 @@
+import os
+import glob
+import time
+import shutil
+import logging
+import threading
+from typing import List, Optional
+from omniccg.core import (Settings, LanguageRun, WriteGenealogyOutputs, AddToCorpusIndex, get_clone_genealogy,
+                          detect_commit_range)
+from omniccg.detection_archive import DetectionArchive, archive_path
+from omniccg.job_queue import JobQueue, Job, PENDING, LEASED, default_worker_id
+from omniccg.prints_operations import printInfo, printWarning
+from omniccg.replay import replay_genealogy, replay_settings
+from omniccg.scheduler import ProjectJob, estimate, load_history, seconds_per_unit
+from omniccg.workspaces import WORKSPACES_ROOT, repo_folder_name
+from utils.folders_paths import genealogy_results_path
+
+JOB_PROJECT, JOB_COMMIT_RANGE, JOB_FOLD = "project", "commit_range", "fold"
+SHARDS_DIR = os.path.join("detection_archives", "shards")
+
+def repo_complete_name(full_name: str) -> str:
+    return full_name.replace("/", "_")
+
+def shard_file(directory: str, language: str, full_name: str, start_nr: int) -> str:
+    return os.path.join(directory, SHARDS_DIR, f"{language}_{repo_complete_name(full_name)}__{start_nr:06d}.sqlite")
+
+def enqueue_projects(queue: JobQueue, project_jobs: List[ProjectJob], settings: Settings,
+                     commit_batch: Optional[int] = None, max_attempts: int = 3) -> List[int]:
+    """
+    Submit one project job per project, longest predicted first. With `commit_batch`, a
+    longer project becomes commit-range detection jobs plus a fold job that depends on
+    them (pr_number order only: other orders need the clone to sort the commits).
+    """
+    rates = seconds_per_unit(load_history())
+    submitted = []
+    for job in project_jobs:
+        estimate(job, rates, 0.0, settings.scratch_headroom, False)
+        commits = sorted(job.commits, key=lambda c: c.get("pr_number", 0))
+        splittable = settings.commit_order == "pr_number" and not settings.sample_every
+        if not commit_batch or len(commits) <= commit_batch or not splittable:
+            submitted.append(queue.submit(JOB_PROJECT, {"full_name": job.full_name, "commits": commits,
+                                                        "settings": settings},
+                                          priority=job.predicted_s, max_attempts=max_attempts))
+            continue
+        languages = settings.languages or [job.language]
+        start_nrs, range_ids = [], []
+        for start in range(0, len(commits), commit_batch):
+            chunk = commits[start:start + commit_batch]
+            start_nrs.append(start + 1)
+            range_ids.append(queue.submit(JOB_COMMIT_RANGE, {"full_name": job.full_name, "commits": chunk,
+                                                             "start_nr": start + 1, "languages": languages,
+                                                             "previous_sha": commits[start - 1]["sha"] if start else None,
+                                                             "settings": settings},
+                                          priority=job.predicted_s * len(chunk) / len(commits),
+                                          max_attempts=max_attempts))
+        submitted.extend(range_ids)
+        submitted.append(queue.submit(JOB_FOLD, {"full_name": job.full_name, "start_nrs": start_nrs,
+                                                 "languages": languages, "settings": settings},
+                                      priority=job.predicted_s, depends_on=range_ids, max_attempts=max_attempts))
+    return submitted
+
+def upload_results(files: List[str], results_dir: str) -> List[str]:
+    """Copy outputs of this worker into the shared results directory; returns their relative paths."""
+    uploaded = []
+    for path in files:
+        relative = os.path.relpath(path, genealogy_results_path)
+        target = os.path.join(results_dir, relative)
+        uploaded.append(relative)
+        if os.path.realpath(path) == os.path.realpath(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # readers of the results directory never see a partial file
+        shutil.copy2(path, target + ".tmp")
+        os.replace(target + ".tmp", target)
+    return uploaded
+
+def project_outputs(full_name: str) -> List[str]:
+    name = repo_complete_name(full_name)
+    patterns = [f"*_{name}.*", f"*_{name}_*", f"{name}_*", os.path.join("detection_archives", f"*_{name}.sqlite")]
+    return sorted({path for pattern in patterns for path in glob.glob(os.path.join(genealogy_results_path, pattern))
+                   if os.path.isfile(path)})
+
+def run_project_job(payload: dict, results_dir: str) -> List[str]:
+    get_clone_genealogy(f"https://github.com/{payload['full_name']}", payload["commits"], settings=payload["settings"])
+    return upload_results(project_outputs(payload["full_name"]), results_dir)
+
+def run_commit_range_job(payload: dict, results_dir: str) -> List[str]:
+    full_name, start_nr = payload["full_name"], payload["start_nr"]
+    shards = {language: shard_file(genealogy_results_path, language, full_name, start_nr)
+              for language in payload["languages"]}
+    detect_commit_range(f"https://github.com/{full_name}", payload["commits"], start_nr, shards, payload["settings"],
+                        payload.get("previous_sha"))
+    return upload_results(list(shards.values()), results_dir)
+
+def run_fold_job(payload: dict, results_dir: str) -> List[str]:
+    """
+    Merge the detection shards of a project in commit order and fold them into its
+    genealogy with the project's settings: tip remaps are replayed, lineages retire as
+    in a project run, and the same genealogy, clone density and pre-filter outputs are
+    written. Two differences remain: no follow-mode checkpoint is saved, and when the
+    last commit of a range failed detection, the next range's first remap starts from
+    a commit that was never folded, so the tips are re-indexed in place there instead.
+    """
+    full_name, settings = payload["full_name"], payload["settings"]
+    name = repo_complete_name(full_name)
+    repo_dir = os.path.join(WORKSPACES_ROOT, repo_folder_name(full_name), "repo")
+    genealogy_paths = []
+    for language in payload["languages"]:
+        merged_path = archive_path(os.path.join(results_dir, "detection_archives"), language, name)
+        merged = DetectionArchive(merged_path)
+        run_rows = {"clone_density": [], "prefilter": []}
+        last_nr = None
+        try:
+            merged.describe(settings, repo_dir)
+            for start_nr in payload["start_nrs"]:
+                path = shard_file(results_dir, language, full_name, start_nr)
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"missing detection shard {path}")
+                shard = DetectionArchive(path, resume=True)
+                try:
+                    for commit in shard.commits(repo_dir):
+                        if last_nr is not None and commit.remapped:
+                            # a remap from another commit than the last folded one does not apply
+                            valid = commit.remap_base is None or commit.remap_base == last_nr
+                            merged.record_remap(commit.nr, commit.remap if valid else None, last_nr)
+                        merged.record(commit.nr, commit.sha, commit.number_pr, commit.author_pr, commit.classes)
+                        last_nr = commit.nr
+                    for kind, rows in run_rows.items():
+                        rows.extend(shard.reports(kind))
+                finally:
+                    shard.close()
+        finally:
+            merged.close()
+        ctx = replay_genealogy(merged_path, replay_settings(settings), repo_dir)
+        # outputs are written as the project run writes them
+        ctx.git_url, ctx.settings = f"https://github.com/{full_name}", settings
+        if ctx.state.lineage_count() == 0:
+            logging.error(f"Don't have code clones {full_name} ({language})")
+            continue
+        run = LanguageRun(language, ctx, clone_density_rows=run_rows["clone_density"],
+                          prefilter_rows=run_rows["prefilter"])
+        genealogy_paths.append(WriteGenealogyOutputs(run, name))
+    if genealogy_paths and settings.corpus_index_path:
+        AddToCorpusIndex(ctx, genealogy_paths)
+    return upload_results(project_outputs(full_name), results_dir)
+
+JOB_HANDLERS = {
+    JOB_PROJECT: run_project_job,
+    JOB_COMMIT_RANGE: run_commit_range_job,
+    JOB_FOLD: run_fold_job,
+}
+
+def _keep_alive(queue: JobQueue, job: Job, lease_seconds: float, stop: threading.Event):
+    while not stop.wait(lease_seconds / 3):
+        if not queue.heartbeat(job.id, job.lease_owner, lease_seconds):
+            printWarning(f"Lost the lease of job {job.id}; its result will be discarded")
+            return
+
+def run_worker(queue: JobQueue, worker_id: Optional[str] = None, results_dir: str = genealogy_results_path,
+               lease_seconds: float = 600, wait: bool = False, poll_interval: float = 30,
+               max_jobs: Optional[int] = None) -> int:
+    """
+    Lease and run jobs until the queue is drained (or forever with `wait`), heartbeating
+    each lease from a background thread. Returns the number of jobs completed.
+    """
+    worker_id = worker_id or default_worker_id()
+    completed = handled = 0
+    while max_jobs is None or handled < max_jobs:
+        job = queue.lease(worker_id, lease_seconds)
+        if job is None:
+            counts = queue.counts()
+            if not wait and counts[PENDING] == 0 and counts[LEASED] == 0:
+                break
+            time.sleep(poll_interval)
+            continue
+        handled += 1
+        printInfo(f"Worker {worker_id} runs {job.kind} job {job.id} ({job.payload['full_name']}, attempt {job.attempts})")
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_keep_alive, args=(queue, job, lease_seconds, stop), daemon=True)
+        heartbeat.start()
+        try:
+            result = JOB_HANDLERS[job.kind](job.payload, results_dir)
+        except Exception as e:
+            logging.error(f"Project: {job.payload['full_name']} | Function: 'run_worker' | Job: {job.id} | Error: {e}")
+            stop.set()
+            heartbeat.join()
+            queue.fail(job.id, worker_id, repr(e))
+            continue
+        stop.set()
+        heartbeat.join()
+        if queue.complete(job.id, worker_id, result):
+            completed += 1
+        else:
+            printWarning(f"Job {job.id} finished after its lease was taken over; result discarded")
+    return completed
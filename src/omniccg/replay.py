@@ -0,0 +1,111 @@
+import os
+import bisect
+import tempfile
+import dataclasses
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+from omniccg.core import Context, Paths, Settings, State, RemapLineageTips, RunGenealogyAnalysis, WriteLineageFile
+from omniccg.detection_archive import DetectionArchive
+from omniccg.lineage_store import RetiredLineageStore
+from omniccg.prints_operations import printWarning
+
+def archived_settings(archive_file: str) -> Settings:
+    """Settings with the fold settings the archive was recorded with (defaults for older archives)."""
+    archive = DetectionArchive(archive_file, resume=True)
+    try:
+        recorded = archive.fold_settings()
+    finally:
+        archive.close()
+    if recorded is None:
+        printWarning(f"{archive_file} predates recorded fold settings; replaying with the defaults")
+        return Settings()
+    return dataclasses.replace(Settings(), **recorded)
+
+def replay_settings(base: Optional[Settings] = None, **overrides) -> Settings:
+    """
+    Settings for a replay: `base` (see archived_settings) with matching parameters from
+    `overrides`; everything that needs the repository, NiCad or shared stores is off
+    (hashes, function names and tip remaps are archived).
+    """
+    return dataclasses.replace(base or Settings(),
+                               match_workers=1,
+                               archive_detection_results=False,
+                               corpus_index_path=None,
+                               **overrides)
+
+def _restore_retired(ctx: Context):
+    # Retired lineages go back into the active list, in creation order, like the batch outputs
+    st = ctx.state
+    for lineage in st.retired.iter_lineages():
+        bisect.insort(st.genealogy_data, lineage, key=lambda l: l.id)
+    st.retired.close()
+    st.retired = None
+
+def replay_genealogy(archive_file: str, settings: Optional[Settings] = None, repo_dir: Optional[str] = None) -> Context:
+    """
+    Re-fold the lineages of one project from its detection archive, without git or NiCad.
+    With the archived settings (the default) the lineages are those of the original run:
+    the tip remaps are replayed and lineages retire and revive as they did. Archives of
+    sampled runs are refused, since their interpolated versions are not archived.
+    Fragment paths are placed under `repo_dir`, by default the root of the recorded run.
+    """
+    paths = Paths()
+    # Same path prefix as the original run, so written files match the batch outputs
+    paths.ws_dir = str(Path(__file__).resolve().parent / "cloned_repositories" / "replay")
+    ctx = Context(git_url=archive_file, paths=paths, state=State(),
+                  settings=settings or replay_settings(archived_settings(archive_file)))
+    archive = DetectionArchive(archive_file, resume=True)
+    with tempfile.TemporaryDirectory(prefix="omniccg-replay-") as tmp_dir:
+        try:
+            if (archive.fold_settings() or {}).get("sample_every"):
+                raise ValueError(f"{archive_file} comes from a sampled run; its interpolated versions are not archived")
+            if ctx.settings.retire_after_commits is not None:
+                ctx.state.retired = RetiredLineageStore(os.path.join(tmp_dir, "retired_lineages.sqlite"),
+                                                        compact_xml=ctx.settings.compact_lineage_xml)
+            for commit in archive.commits(repo_dir):
+                if commit.remapped:
+                    RemapLineageTips(ctx, commit.remap)
+                RunGenealogyAnalysis(ctx, commit.nr, commit.sha, commit.number_pr, commit.author_pr, commit.nr,
+                                     commit.classes)
+        finally:
+            archive.close()
+            if ctx.state.retired is not None:
+                _restore_retired(ctx)
+    return ctx
+
+def summarize(ctx: Context) -> Dict[str, int]:
+    versions = [v for lineage in ctx.state.genealogy_data for v in lineage.versions]
+    evolution = Counter(v.evolution_pattern for v in versions)
+    change = Counter(v.change_pattern for v in versions)
+    return {
+        "lineages": len(ctx.state.genealogy_data),
+        "versions": len(versions),
+        "evolution_add": evolution["Add"],
+        "evolution_subtract": evolution["Subtract"],
+        "evolution_same": evolution["Same"],
+        "change_consistent": change["Consistent"],
+        "change_inconsistent": change["Inconsistent"],
+        "change_same": change["Same"],
+    }
+
+def sweep_label(params: dict) -> str:
+    return "_".join(f"{key}-{value}" for key, value in sorted(params.items()))
+
+def _replay_job(job) -> dict:
+    archive_file, params, output_dir = job
+    ctx = replay_genealogy(archive_file, replay_settings(archived_settings(archive_file), **params))
+    project = Path(archive_file).stem
+    WriteLineageFile(ctx, ctx.state.genealogy_data,
+                     os.path.join(output_dir, f"{project}__{sweep_label(params)}.xml"))
+    return {"project": project, **params, **summarize(ctx)}
+
+def replay_sweep(archive_files: List[str], grid: List[dict], output_dir: str, workers: int = 1) -> List[dict]:
+    """Replay every archive under every parameter set of `grid`, one (archive, params) job per worker process."""
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(archive_file, params, output_dir) for archive_file in archive_files for params in grid]
+    if workers <= 1:
+        return [_replay_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_replay_job, jobs))
@@ -0,0 +1,222 @@
+import os
+import time
+import shutil
+import logging
+import statistics
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+import pandas as pd
+import requests
+from omniccg.prints_operations import printInfo, printWarning
+from omniccg.workspaces import WORKSPACES_ROOT, footprint, repo_folder_name
+from utils.folders_paths import genealogy_results_path
+
+HISTORY_PATH = os.path.join(genealogy_results_path, "schedule_history.csv")
+# Seconds per analyzed commit of a ~100 MB repository before any run was recorded
+DEFAULT_SECONDS_PER_COMMIT = {"py": 20.0, "cs": 30.0, "rb": 15.0}
+SIZE_SCALE_MB = 100.0
+
+@dataclass
+class ProjectJob:
+    full_name: str
+    language: str
+    commits: List[dict]
+    repo_size_mb: Optional[float] = None
+    predicted_s: float = 0.0
+    ram_bytes: int = 0
+    disk_bytes: int = 0
+    scratch_bytes: int = 0
+
+@dataclass
+class Resources:
+    slots: int
+    ram_bytes: Optional[int] = None
+    disk_bytes: Optional[int] = None
+    scratch_bytes: Optional[int] = None
+    reserved: Dict[str, int] = field(default_factory=lambda: {"ram": 0, "disk": 0, "scratch": 0})
+
+    def fits(self, job: ProjectJob) -> bool:
+        for name, need, limit in (("ram", job.ram_bytes, self.ram_bytes), ("disk", job.disk_bytes, self.disk_bytes),
+                                  ("scratch", job.scratch_bytes, self.scratch_bytes)):
+            if limit is not None and self.reserved[name] + need > limit:
+                return False
+        return True
+
+    def reserve(self, job: ProjectJob, sign: int = 1):
+        self.reserved["ram"] += sign * job.ram_bytes
+        self.reserved["disk"] += sign * job.disk_bytes
+        self.reserved["scratch"] += sign * job.scratch_bytes
+
+def available_ram_bytes() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def free_disk_bytes(path: str) -> Optional[int]:
+    try:
+        os.makedirs(path, exist_ok=True)
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+def repo_size_mb(full_name: str, github_token: Optional[str] = None,
+                 session: Optional[requests.Session] = None) -> Optional[float]:
+    """Size of the local clone's object store, else the size GitHub reports, else None."""
+    git_dir = os.path.join(WORKSPACES_ROOT, repo_folder_name(full_name), "repo", ".git")
+    if os.path.isdir(git_dir):
+        return footprint(git_dir) / (1024 * 1024)
+    headers = {"Accept": "application/vnd.github+json"}
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+    try:
+        response = (session or requests).get(f"https://api.github.com/repos/{full_name}", headers=headers, timeout=30)
+        response.raise_for_status()
+        return response.json()["size"] / 1024
+    except Exception as e:
+        logging.error(f"Project: {full_name} | Function: 'repo_size_mb' | Error: {e}")
+        return None
+
+def size_jobs(jobs: List[ProjectJob], github_token: Optional[str] = None):
+    """Fill in the repository size of jobs that lack one, over one HTTP session."""
+    with requests.Session() as session:
+        for job in jobs:
+            if job.repo_size_mb is None:
+                job.repo_size_mb = repo_size_mb(job.full_name, github_token, session)
+
+def _work_units(n_commits: int, size_mb: Optional[float]) -> float:
+    return n_commits * (1.0 + (size_mb if size_mb is not None else SIZE_SCALE_MB) / SIZE_SCALE_MB)
+
+def seconds_per_unit(history: pd.DataFrame) -> Dict[str, float]:
+    """Per-language cost rate: the median of actual / work units over recorded runs, else the default."""
+    rates = {language: rate / 2.0 for language, rate in DEFAULT_SECONDS_PER_COMMIT.items()}
+    if history.empty:
+        return rates
+    done = history[(history["status"] == "ok") & (history["commits"] > 0)]
+    if done.empty:
+        return rates
+    units = [_work_units(c, None if pd.isna(s) else s) for c, s in zip(done["commits"], done["repo_size_mb"])]
+    observed = done.assign(rate=done["actual_s"].to_numpy() / units)
+    overall = float(observed["rate"].median())
+    for language in set(rates) | set(observed["language"]):
+        rows = observed[observed["language"] == language]
+        rates[language] = float(rows["rate"].median()) if len(rows) else overall
+    return rates
+
+def load_history(path: str = HISTORY_PATH) -> pd.DataFrame:
+    return pd.read_csv(path) if os.path.exists(path) else pd.DataFrame()
+
+def estimate(job: ProjectJob, rates: Dict[str, float], ram_per_job_gb: float, scratch_headroom: float,
+             use_scratch: bool):
+    size_bytes = int((job.repo_size_mb if job.repo_size_mb is not None else SIZE_SCALE_MB) * 1024 * 1024)
+    job.predicted_s = rates.get(job.language, statistics.mean(rates.values())) * _work_units(len(job.commits),
+                                                                                              job.repo_size_mb)
+    job.ram_bytes = int(ram_per_job_gb * 1024 ** 3)
+    # clone + checkout on the workspace disk; the staged tree and NiCad files on scratch (or disk)
+    staging = int(size_bytes * scratch_headroom)
+    job.disk_bytes = 2 * size_bytes + (0 if use_scratch else staging)
+    job.scratch_bytes = staging if use_scratch else 0
+
+def predicted_makespan(jobs: List[ProjectJob], slots: int) -> float:
+    """Longest-processing-time-first makespan of `jobs` on `slots` identical workers."""
+    loads = [0.0] * max(1, slots)
+    for job in sorted(jobs, key=lambda j: j.predicted_s, reverse=True):
+        loads[loads.index(min(loads))] += job.predicted_s
+    return max(loads) if jobs else 0.0
+
+def _run_job(job: ProjectJob, settings) -> tuple:
+    from omniccg.core import get_clone_genealogy
+    start = time.time()
+    try:
+        get_clone_genealogy(f"https://github.com/{job.full_name}", job.commits, settings=settings)
+        status = "ok"
+    except Exception as e:
+        logging.error(f"Project: {job.full_name} | Function: 'run_schedule' | Error: {e}")
+        status = "failed"
+    return status, time.time() - start
+
+def run_schedule(jobs: List[ProjectJob], settings, workers: int = 1, ram_per_job_gb: float = 2.0,
+                 history_path: str = HISTORY_PATH, github_token: Optional[str] = None) -> List[dict]:
+    """
+    Run one genealogy per project, longest predicted first. At most `workers` projects run
+    at once, capped by cores (match_workers each) and by the free RAM, workspace disk and
+    scratch space measured at start, which every running project reserves from. Predicted
+    and actual durations are appended to `history_path`, which calibrates later estimates.
+    Repository sizes are only looked up when more than one project can run at once.
+    """
+    use_scratch = bool(settings.scratch_root)
+    cpu_slots = max(1, (os.cpu_count() or 1) // max(1, settings.match_workers))
+    resources = Resources(slots=max(1, min(workers, cpu_slots, len(jobs))),
+                          ram_bytes=available_ram_bytes(),
+                          disk_bytes=free_disk_bytes(WORKSPACES_ROOT),
+                          scratch_bytes=free_disk_bytes(settings.scratch_root) if use_scratch else None)
+    if resources.slots > 1:
+        size_jobs(jobs, github_token)
+    rates = seconds_per_unit(load_history(history_path))
+    for job in jobs:
+        estimate(job, rates, ram_per_job_gb, settings.scratch_headroom, use_scratch)
+    pending = sorted(jobs, key=lambda j: j.predicted_s, reverse=True)
+    printInfo(f"Scheduling {len(jobs)} projects on {resources.slots} slots; predicted makespan "
+              f"{predicted_makespan(jobs, resources.slots) / 3600:.2f} h")
+
+    rows = []
+    start = time.time()
+
+    def record(job, status, actual_s):
+        rows.append({
+            "project": job.full_name,
+            "language": job.language,
+            "commits": len(job.commits),
+            "repo_size_mb": None if job.repo_size_mb is None else round(job.repo_size_mb, 1),
+            "predicted_s": round(job.predicted_s, 1),
+            "actual_s": round(actual_s, 1),
+            "error_pct": round(100 * (job.predicted_s - actual_s) / actual_s, 1) if actual_s else None,
+            "status": status,
+            "slots": resources.slots,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+        })
+        print(f"  {job.full_name}: predicted {job.predicted_s:.0f}s, actual {actual_s:.0f}s ({status})")
+
+    if resources.slots == 1:
+        for job in pending:
+            record(job, *_run_job(job, settings))
+    else:
+        with ProcessPoolExecutor(max_workers=resources.slots) as executor:
+            running = {}
+            while pending or running:
+                # the longest pending project that fits; an oversized one runs once the pool is empty
+                while pending and len(running) < resources.slots:
+                    job = next((j for j in pending if resources.fits(j)), None)
+                    if job is None:
+                        if running:
+                            break
+                        job = pending[0]
+                        printWarning(f"{job.full_name} exceeds the measured resources; running it alone")
+                    pending.remove(job)
+                    resources.reserve(job)
+                    running[executor.submit(_run_job, job, settings)] = job
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    resources.reserve(job, -1)
+                    record(job, *future.result())
+
+    makespan = time.time() - start
+    printInfo(f"Makespan {makespan / 3600:.2f} h (predicted {predicted_makespan(jobs, resources.slots) / 3600:.2f} h)")
+    WriteScheduleReport(rows, history_path)
+    return rows
+
+def WriteScheduleReport(schedule_rows, history_path: str = HISTORY_PATH):
+    report_df = pd.DataFrame(schedule_rows)
+    os.makedirs(os.path.dirname(history_path), exist_ok=True)
+    report_df.to_csv(history_path, mode="a", header=not os.path.exists(history_path), index=False)
+    print(f"\nAppended predicted vs actual durations to {history_path}")
@@ -0,0 +1,38 @@
+import os
+import shutil
+import hashlib
+from typing import Optional
+
+def scratch_dir_for(scratch_root: str, ws_dir: str) -> str:
+    """Per-workspace directory under the scratch root (the digest keeps equal repo names apart)."""
+    digest = hashlib.sha1(os.path.abspath(ws_dir).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(scratch_root, "omniccg", f"{os.path.basename(ws_dir)}-{digest}")
+
+def scratch_fits(scratch_root: str, required_bytes: int, headroom: float) -> bool:
+    try:
+        free = shutil.disk_usage(scratch_root).free
+    except OSError:
+        return False
+    return required_bytes * headroom <= free
+
+def remove_path(path: str):
+    """Remove a file, a symlink (not its target) or a directory tree."""
+    if os.path.islink(path) or os.path.isfile(path):
+        os.unlink(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+def place_transient_dir(path: str, scratch_dir: Optional[str]) -> bool:
+    """
+    Recreate `path` empty: as a symlink to a fresh `scratch_dir` when given, else as a
+    plain directory. The logical path never changes, so NiCad results, fragment paths
+    and genealogy outputs are the same either way. Returns True when on scratch.
+    """
+    remove_path(path)
+    if scratch_dir is None:
+        os.makedirs(path, exist_ok=True)
+        return False
+    os.makedirs(scratch_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    os.symlink(scratch_dir, path, target_is_directory=True)
+    return True
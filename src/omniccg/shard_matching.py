@@ -0,0 +1,102 @@
+import zlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from omniccg.CloneClass import CloneClass
+from omniccg.Lineage import Lineage
+from omniccg.hash_operations import HASH_BITS
+
+# Class fragments compared against a shard's tip hashes per numpy block
+BLOCK_ROWS = 64
+
+def max_hamming_distance(threshold: float) -> int:
+    """Largest Hamming distance for which match_hashes(..., threshold) still matches."""
+    return int(np.floor((1.0 - threshold) * HASH_BITS + 1e-9))
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(x)
+else:
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        as_bytes = x.reshape(x.shape + (1,)).view(np.uint8)
+        return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+def shard_of(file: str, n_shards: int) -> int:
+    return zlib.crc32(file.encode("utf-8")) % n_shards
+
+def _fragment_rows(fragments_by_owner) -> Tuple[np.ndarray, np.ndarray, List[tuple]]:
+    owners, hashes, coords = [], [], []
+    for owner, fragments in fragments_by_owner:
+        for f in fragments:
+            owners.append(owner)
+            hashes.append(f.hash)
+            coords.append((f.file, f.ls, f.le))
+    return np.array(owners, dtype=np.int64), np.array(hashes, dtype=np.uint64), coords
+
+def _match_shard(shard, classes, max_dist: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Worker: every (class index, lineage id) pair where some class fragment matches
+    some tip fragment of a lineage in this shard, i.e. same coordinates or
+    SimHashes within `max_dist` bits (CloneFragment.matches).
+    """
+    lineage_ids, tip_hashes, tip_coords = shard
+    class_idx, class_hashes, class_coords = classes
+    pairs_class, pairs_lineage = [], []
+
+    by_coords: Dict[tuple, List[int]] = {}
+    for lineage_id, coords in zip(lineage_ids.tolist(), tip_coords):
+        by_coords.setdefault(coords, []).append(lineage_id)
+    for i, coords in zip(class_idx.tolist(), class_coords):
+        for lineage_id in by_coords.get(coords, ()):
+            pairs_class.append(i)
+            pairs_lineage.append(lineage_id)
+    exact = (np.array(pairs_class, dtype=np.int64), np.array(pairs_lineage, dtype=np.int64))
+
+    fuzzy_class, fuzzy_lineage = [exact[0]], [exact[1]]
+    for start in range(0, len(class_hashes), BLOCK_ROWS):
+        block = class_hashes[start:start + BLOCK_ROWS]
+        rows, cols = np.nonzero(_popcount(block[:, None] ^ tip_hashes[None, :]) <= max_dist)
+        fuzzy_class.append(class_idx[start + rows])
+        fuzzy_lineage.append(lineage_ids[cols])
+    return np.concatenate(fuzzy_class), np.concatenate(fuzzy_lineage)
+
+class ShardedMatcher:
+    """
+    Computes, for every clone class of a commit, the ids of all lineages whose
+    pre-commit tip matches it (Lineage.matches). Lineages are partitioned by the
+    file of their first tip fragment and each shard is matched in a worker
+    process; classes are sent to every shard because SimHash matches cross files.
+    The fold itself (first untaken lineage in creation order) stays serial, so
+    results are identical to the plain scan. The worker processes are only started
+    by the first commit with enough lineages to shard.
+    """
+    def __init__(self, workers: int, threshold: float = 0.90):
+        self.workers = workers
+        self.max_dist = max_hamming_distance(threshold)
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def candidates(self, lineages: List[Lineage], classes: List[CloneClass]) -> List[List[int]]:
+        shards = [[] for _ in range(self.workers)]
+        for lineage in lineages:
+            tip = lineage.versions[-1].cloneclass.fragments
+            if tip:
+                shards[shard_of(tip[0].file, self.workers)].append((lineage.id, tip))
+        class_rows = _fragment_rows(enumerate(cc.fragments for cc in classes))
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [self.executor.submit(_match_shard, _fragment_rows(shard), class_rows, self.max_dist)
+                   for shard in shards if shard]
+        matched: List[set] = [set() for _ in classes]
+        for future in futures:
+            class_idx, lineage_ids = future.result()
+            for i, lineage_id in zip(class_idx.tolist(), lineage_ids.tolist()):
+                matched[i].add(lineage_id)
+        return [sorted(ids) for ids in matched]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
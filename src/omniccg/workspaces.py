@@ -0,0 +1,232 @@
+import os
+import time
+import fnmatch
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+import pandas as pd
+from omniccg.prints_operations import printInfo, printWarning
+from omniccg.scratch import remove_path
+from utils.folders_paths import genealogy_results_path
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+WORKSPACES_ROOT = str(Path(__file__).resolve().parent / "cloned_repositories")
+LAST_USED_FILE = ".last_used"
+LOCK_FILE = ".lock"
+# Follow-mode state (checkpoint and retired lineages) survives eviction; the clone,
+# staged dataset, detector results and caches are rebuilt by the next run. The lock
+# file stays so that a run waiting on it and a later run lock the same file.
+RETAINED = ("genealogy_state.pickle", "retired_lineages*.sqlite", LAST_USED_FILE, LOCK_FILE)
+
+class WorkspaceUsage(NamedTuple):
+    name: str
+    total_bytes: int
+    evictable_bytes: int
+    last_used: float
+    pinned: bool
+
+def _lock(fd: int, blocking: bool = True) -> bool:
+    """Exclusive lock on an open lock file; False when `blocking` is off and another run holds it."""
+    if os.name == "nt":
+        while True:
+            try:
+                # msvcrt locks a byte range from the current position
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(1)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return True
+    except BlockingIOError:
+        return False
+
+def _release(fd: int):
+    if os.name == "nt":
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    # closing the descriptor releases the lock
+    os.close(fd)
+
+def _disk_bytes(st: os.stat_result) -> int:
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+def footprint(path: str) -> int:
+    """Bytes allocated under `path`; symlinks (e.g. a dataset/ on scratch) are not followed."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return 0
+    total = _disk_bytes(st)
+    if os.path.isdir(path) and not os.path.islink(path):
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    total += footprint(entry.path)
+        except OSError:
+            pass
+    return total
+
+def repo_folder_name(git_url: Optional[str]) -> str:
+    """
+    Determine a stable repository folder name from git_url or local_path.
+    Falls back to 'repo' if nothing can be inferred.
+    """
+    url = (git_url or "").rstrip("/")
+    base = os.path.basename(url) or "repo"
+    if base.endswith(".git"):
+        base = base[:-4]
+    base = os.path.splitext(base)[0] or base
+    return base or "repo"
+
+def _is_retained(name: str) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in RETAINED)
+
+class WorkspaceManager:
+    """
+    Keeps cloned_repositories/ under a disk budget. Workspaces are evicted least recently
+    used first (by the time of their last run); a workspace is pinned while a run holds
+    its lock file, and eviction only deletes under that lock, so workspaces in use or
+    waited on (on this host or another sharing the filesystem) are never touched.
+    Budget None only measures.
+    """
+    def __init__(self, root: str = WORKSPACES_ROOT, budget_bytes: Optional[int] = None):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.locks: Dict[str, int] = {}
+
+    def _workspace(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def touch(self, name: str):
+        ws = self._workspace(name)
+        os.makedirs(ws, exist_ok=True)
+        Path(ws, LAST_USED_FILE).touch()
+
+    def last_used(self, name: str) -> float:
+        ws = self._workspace(name)
+        marker = os.path.join(ws, LAST_USED_FILE)
+        try:
+            return os.path.getmtime(marker if os.path.exists(marker) else ws)
+        except OSError:
+            return 0.0
+
+    def _open_lock(self, name: str) -> int:
+        return os.open(os.path.join(self._workspace(name), LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def is_pinned(self, name: str) -> bool:
+        """Whether a run, this one included, holds the workspace lock."""
+        if name in self.locks:
+            return True
+        if not os.path.isdir(self._workspace(name)):
+            return False
+        fd = self._open_lock(name)
+        if not _lock(fd, blocking=False):
+            os.close(fd)
+            return True
+        _release(fd)
+        return False
+
+    def pin(self, name: str):
+        """
+        Take the workspace for this process: wait for its lock, held by any other run on the
+        same project (e.g. two queue workers) or by an eviction, and keep it until unpin.
+        """
+        self.touch(name)
+        fd = self._open_lock(name)
+        if not _lock(fd, blocking=False):
+            printInfo(f"Workspace {name} is in use by another run; waiting for it")
+            _lock(fd)
+        self.locks[name] = fd
+
+    def unpin(self, name: str):
+        self.touch(name)
+        fd = self.locks.pop(name, None)
+        if fd is not None:
+            _release(fd)
+
+    def usage(self) -> List[WorkspaceUsage]:
+        rows = []
+        if not os.path.isdir(self.root):
+            return rows
+        for name in sorted(os.listdir(self.root)):
+            ws = self._workspace(name)
+            if not os.path.isdir(ws) or os.path.islink(ws):
+                continue
+            total = evictable = 0
+            for entry in os.listdir(ws):
+                size = footprint(os.path.join(ws, entry))
+                total += size
+                if not _is_retained(entry):
+                    evictable += size
+            rows.append(WorkspaceUsage(name, total, evictable, self.last_used(name), self.is_pinned(name)))
+        return rows
+
+    def evict_workspace(self, name: str) -> int:
+        """Drop the rebuildable parts of a workspace; returns the bytes freed."""
+        ws = self._workspace(name)
+        freed = 0
+        for entry in os.listdir(ws):
+            if _is_retained(entry):
+                continue
+            path = os.path.join(ws, entry)
+            freed += footprint(path)
+            remove_path(path)
+        return freed
+
+    def enforce_budget(self) -> List[str]:
+        """Evict unpinned workspaces, least recently used first, until the total fits in the budget."""
+        if self.budget_bytes is None:
+            return []
+        rows = self.usage()
+        total = sum(row.total_bytes for row in rows)
+        evicted = []
+        for row in sorted(rows, key=lambda r: r.last_used):
+            if total <= self.budget_bytes:
+                break
+            if row.pinned or row.evictable_bytes == 0:
+                continue
+            # a run may have taken the workspace since it was measured; delete only under its lock
+            fd = self._open_lock(row.name)
+            if not _lock(fd, blocking=False):
+                os.close(fd)
+                continue
+            try:
+                freed = self.evict_workspace(row.name)
+            finally:
+                _release(fd)
+            total -= freed
+            evicted.append(row.name)
+            printInfo(f"Evicted workspace {row.name} ({freed // (1024 * 1024)} MiB, last used "
+                      f"{datetime.fromtimestamp(row.last_used):%Y-%m-%d %H:%M})")
+        if total > self.budget_bytes:
+            printWarning(f"Workspaces still use {total // (1024 * 1024)} MiB after eviction "
+                         f"(budget {self.budget_bytes // (1024 * 1024)} MiB); the rest is pinned or retained")
+        return evicted
+
+def workspace_rows(usage: List[WorkspaceUsage], evicted: Optional[List[str]] = None) -> List[dict]:
+    evicted = set(evicted or [])
+    return [{
+        "workspace": row.name,
+        "total_mb": round(row.total_bytes / (1024 * 1024), 2),
+        "evictable_mb": round(row.evictable_bytes / (1024 * 1024), 2),
+        "retained_mb": round((row.total_bytes - row.evictable_bytes) / (1024 * 1024), 2),
+        "last_used": datetime.fromtimestamp(row.last_used).isoformat(timespec="seconds"),
+        "idle_days": round((time.time() - row.last_used) / 86400, 1),
+        "pinned": row.pinned,
+        "evicted": row.name in evicted,
+    } for row in usage]
+
+def WriteWorkspaceReport(workspace_rows):
+    report_df = pd.DataFrame(workspace_rows)
+    report_path = os.path.join(genealogy_results_path, "workspace_footprint.csv")
+    report_df.to_csv(report_path, index=False)
+    print(f"\nSaved workspace footprint report to {report_path}")
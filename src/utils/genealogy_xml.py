@@ -0,0 +1,36 @@
+import copy
+import xml.etree.ElementTree as ET
+
+def expand_compact_classes(root):
+    """
+    Expand delta-encoded clone classes in place. A compact <class ref="nr"> lists
+    either nothing (identical to the previous version's class) or, per fragment,
+    a full <source> row or <same index="k"/> pointing at fragment k of the
+    previous version's class. Plain genealogy files are left untouched.
+    """
+    for lineage in root.iter("lineage"):
+        previous = None
+        for version in lineage.findall("version"):
+            cloneclass = version.find("class")
+            if cloneclass is None:
+                continue
+            if cloneclass.get("ref") is not None and previous is not None:
+                rows = list(cloneclass)
+                if rows:
+                    expanded = [copy.deepcopy(previous[int(row.get("index"))]) if row.tag == "same" else row
+                                for row in rows]
+                else:
+                    expanded = [copy.deepcopy(source) for source in previous]
+                for row in rows:
+                    cloneclass.remove(row)
+                cloneclass.extend(expanded)
+                del cloneclass.attrib["ref"]
+            previous = cloneclass
+    root.attrib.pop("format", None)
+    return root
+
+def parse_genealogy(path):
+    """ET.parse for genealogy XMLs, expanding the compact encoding transparently."""
+    tree = ET.parse(path)
+    expand_compact_classes(tree.getroot())
+    return tree
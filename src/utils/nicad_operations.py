@@ -1,15 +1,15 @@
 from pathlib import Path
+from datetime import datetime
 import subprocess
+import signal
 import shutil
+import csv
 import os
 
 class NiCadTimeout(Exception):
     """Exceção para timeout do NiCad."""
     pass
 
-def _nicad_timeout_handler(signum, frame):
-    raise NiCadTimeout("NiCad execution exceeded timeout")
-
 def remove_logs_and_xml_files(directory):
     for file_name in os.listdir(directory):
         file_path = os.path.join(directory, file_name)
@@ -20,6 +20,83 @@ def remove_logs_and_xml_files(directory):
             except Exception as e:
                 print(f"Remove error {file_path}: {e}")
 
+def nicad_time_budget(n_files, loc, base=300, per_file=0.5, per_kloc=6.0, max_budget=4 * 3600):
+    """
+    Wall-clock budget (seconds) for a NiCad run over `n_files` files with `loc` lines.
+    TXL extraction is roughly linear in the number of files and lines, so the
+    budget grows with both and is capped at `max_budget`.
+    """
+    budget = base + per_file * n_files + per_kloc * (loc / 1000)
+    return int(min(budget, max_budget))
+
+def _kill_process_group(process):
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+def run_nicad_supervised(args, cwd, timeout):
+    """
+    Run a NiCad command in its own process group and kill the whole group
+    (nicad6 → NiCadPair → TXL workers) if it exceeds `timeout` seconds.
+    Raises NiCadTimeout on timeout and CalledProcessError on a non-zero exit.
+    """
+    if os.name == "nt":
+        process = subprocess.Popen(args, cwd=cwd, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        process = subprocess.Popen(args, cwd=cwd, start_new_session=True)
+
+    try:
+        returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_process_group(process)
+        raise NiCadTimeout(f"NiCad execution exceeded timeout ({timeout}s)")
+    except BaseException:
+        _kill_process_group(process)
+        raise
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args)
+    return returncode
+
+def record_nicad_timeout(ledger_path, project, hash_index, commit, language, n_files, loc, budget):
+    """Append a timed-out commit to the per-project NiCad timeout ledger (CSV)."""
+    os.makedirs(os.path.dirname(ledger_path) or ".", exist_ok=True)
+    write_header = not os.path.exists(ledger_path)
+    with open(ledger_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(["timestamp", "project", "index", "commit_sha", "language", "files", "loc", "budget_s"])
+        writer.writerow([datetime.now().isoformat(timespec="seconds"), project, hash_index, commit, language, n_files, loc, budget])
+
+def write_nicad_config(name, overrides, nicad_dir="NiCad"):
+    """
+    Write NiCad/config/<name>.cfg as a copy of default.cfg with `overrides`
+    (e.g. {"include": "src/", "exclude": "[Tt]est"}) applied, and return `name`
+    so it can be passed to nicad6 as its config argument.
+    """
+    config_dir = os.path.join(nicad_dir, "config")
+    with open(os.path.join(config_dir, "default.cfg"), "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    pending = dict(overrides)
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if "=" in line and not line.lstrip().startswith("#") and key in pending:
+            value = str(pending.pop(key)).replace('"', '\\"')
+            lines[i] = f'{key}="{value}"\n'
+    for key, value in pending.items():
+        value = str(value).replace('"', '\\"')
+        lines.append(f'{key}="{value}"\n')
+
+    with open(os.path.join(config_dir, f"{name}.cfg"), "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    return name
+
 def run_nicad(git_repository_path, languague, result_path):
     print(" >>> Running nicad6...")
     repo_name = git_repository_path.split("/")[-1]
@@ -34,4 +111,4 @@ def run_nicad(git_repository_path, languague, result_path):
     shutil.rmtree(clones_dir, ignore_errors=True)
     remove_logs_and_xml_files("repos")
 
-    print("Finished clone detection.\n")
\ No newline at end of file
+    print("Finished clone detection.\n")
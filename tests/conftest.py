@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+def pytest_sessionstart(session):
+    # utils.folders_paths resolves its output folders against the working directory at
+    # import time; keep the ones created by importing omniccg.core out of the checkout
+    os.chdir(tempfile.mkdtemp(prefix="omniccg-tests-"))
@@ -0,0 +1,45 @@
+import random
+import pytest
+from omniccg.commit_sampling import FAILED, INTERPOLATED, REFINED, SAMPLED, plan_sampling, sample_indices
+
+def test_sample_indices_include_both_ends():
+    assert sample_indices(0, 5) == []
+    assert sample_indices(1, 5) == [0]
+    assert sample_indices(10, 5) == [0, 5, 9]
+    assert sample_indices(11, 5) == [0, 5, 10]
+    assert sample_indices(4, 0) == [0, 1, 2, 3]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_plan_sampling_finds_every_change(seed):
+    rnd = random.Random(seed)
+    n_commits = rnd.randrange(1, 200)
+    every = rnd.randrange(1, 30)
+    # classes only ever change forward (no A-B-A), so equal interval ends mean nothing changed inside
+    changes = sorted(rnd.sample(range(1, n_commits + 1), min(n_commits, rnd.randrange(0, 6))))
+    failing = set(rnd.sample(range(n_commits), min(n_commits, rnd.randrange(0, 4))))
+    detected = []
+
+    def signature(index):
+        return (sum(1 for c in changes if c <= index),)
+
+    def detect(index):
+        detected.append(index)
+        return None if index in failing else signature(index)
+
+    status = plan_sampling(n_commits, every, detect)
+
+    assert sorted(status) == list(range(n_commits))
+    assert len(detected) == len(set(detected))
+    assert {i for i in sample_indices(n_commits, every) if i not in failing} == \
+        {i for i, s in status.items() if s == SAMPLED}
+    assert {i for i, s in status.items() if s == FAILED} == failing & set(detected)
+    assert set(detected) == {i for i, s in status.items() if s in (SAMPLED, REFINED, FAILED)}
+    for index, s in status.items():
+        if s == INTERPOLATED:
+            left = max(i for i in detected if i < index)
+            right = min(i for i in detected if i > index)
+            assert signature(left) == signature(index) == signature(right)
+    # every change lands between two detected, adjacent commits
+    for change in changes:
+        if change < n_commits:
+            assert status[change - 1] != INTERPOLATED and status[change] != INTERPOLATED
@@ -0,0 +1,83 @@
+import os
+import random
+import pytest
+from omniccg.CloneClass import CloneClass
+from omniccg.CloneFragment import CloneFragment
+from omniccg.CloneVersion import CloneVersion
+from omniccg.Lineage import Lineage
+from omniccg.corpus_index import CorpusIndex
+from omniccg.hash_operations import match_hashes
+
+FILES = [f"pkg/m{i}.py" for i in range(5)]
+
+def _hash_pool(rnd):
+    # near-duplicates of a few seeds, including hashes above 2**63
+    pool = []
+    for _ in range(6):
+        seed = rnd.getrandbits(64)
+        pool.append(seed)
+        for _ in range(4):
+            flipped = seed
+            for bit in rnd.sample(range(64), rnd.randrange(1, 14)):
+                flipped ^= 1 << bit
+            pool.append(flipped)
+    return pool
+
+def _write_project(path, rnd, hash_pool):
+    """Genealogy XML of random lineages; returns {(lineage, file, ls, le, hash): [version nrs]}."""
+    lineages, sources = [], {}
+    for lineage_pos in range(rnd.randrange(1, 6)):
+        lineage = Lineage()
+        for nr in sorted(rnd.sample(range(1, 20), rnd.randrange(1, 4))):
+            cc = CloneClass()
+            for _ in range(rnd.randrange(1, 4)):
+                ls = rnd.randrange(1, 30)
+                cc.fragments.append(CloneFragment(rnd.choice(FILES), ls, ls + rnd.randrange(0, 5),
+                                                  hash=rnd.choice(hash_pool)))
+                f = cc.fragments[-1]
+                sources.setdefault((lineage_pos, f.file, f.ls, f.le, f.hash), []).append(nr)
+            lineage.versions.append(CloneVersion(cc, f"sha{nr}", nr))
+        lineages.append(lineage)
+    with open(path, "w", encoding="utf-8") as xml_file:
+        xml_file.write("<lineages>\n" + "".join(l.toXML() for l in lineages) + "</lineages>\n")
+    return sources
+
+@pytest.mark.parametrize("seed", range(8))
+def test_query_matches_brute_force_scan(tmp_path, seed):
+    rnd = random.Random(seed)
+    hash_pool = _hash_pool(rnd)
+    index = CorpusIndex(str(tmp_path / "index" / "corpus.db"), threshold=0.85)
+    corpus = {}
+    for k in range(3):
+        project = f"python_owner_repo{k}"
+        corpus[project] = _write_project(str(tmp_path / f"{project}.xml"), rnd, hash_pool)
+    assert index.add_directory(str(tmp_path)) == sorted(corpus)
+    assert index.add_directory(str(tmp_path)) == []
+
+    for h in rnd.sample(hash_pool, 8) + [rnd.getrandbits(64)]:
+        for threshold, exclude in ((None, None), (0.9, None), (None, "python_owner_repo1")):
+            expected = sorted(
+                (project, *key, min(nrs), max(nrs), bin(h ^ key[-1]).count("1"))
+                for project, sources in corpus.items() if project != exclude
+                for key, nrs in sources.items() if match_hashes(h, key[-1], threshold or 0.85)[0])
+            found = sorted((m.project, m.lineage, m.file, m.startline, m.endline, m.hash,
+                            m.first_version, m.last_version, m.distance)
+                           for m in index.query(h, threshold, exclude_project=exclude))
+            assert found == expected
+    index.close()
+
+def test_changed_project_is_reindexed(tmp_path):
+    rnd = random.Random(0)
+    hash_pool = _hash_pool(rnd)
+    xml_path = str(tmp_path / "java_owner_repo.xml")
+    index = CorpusIndex(str(tmp_path / "corpus.db"))
+    _write_project(xml_path, rnd, hash_pool)
+    assert index.add_project(xml_path)
+    sources = _write_project(xml_path, rnd, hash_pool)
+    os.utime(xml_path, (0, 0))
+    assert index.add_project(xml_path)
+    assert not index.add_project(xml_path)
+    assert index.projects() == ["java_owner_repo"]
+    assert sorted((m.lineage, m.file, m.startline, m.endline, m.hash)
+                  for m in index.project_fragments("java_owner_repo")) == sorted(sources)
+    index.close()
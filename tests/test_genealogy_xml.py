@@ -0,0 +1,67 @@
+import random
+import xml.etree.ElementTree as ET
+import pytest
+from omniccg.CloneClass import CloneClass
+from omniccg.CloneFragment import CloneFragment
+from omniccg.CloneVersion import CloneVersion
+from omniccg.Lineage import Lineage
+from utils.genealogy_xml import expand_compact_classes
+
+FILES = [f"/ws/repo/pkg/m{i}.py" for i in range(4)]
+
+def _fragment(rnd):
+    ls = rnd.randrange(1, 40)
+    return CloneFragment(rnd.choice(FILES), ls, ls + rnd.randrange(0, 8), hash=rnd.getrandbits(64))
+
+def _next_class(rnd, previous):
+    # unchanged, reordered, or with fragments kept, dropped and added, as between two commits
+    cc = CloneClass()
+    roll = rnd.random()
+    if roll < 0.3:
+        cc.fragments = list(previous.fragments)
+    elif roll < 0.4:
+        cc.fragments = rnd.sample(previous.fragments, len(previous.fragments))
+    else:
+        kept = [f for f in previous.fragments if rnd.random() < 0.6]
+        cc.fragments = kept + [_fragment(rnd) for _ in range(rnd.randrange(0, 3))]
+        rnd.shuffle(cc.fragments)
+    return cc
+
+def _lineages(rnd):
+    lineages = []
+    for _ in range(rnd.randrange(1, 8)):
+        lineage = Lineage()
+        cc = CloneClass()
+        cc.fragments = [_fragment(rnd) for _ in range(rnd.randrange(1, 5))]
+        nr = rnd.randrange(1, 5)
+        for _ in range(rnd.randrange(1, 10)):
+            version = CloneVersion(cc, f"sha{nr}", nr)
+            if rnd.random() < 0.2:
+                version.removed_fragments = [_fragment(rnd)]
+            lineage.versions.append(version)
+            cc = _next_class(rnd, cc)
+            nr += rnd.randrange(1, 4)
+        lineages.append(lineage)
+    return lineages
+
+def _parse(lineages, compact):
+    attributes = ' format="delta"' if compact else ""
+    return ET.fromstring(f"<lineages{attributes}>\n" + "".join(l.toXML(compact) for l in lineages) + "</lineages>\n")
+
+def _canonical(root):
+    return [(e.tag, sorted(e.attrib.items())) for e in root.iter()]
+
+@pytest.mark.parametrize("seed", range(15))
+def test_compact_classes_expand_to_plain_xml(seed):
+    lineages = _lineages(random.Random(seed))
+    plain = _parse(lineages, compact=False)
+    compact = _parse(lineages, compact=True)
+    assert compact.get("format") == "delta"
+    expand_compact_classes(compact)
+    assert _canonical(compact) == _canonical(plain)
+
+def test_plain_xml_is_left_untouched():
+    lineages = _lineages(random.Random(0))
+    plain = _parse(lineages, compact=False)
+    before = ET.tostring(plain)
+    assert ET.tostring(expand_compact_classes(plain)) == before
@@ -0,0 +1,83 @@
+import types
+import pytest
+import omniccg.job_queue as job_queue
+from omniccg.job_queue import DONE, FAILED, LEASED, PENDING, SQLiteJobQueue
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(job_queue, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = SQLiteJobQueue(str(tmp_path / "queue" / "jobs.sqlite"))
+    yield queue
+    queue.close()
+
+def _status(queue, job_id):
+    return next(job["status"] for job in queue.jobs() if job["id"] == job_id)
+
+def test_jobs_are_leased_by_priority_once_dependencies_are_done(queue):
+    first = queue.submit("commit_range", {"start": 0})
+    fold = queue.submit("fold", {"shards": [first]}, priority=10, depends_on=[first])
+    other = queue.submit("commit_range", {"start": 5}, priority=1)
+    assert queue.lease("w1", 60).id == other
+    job = queue.lease("w2", 60)
+    assert (job.id, job.payload, job.attempts, job.lease_owner) == (first, {"start": 0}, 1, "w2")
+    assert queue.lease("w3", 60) is None
+    assert not queue.complete(first, "w1")
+    assert queue.complete(first, "w2", result=["shard.sqlite"])
+    assert queue.result(first) == ["shard.sqlite"]
+    assert queue.lease("w3", 60).id == fold
+    assert queue.counts() == {PENDING: 0, LEASED: 2, DONE: 1, FAILED: 0}
+
+def test_expired_lease_is_handed_out_again(queue, clock):
+    job_id = queue.submit("commit_range", {}, max_attempts=2)
+    assert queue.lease("w1", 60).attempts == 1
+    clock.now += 30
+    assert queue.heartbeat(job_id, "w1", 60)
+    clock.now += 50
+    assert queue.lease("w2", 60) is None
+    clock.now += 11
+    job = queue.lease("w2", 60)
+    assert (job.id, job.attempts, job.lease_owner) == (job_id, 2, "w2")
+    # the first worker lost the lease and can no longer report on the job
+    assert not queue.heartbeat(job_id, "w1", 60)
+    assert not queue.complete(job_id, "w1")
+    clock.now += 61
+    # no attempt left: the expired lease fails the job instead of leasing it again
+    assert queue.lease("w3", 60) is None
+    assert _status(queue, job_id) == FAILED
+    assert not queue.complete(job_id, "w2")
+
+def test_failed_attempts_are_retried_until_max_attempts(queue):
+    job_id = queue.submit("commit_range", {}, max_attempts=3)
+    for attempt in range(1, 4):
+        job = queue.lease("w1", 60)
+        assert (job.id, job.attempts) == (job_id, attempt)
+        assert queue.fail(job_id, "w1", f"error {attempt}")
+    assert queue.lease("w1", 60) is None
+    job = next(job for job in queue.jobs() if job["id"] == job_id)
+    assert (job["status"], job["attempts"], job["error"]) == (FAILED, 3, "error 3")
+
+def test_failed_dependency_fails_its_dependents(queue):
+    shard = queue.submit("commit_range", {}, max_attempts=1)
+    done = queue.submit("commit_range", {})
+    fold = queue.submit("fold", {}, depends_on=[shard, done])
+    report = queue.submit("report", {}, depends_on=[fold])
+    assert queue.lease("w1", 60).id == shard
+    assert queue.lease("w2", 60).id == done
+    assert queue.complete(done, "w2")
+    assert queue.fail(shard, "w1", "nicad timeout")
+    while queue.lease("w1", 60) is not None:
+        pass
+    assert [_status(queue, job_id) for job_id in (shard, done, fold, report)] == [FAILED, DONE, FAILED, FAILED]
+    assert next(job for job in queue.jobs() if job["id"] == fold)["error"] == "dependency failed"
@@ -0,0 +1,84 @@
+import difflib
+import random
+import pytest
+from omniccg.line_remap import CommitRemap, parse_zero_context_diff
+
+def _edit(rnd, old):
+    # random deletions, replacements and insertions of whole lines
+    new = []
+    for line in old:
+        roll = rnd.random()
+        if roll < 0.08:
+            continue
+        if roll < 0.14:
+            new.append(f"changed {rnd.getrandbits(32)}")
+            continue
+        new.append(line)
+        if roll > 0.92:
+            new.extend(f"inserted {rnd.getrandbits(32)}" for _ in range(rnd.randrange(1, 4)))
+    return new
+
+def _zero_context_diff(path, old, new):
+    body = "\n".join(difflib.unified_diff(old, new, f"a/{path}", f"b/{path}", n=0, lineterm=""))
+    return f"diff --git a/{path} b/{path}\nindex 1111111..2222222 100644\n{body}\n"
+
+def _expected(old, new, ls, le):
+    # new position of every old line kept by the diff; the range maps only if it stays contiguous
+    kept = {}
+    for tag, i1, i2, j1, _ in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == "equal":
+            kept.update((i + 1, j1 + i - i1 + 1) for i in range(i1, i2))
+    if any(line not in kept for line in range(ls, le + 1)) or kept[le] - kept[ls] != le - ls:
+        return None
+    return kept[ls], kept[le]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_map_range_follows_kept_lines(seed):
+    rnd = random.Random(seed)
+    old = [f"line {i}" for i in range(1, rnd.randrange(20, 120))]
+    new = _edit(rnd, old)
+    diff = parse_zero_context_diff(_zero_context_diff("pkg/m.py", old, new))["pkg/m.py"]
+    for _ in range(50):
+        ls = rnd.randrange(1, len(old) + 1)
+        le = min(len(old), ls + rnd.randrange(0, 15))
+        assert diff.map_range(ls, le) == _expected(old, new, ls, le)
+
+def test_parse_renames_deletions_and_short_hunks():
+    diff_text = (
+        "diff --git a/pkg/old.py b/pkg/new.py\n"
+        "similarity index 90%\n"
+        "rename from pkg/old.py\n"
+        "rename to pkg/new.py\n"
+        "@@ -3 +3 @@\n"
+        "-a\n"
+        "+b\n"
+        "diff --git a/pkg/gone.py b/pkg/gone.py\n"
+        "deleted file mode 100644\n"
+        "@@ -1,2 +0,0 @@\n"
+        "-x\n"
+        "-y\n"
+        "diff --git a/pkg/moved.py b/lib/moved.py\n"
+        "similarity index 100%\n"
+        "rename from pkg/moved.py\n"
+        "rename to lib/moved.py\n")
+    files = parse_zero_context_diff(diff_text)
+    assert set(files) == {"pkg/old.py", "pkg/gone.py", "pkg/moved.py"}
+    assert files["pkg/old.py"].new_path == "pkg/new.py"
+    assert files["pkg/old.py"].hunks == [(3, 1, 3, 1)]
+    assert files["pkg/gone.py"].new_path is None
+    assert files["pkg/gone.py"].map_range(5, 9) is None
+
+    remap = CommitRemap(diff_text, "/ws/repo/", follow_lines=True)
+    assert remap.map_fragment("/ws/repo/pkg/old.py", 5, 8) == ("/ws/repo/pkg/new.py", 5, 8)
+    assert remap.map_fragment("/ws/repo/pkg/old.py", 1, 3) is None
+    assert remap.map_fragment("/ws/repo/pkg/moved.py", 1, 3) == ("/ws/repo/lib/moved.py", 1, 3)
+    assert remap.map_fragment("/ws/repo/pkg/other.py", 1, 3) == ("/ws/repo/pkg/other.py", 1, 3)
+    assert remap.map_path("/ws/repo/pkg/gone.py") is None
+    # without follow_lines only files without hunks keep their fragments
+    strict = CommitRemap.from_rows(remap.rows(), "/ws/repo", follow_lines=False)
+    assert strict.map_fragment("/ws/repo/pkg/old.py", 5, 8) is None
+    assert strict.map_fragment("/ws/repo/pkg/moved.py", 1, 3) == ("/ws/repo/lib/moved.py", 1, 3)
+
+def test_quoted_paths_are_rejected():
+    with pytest.raises(ValueError):
+        parse_zero_context_diff('diff --git "a/p q.py" "b/p r.py"\nrename from "p q.py"\nrename to "p r.py"\n')
@@ -0,0 +1,50 @@
+import random
+import pytest
+from omniccg.CloneClass import CloneClass
+from omniccg.CloneFragment import CloneFragment
+from omniccg.CloneVersion import CloneVersion
+from omniccg.core import GetPattern
+from omniccg.pattern_operations import GetPatterns
+
+def _clone_class(rnd, hash_pool, max_size=6):
+    cc = CloneClass()
+    for _ in range(rnd.randrange(0, max_size + 1)):
+        ls = rnd.randrange(1, 500)
+        cc.fragments.append(CloneFragment(f"/ws/repo/m{rnd.randrange(4)}.py", ls, ls + rnd.randrange(0, 40),
+                                          hash=rnd.choice(hash_pool)))
+    return cc
+
+def _random_pairs(seed, n_pairs=200):
+    rnd = random.Random(seed)
+    # a small pool makes repeated hashes within and across classes common; the extremes
+    # of the unsigned 64-bit range exercise the uint64 conversion
+    hash_pool = [0, 1, 2**63, 2**64 - 1] + [rnd.getrandbits(64) for _ in range(rnd.randrange(1, 12))]
+    pairs = []
+    for _ in range(n_pairs):
+        v1 = _clone_class(rnd, hash_pool)
+        if rnd.random() < 0.3:
+            # same fragments, some rehashed: the common "class evolved in place" case
+            v2 = CloneClass()
+            v2.fragments = [CloneFragment(f.file, f.ls, f.le, hash=rnd.choice(hash_pool) if rnd.random() < 0.3 else f.hash)
+                            for f in v1.fragments]
+        else:
+            v2 = _clone_class(rnd, hash_pool)
+        pairs.append((v1, v2))
+    return pairs
+
+@pytest.mark.parametrize("seed", range(20))
+def test_get_patterns_matches_get_pattern(seed):
+    pairs = _random_pairs(seed)
+    expected = [GetPattern(CloneVersion(v1, "a", 1, 1, "human"), CloneVersion(v2, "b", 2, 2, "human"))
+                for v1, v2 in pairs]
+    assert GetPatterns(pairs) == [tuple(row) for row in expected]
+
+def test_get_patterns_empty_classes():
+    empty = CloneClass()
+    one = CloneClass()
+    one.fragments = [CloneFragment("/ws/repo/a.py", 1, 5, hash=7)]
+    pairs = [(empty, empty), (empty, one), (one, empty)]
+    expected = [GetPattern(CloneVersion(v1, "a", 1, 1, "human"), CloneVersion(v2, "b", 2, 2, "human"))
+                for v1, v2 in pairs]
+    assert GetPatterns(pairs) == [tuple(row) for row in expected]
+    assert GetPatterns([]) == []
@@ -0,0 +1,127 @@
+import random
+import pytest
+import omniccg.core as core
+from omniccg.CloneClass import CloneClass
+from omniccg.CloneFragment import CloneFragment
+from omniccg.detection_archive import DetectionArchive
+from omniccg.lineage_store import RetiredLineageStore
+from omniccg.replay import archived_settings, replay_genealogy, replay_settings
+
+REPO_DIR = "/ws/cloned_repositories/owner_repo/repo"
+
+def _hash_pool(rnd):
+    pool = []
+    for _ in range(12):
+        seed = rnd.getrandbits(64)
+        pool.append(seed)
+        for _ in range(3):
+            flipped = seed
+            for bit in rnd.sample(range(64), rnd.randrange(1, 12)):
+                flipped ^= 1 << bit
+            pool.append(flipped)
+    return pool
+
+def _history(rnd, n_commits=20):
+    """Per commit: (clone classes as (file, ls, hash) rows, git diff -U0 from the previous commit or None)."""
+    hash_pool = _hash_pool(rnd)
+    classes, history = [], []
+    for _ in range(n_commits):
+        evolved = []
+        for rows in classes:
+            roll = rnd.random()
+            if roll < 0.15:
+                continue  # the class dies, so its lineage goes stale and retires
+            rows = list(rows)
+            if roll < 0.3:
+                rows.append((rnd.randrange(6), rnd.randrange(1, 120), rnd.choice(hash_pool)))
+            elif roll < 0.45:
+                k = rnd.randrange(len(rows))
+                rows[k] = (rows[k][0], rows[k][1], rnd.choice(hash_pool))
+            elif roll < 0.55:
+                shift = rnd.randrange(1, 5)
+                rows = [(fi, ls + shift, h) for fi, ls, h in rows]
+            evolved.append(rows)
+        for _ in range(rnd.randrange(0, 3)):
+            evolved.append([(rnd.randrange(6), rnd.randrange(1, 120), rnd.choice(hash_pool))
+                            for _ in range(rnd.randrange(2, 4))])
+        classes = evolved
+        history.append((classes, _diff(rnd)))
+    return history
+
+def _diff(rnd):
+    if rnd.random() < 0.1:
+        return None
+    lines = []
+    for fi in rnd.sample(range(6), rnd.randrange(0, 3)):
+        if rnd.random() < 0.3:
+            lines += [f"diff --git a/pkg/m{fi}.py b/pkg/m{fi + 6}.py", "similarity index 100%",
+                      f"rename from pkg/m{fi}.py", f"rename to pkg/m{fi + 6}.py"]
+            continue
+        lines.append(f"diff --git a/pkg/m{fi}.py b/pkg/m{fi}.py")
+        pos = 0
+        for _ in range(rnd.randrange(1, 3)):
+            pos += rnd.randrange(1, 60)
+            lines.append(f"@@ -{pos},{rnd.randrange(0, 3)} +{pos},{rnd.randrange(0, 6)} @@")
+    return "\n".join(lines) + "\n"
+
+def _run(monkeypatch, tmp_path, history, settings, archive_file=None):
+    """Fold the history like a batch run (remap, then fold each commit); returns its lineage XML."""
+    diffs = iter(diff for _, diff in history[1:])
+
+    def git_diff(previous, commit, ctx):
+        diff = next(diffs)
+        if diff is None:
+            raise RuntimeError("no usable diff")
+        return diff
+
+    monkeypatch.setattr(core, "GitDiffZeroContext", git_diff)
+    paths = core.Paths()
+    paths.repo_dir = REPO_DIR
+    ctx = core.Context(git_url="owner/repo", paths=paths, state=core.State(), settings=settings)
+    if archive_file is not None:
+        ctx.archive = DetectionArchive(archive_file)
+        ctx.archive.describe(settings, REPO_DIR)
+    if settings.retire_after_commits is not None:
+        ctx.state.retired = RetiredLineageStore(str(tmp_path / f"retired_{id(ctx)}.sqlite"))
+    for nr, (classes, _) in enumerate(history, 1):
+        core.RemapToCommit(ctx, "java", f"sha{nr}", nr)
+        pcloneclasses = []
+        for rows in classes:
+            cc = CloneClass()
+            cc.fragments = [CloneFragment(f"{REPO_DIR}/pkg/m{fi}.py", ls, ls + 4, hash=h) for fi, ls, h in rows]
+            pcloneclasses.append(cc)
+        core.RunGenealogyAnalysis(ctx, nr, f"sha{nr}", nr, "human" if nr % 2 else "agent", nr, pcloneclasses)
+    if ctx.archive is not None:
+        ctx.archive.close()
+    xml = "".join(core._iter_lineage_xml(ctx.state.genealogy_data, ctx.state.retired))
+    if ctx.state.retired is not None:
+        ctx.state.retired.close()
+    return xml
+
+def _replayed_xml(ctx):
+    return "".join(lineage.toXML() for lineage in ctx.state.genealogy_data)
+
+SETTINGS = [
+    core.Settings(),
+    core.Settings(retire_after_commits=2),
+    core.Settings(retire_after_commits=3, lineage_match_rule="class"),
+]
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("settings", SETTINGS)
+def test_replay_rebuilds_the_archived_run(monkeypatch, tmp_path, seed, settings):
+    history = _history(random.Random(seed))
+    archive_file = str(tmp_path / "java_owner_repo.sqlite")
+    expected = _run(monkeypatch, tmp_path, history, settings, archive_file)
+    assert archived_settings(archive_file).retire_after_commits == settings.retire_after_commits
+    assert _replayed_xml(replay_genealogy(archive_file)) == expected
+
+@pytest.mark.parametrize("seed", range(6))
+def test_replay_with_other_matching_parameters(monkeypatch, tmp_path, seed):
+    history = _history(random.Random(seed))
+    archive_file = str(tmp_path / "java_owner_repo.sqlite")
+    _run(monkeypatch, tmp_path, history, SETTINGS[1], archive_file)
+    overrides = dict(match_threshold=0.85, lineage_match_rule="class")
+    expected = _run(monkeypatch, tmp_path, history, core.Settings(retire_after_commits=2, **overrides))
+    replayed = replay_genealogy(archive_file, replay_settings(archived_settings(archive_file), **overrides))
+    assert _replayed_xml(replayed) == expected
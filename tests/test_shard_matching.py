@@ -0,0 +1,58 @@
+import random
+import pytest
+from omniccg.CloneClass import CloneClass
+from omniccg.CloneFragment import CloneFragment
+from omniccg.CloneVersion import CloneVersion
+from omniccg.Lineage import Lineage
+from omniccg.shard_matching import ShardedMatcher
+
+FILES = [f"/ws/repo/pkg/m{i}.py" for i in range(6)]
+
+def _fragment(rnd, hash_pool):
+    ls = rnd.randrange(1, 60)
+    return CloneFragment(rnd.choice(FILES), ls, ls + rnd.randrange(0, 10), hash=rnd.choice(hash_pool))
+
+def _clone_class(rnd, hash_pool):
+    cc = CloneClass()
+    cc.fragments = [_fragment(rnd, hash_pool) for _ in range(rnd.randrange(0, 5))]
+    return cc
+
+def _hash_pool(rnd):
+    # near-duplicates of a few seeds, so SimHash matches within the threshold occur
+    pool = []
+    for _ in range(8):
+        seed = rnd.getrandbits(64)
+        pool.append(seed)
+        for _ in range(3):
+            flipped = seed
+            for bit in rnd.sample(range(64), rnd.randrange(1, 12)):
+                flipped ^= 1 << bit
+            pool.append(flipped)
+    return pool
+
+@pytest.fixture(scope="module")
+def matcher():
+    matcher = ShardedMatcher(workers=3)
+    yield matcher
+    matcher.close()
+
+def test_pool_is_started_lazily():
+    matcher = ShardedMatcher(workers=2)
+    assert matcher.executor is None
+    matcher.close()
+    assert matcher.executor is None
+
+@pytest.mark.parametrize("seed", range(10))
+def test_sharded_candidates_match_serial_scan(matcher, seed):
+    rnd = random.Random(seed)
+    hash_pool = _hash_pool(rnd)
+    lineages = []
+    for lineage_id in range(rnd.randrange(1, 40)):
+        lineage = Lineage(lineage_id)
+        lineage.versions.append(CloneVersion(_clone_class(rnd, hash_pool), "a", 1))
+        lineages.append(lineage)
+    classes = [_clone_class(rnd, hash_pool) for _ in range(rnd.randrange(0, 30))]
+
+    expected = [[lineage.id for lineage in lineages if lineage.matches(cc, 0.90)] for cc in classes]
+    assert matcher.candidates(lineages, classes) == expected
+    assert any(expected), "the generated data should produce some matches"
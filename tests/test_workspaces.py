@@ -0,0 +1,62 @@
+import os
+import pytest
+from omniccg.workspaces import LAST_USED_FILE, WorkspaceManager
+
+MIB = 1024 * 1024
+
+def _workspace(root, name, last_used):
+    """A workspace with a 1 MiB clone and a retained checkpoint, last used at `last_used`."""
+    ws = root / name
+    (ws / "repo").mkdir(parents=True)
+    (ws / "repo" / "pack").write_bytes(os.urandom(MIB))
+    (ws / "genealogy_state.pickle").write_bytes(b"state")
+    (ws / LAST_USED_FILE).touch()
+    os.utime(ws / LAST_USED_FILE, (last_used, last_used))
+
+@pytest.fixture
+def root(tmp_path):
+    for k, name in enumerate(["oldest", "older", "newest"]):
+        _workspace(tmp_path, name, 1_000_000 + k * 1000)
+    return tmp_path
+
+def test_least_recently_used_are_evicted_first(root):
+    manager = WorkspaceManager(str(root), budget_bytes=int(1.5 * MIB))
+    assert manager.enforce_budget() == ["oldest", "older"]
+    assert not (root / "oldest" / "repo").exists()
+    assert (root / "oldest" / "genealogy_state.pickle").read_bytes() == b"state"
+    assert (root / "newest" / "repo" / "pack").exists()
+
+def test_pinned_workspaces_are_skipped(root):
+    # another run (here a second manager, i.e. another lock file descriptor) holds "oldest"
+    other = WorkspaceManager(str(root))
+    other.pin("oldest")
+    os.utime(root / "oldest" / LAST_USED_FILE, (1_000_000, 1_000_000))
+    manager = WorkspaceManager(str(root), budget_bytes=int(1.5 * MIB))
+    assert manager.is_pinned("oldest") and not manager.is_pinned("older")
+    assert manager.enforce_budget() == ["older", "newest"]
+    assert (root / "oldest" / "repo" / "pack").exists()
+
+    other.unpin("oldest")
+    assert not manager.is_pinned("oldest")
+    assert WorkspaceManager(str(root), budget_bytes=0).enforce_budget() == ["oldest"]
+
+def test_own_pins_are_kept(root):
+    manager = WorkspaceManager(str(root), budget_bytes=0)
+    manager.pin("older")
+    assert [row.name for row in manager.usage() if row.pinned] == ["older"]
+    assert manager.enforce_budget() == ["oldest", "newest"]
+    assert (root / "older" / "repo" / "pack").exists()
+    manager.unpin("older")
+    assert manager.enforce_budget() == ["older"]
+
+def test_workspace_taken_after_measuring_is_skipped(root, monkeypatch):
+    manager = WorkspaceManager(str(root), budget_bytes=0)
+    measured = manager.usage()
+    assert not any(row.pinned for row in measured)
+    # a run takes "oldest" between the measurement and the eviction
+    other = WorkspaceManager(str(root))
+    other.pin("oldest")
+    monkeypatch.setattr(manager, "usage", lambda: measured)
+    assert manager.enforce_budget() == ["older", "newest"]
+    assert (root / "oldest" / "repo" / "pack").exists()
+    other.unpin("oldest")